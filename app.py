@@ -1,11 +1,30 @@
-from flask import abort, Flask, make_response, request
+import base64
+import bisect
+import click
+from concurrent.futures import ProcessPoolExecutor
+from content_encoding import available_codings, compress, compress_stream, negotiate
+from datetime import datetime, timezone
+from flask import abort, Flask, g as flask_g, make_response, request, Response, stream_with_context
 from flask_cors import CORS
-import json
+from graph_cache import GraphCache, GraphCacheBusy
+import hashlib
+from instrumentation import current_request, end_request, Metrics, SlowRequestProfiler, start_request, timed, timed_chunks
+from response_cache import MemoryBackend, ResponseCache, SQLiteBackend
+from search_index import SearchIndex
+from serializers import check_predicates, Descriptions, serialize, serialize_stream
+from snapshot_store import INDIVIDUALS, SnapshotStore
+from sync_scheduler import SyncScheduler
 import math
-from rdflib import Graph, URIRef, Literal, Namespace
-from rdflib.namespace import RDF, RDFS, DCTERMS, DCAT, SKOS, XSD
+import multiprocessing
+import os
+from rdflib import BNode, Graph, URIRef, Literal, Namespace
+from rdflib.namespace import RDF, RDFS, DCTERMS, DCAT, FOAF, SKOS, XSD
 import re
-import requests
+from rendered_cache import RenderedCache
+import threading
+from upstream import UpstreamClient
+from urllib.parse import urlencode
+from werkzeug.http import HTTP_STATUS_CODES, parse_date
 
 app = Flask(__name__)
 CORS(app)
@@ -15,6 +34,7 @@ HYDRA = Namespace("http://www.w3.org/ns/hydra/core#")
 ISOTHES = Namespace("http://purl.org/iso25964/skos-thes#")
 MOD = Namespace("https://w3id.org/mod#")
 SKOSXL = Namespace("http://www.w3.org/2008/05/skos-xl#")
+SPDX = Namespace("http://spdx.org/rdf/terms#")
 
 JSONLD_CONTEXT = {
     "dcterms": str(DCTERMS),
@@ -35,7 +55,243 @@ FORMATS = [
     { "format": "application/json+ld", "uri": "http://www.w3.org/ns/formats/JSON-LD" }
 ]
 
-API_BASE_URL = "https://api.finto.fi/rest/v1/"
+API_BASE_URL = os.environ.get("API_BASE_URL", "https://api.finto.fi/rest/v1/")
+
+UPSTREAM_POOL_SIZE = int(os.environ.get("UPSTREAM_POOL_SIZE", 20))
+UPSTREAM_CONCURRENCY = int(os.environ.get("UPSTREAM_CONCURRENCY", 8))
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", 5))
+UPSTREAM_READ_TIMEOUT = float(os.environ.get("UPSTREAM_READ_TIMEOUT", 120))
+UPSTREAM_RETRIES = int(os.environ.get("UPSTREAM_RETRIES", 3))
+UPSTREAM_BACKOFF = float(os.environ.get("UPSTREAM_BACKOFF", 0.5))
+
+RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", "response_cache.sqlite3")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 10000))
+RESPONSE_CACHE_STALE = int(os.environ.get("RESPONSE_CACHE_STALE", 86400))
+RESPONSE_CACHE_NEGATIVE_TTL = int(os.environ.get("RESPONSE_CACHE_NEGATIVE_TTL", 60))
+
+# Cached upstream calls as (method, path pattern, TTL, stale-while-revalidate window)
+RESPONSE_CACHE_POLICIES = [
+    ("GET", r"vocabularies/", int(os.environ.get("RESPONSE_CACHE_TTL_VOCABULARIES", 300)), RESPONSE_CACHE_STALE),
+    # Search results are never served stale, and the vocabulary pattern below would match them as well
+    ("GET", r"search/", int(os.environ.get("RESPONSE_CACHE_TTL_SEARCH", 60)), 0),
+    ("GET", r"[^/]+/", int(os.environ.get("RESPONSE_CACHE_TTL_VOCABULARY", 300)), RESPONSE_CACHE_STALE),
+    ("GET", r"[^/]+/types", int(os.environ.get("RESPONSE_CACHE_TTL_TYPES", 3600)), RESPONSE_CACHE_STALE),
+    ("GET", r"[^/]+/groups", int(os.environ.get("RESPONSE_CACHE_TTL_GROUPS", 3600)), RESPONSE_CACHE_STALE),
+    ("HEAD", r"[^/]+/data", int(os.environ.get("RESPONSE_CACHE_TTL_DISTRIBUTIONS", 3600)), RESPONSE_CACHE_STALE)
+]
+
+# Cache-Control of successful responses as (route pattern, header value), the first matching policy applies
+CACHE_CONTROL_POLICIES = [
+    (r"/metrics", "no-store"),
+    (r"/admin/.*", "no-store"),
+    (r"/health/.*", "no-store"),
+    (r"/search/.*", os.environ.get("CACHE_CONTROL_SEARCH", "public, max-age=300")),
+    (r"/artefacts/<artefactID>/resources.*", os.environ.get("CACHE_CONTROL_RESOURCES", "public, max-age=3600")),
+    (r".*", os.environ.get("CACHE_CONTROL_DEFAULT", "public, max-age=300"))
+]
+
+RENDERED_CACHE_MAX_BYTES = int(os.environ.get("RENDERED_CACHE_MAX_BYTES", 256 * 1024 ** 2))
+RENDERED_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("RENDERED_CACHE_MAX_ENTRY_BYTES", 16 * 1024 ** 2))
+RENDERED_CACHE_WARM_PAGES = int(os.environ.get("RENDERED_CACHE_WARM_PAGES", 0))
+
+# WSGI environ key that marks the requests the app makes to itself to warm the rendered cache
+INTERNAL_REQUEST = "mod_api.internal"
+
+# Headers stored with rendered responses
+RENDERED_HEADERS = ("Content-Type",)
+
+# Content codings offered to clients by preference, those whose modules are not installed are left out
+COMPRESSION_CODINGS = available_codings(os.environ.get("COMPRESSION_CODINGS", "zstd,br,gzip").split(","))
+COMPRESSION_LEVELS = {
+    "gzip": int(os.environ.get("COMPRESSION_LEVEL_GZIP", 6)),
+    "br": int(os.environ.get("COMPRESSION_LEVEL_BR", 5)),
+    "zstd": int(os.environ.get("COMPRESSION_LEVEL_ZSTD", 3))
+}
+
+# Media types of the responses that are compressed
+COMPRESSED_TYPES = ("application/json", "application/rdf+xml", "text/turtle", "application/n-triples", "application/x-ndjson", "text/plain")
+
+# Subjects described at a time by bulk exports
+EXPORT_BATCH_SIZE = 1000
+
+# Query parameters that filter /artefacts/{id}/resources
+FACET_PARAMS = ("type", "inScheme", "lang")
+
+RESOURCE_BATCH_MAX_URIS = int(os.environ.get("RESOURCE_BATCH_MAX_URIS", 1000))
+
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", "snapshots")
+SYNC_INTERVAL = int(os.environ.get("SYNC_INTERVAL", 0))
+SYNC_CONCURRENCY = int(os.environ.get("SYNC_CONCURRENCY", 2))
+SYNC_STATUS_PATH = os.environ.get("SYNC_STATUS_PATH", os.path.join(SNAPSHOT_DIR, "sync_status.json"))
+SEARCH_INDEX_PATH = os.environ.get("SEARCH_INDEX_PATH", "search_index.sqlite3")
+
+GRAPH_CACHE_MAX_BYTES = int(os.environ.get("GRAPH_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+GRAPH_CACHE_TTL = int(os.environ.get("GRAPH_CACHE_TTL", 3600))
+GRAPH_CACHE_PARSE_PROCESSES = int(os.environ.get("GRAPH_CACHE_PARSE_PROCESSES", 0))
+GRAPH_CACHE_DIR = os.environ.get("GRAPH_CACHE_DIR")
+GRAPH_CACHE_MAX_LOADS = int(os.environ.get("GRAPH_CACHE_MAX_LOADS", 2))
+GRAPH_CACHE_LOAD_QUEUE = int(os.environ.get("GRAPH_CACHE_LOAD_QUEUE", 16))
+GRAPH_CACHE_RETRY_AFTER = int(os.environ.get("GRAPH_CACHE_RETRY_AFTER", 30))
+
+SLOW_REQUEST_THRESHOLD = float(os.environ.get("SLOW_REQUEST_THRESHOLD", 0))
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0.01))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILER = os.environ.get("PROFILER", "cprofile")
+
+upstream_client = UpstreamClient(API_BASE_URL, UPSTREAM_POOL_SIZE, UPSTREAM_CONCURRENCY, UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT, UPSTREAM_RETRIES, UPSTREAM_BACKOFF)
+if RESPONSE_CACHE_BACKEND == "sqlite":
+    response_cache_backend = SQLiteBackend(RESPONSE_CACHE_PATH, RESPONSE_CACHE_MAX_ENTRIES)
+else:
+    response_cache_backend = MemoryBackend(RESPONSE_CACHE_MAX_ENTRIES)
+upstream = ResponseCache(upstream_client, response_cache_backend, RESPONSE_CACHE_POLICIES, RESPONSE_CACHE_NEGATIVE_TTL)
+if GRAPH_CACHE_PARSE_PROCESSES > 0:
+    # Forking a process with running threads is unsafe
+    parse_pool = ProcessPoolExecutor(GRAPH_CACHE_PARSE_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+else:
+    parse_pool = None
+graph_cache = GraphCache(upstream_client, GRAPH_CACHE_MAX_BYTES, GRAPH_CACHE_TTL, parse_pool, GRAPH_CACHE_DIR, GRAPH_CACHE_MAX_LOADS, GRAPH_CACHE_LOAD_QUEUE)
+snapshot_store = SnapshotStore(SNAPSHOT_DIR, lambda artefactID, snapshot: schedule_warm(artefactID))
+rendered_cache = RenderedCache(RENDERED_CACHE_MAX_BYTES, RENDERED_CACHE_MAX_ENTRY_BYTES)
+search_index = SearchIndex(SEARCH_INDEX_PATH)
+sync_scheduler = SyncScheduler(lambda: list_artefacts(upstream_client), lambda artefactID: sync_artefact(artefactID, parse_pool), lambda artefactID: remove_artefact(artefactID), SYNC_INTERVAL, SYNC_CONCURRENCY, SYNC_STATUS_PATH)
+metrics = Metrics()
+profiler = SlowRequestProfiler(PROFILE_DIR, SLOW_REQUEST_THRESHOLD, PROFILE_SAMPLE_RATE, PROFILER)
+
+
+@app.before_request
+def start_sync_scheduler():
+    # Started by the first request, so that CLI commands do not start it
+    if not request.environ.get(INTERNAL_REQUEST):
+        sync_scheduler.start()
+
+
+@app.before_request
+def start_timing():
+    # Requests the app makes to itself are not timed, profiled or counted in the metrics
+    if request.environ.get(INTERNAL_REQUEST):
+        return
+    timer = start_request()
+    timer.profile = profiler.start()
+
+
+@app.after_request
+def add_server_timing(response):
+    timer = current_request()
+    if timer is None:
+        return response
+    end_request()
+
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    method = request.method
+    status = response.status_code
+    response.headers["Server-Timing"] = timer.server_timing()
+
+    def finish(size):
+        finish_request(timer, route, method, status, size)
+
+    # Streamed bodies are serialized after the headers have been sent
+    if response.is_streamed:
+        response.response = timed_chunks(response.response, timer, "serialize", finish)
+    else:
+        finish(response.content_length)
+    return response
+
+
+@app.after_request
+def add_cache_headers(response):
+    if response.status_code not in (200, 304) or request.method not in ("GET", "HEAD"):
+        return response
+
+    rule = request.url_rule.rule if request.url_rule else ""
+    for pattern, cache_control in CACHE_CONTROL_POLICIES:
+        if re.fullmatch(pattern, rule):
+            if cache_control:
+                response.headers["Cache-Control"] = cache_control
+            break
+
+    if flask_g.get("etag"):
+        response.set_etag(flask_g.etag)
+    if flask_g.get("last_modified"):
+        response.headers["Last-Modified"] = flask_g.last_modified
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    if response.status_code == 304 and flask_g.get("etag"):
+        response.vary.add("Accept-Encoding")
+    if response.status_code != 200 or response.mimetype not in COMPRESSED_TYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+    if "Content-Encoding" in response.headers:
+        return response
+
+    coding = flask_g.coding if "coding" in flask_g else negotiate(request.headers.get("Accept-Encoding"), COMPRESSION_CODINGS)
+    if coding is None:
+        return response
+
+    # Hooks run in reverse order of registration, so rendered responses have been stored uncompressed
+    if response.is_streamed:
+        response.response = compress_stream(response.response, coding, COMPRESSION_LEVELS[coding])
+    else:
+        with timed("compress"):
+            response.set_data(compress(response.get_data(), coding, COMPRESSION_LEVELS[coding]))
+    response.headers["Content-Encoding"] = coding
+    return response
+
+
+@app.after_request
+def store_rendered_response(response):
+    key = flask_g.get("rendered_key")
+    if not key or response.status_code != 200 or flask_g.get("rendered"):
+        return response
+
+    headers = {k: v for k, v in response.headers.items() if k in RENDERED_HEADERS}
+    if response.is_streamed:
+        response.response = rendered_cache.capture(key, response.response, headers)
+    else:
+        rendered_cache.set(key, response.get_data(), headers)
+    return response
+
+
+@app.teardown_request
+def end_timing(exception):
+    # Requests that failed with an unhandled exception never reached after_request
+    timer = current_request()
+    if timer is not None:
+        end_request()
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        finish_request(timer, route, request.method, 500, None)
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    snapshots = {}
+    for artefactID in snapshot_store.artefact_ids():
+        try:
+            snapshots[artefactID] = os.path.getsize(snapshot_store.path(artefactID))
+        except OSError:
+            pass
+
+    body = metrics.render(upstream_client.metrics(), upstream.stats(), graph_cache.stats(), rendered_cache.stats(), snapshots)
+    return Response(body, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.route("/admin/sync", methods=["GET"])
+def admin_sync():
+    return sync_scheduler.status()
+
+
+@app.route("/health/live", methods=["GET"])
+def health_live():
+    return { "status": "ok" }
+
+
+@app.route("/health/ready", methods=["GET"])
+def health_ready():
+    # Worker processes of serve.py are only started after the warm-up, which answers 503 until then
+    return { "status": "ready", "snapshots": len(snapshot_store.artefact_ids()) }
 
 
 @app.route("/artefacts", methods=["GET"])
@@ -45,32 +301,25 @@ def artefacts():
     page = params["page"]
     return_format = params["format"]
 
-    g = Graph()
-
-    ret = requests.get(API_BASE_URL + "vocabularies/", params={ "lang": "en" }).json()
-
-    # Add vocabulary artefacts
-    start_index = (int(page) - 1) * int(pagesize)
-    end_index = start_index + int(pagesize)
-    vocabularies = sorted(ret["vocabularies"], key=lambda d: d["id"])[start_index:end_index]
-    for voc in vocabularies:
-        voc_details = requests.get(API_BASE_URL + voc["id"] + "/", params={ "lang": "en" }).json()
+    g = Descriptions()
 
-        uri = URIRef(request.url_root + "artefacts/" + voc_details["id"])
+    with timed("upstream"):
+        ret = upstream.get("vocabularies/", params={ "lang": "en" }).json()
 
-        g.add((uri, RDF.type, MOD.SemanticArtefact))
-        g.add((uri, DCTERMS.title, Literal(voc_details["title"], lang="en")))
-        g.add((uri, DCTERMS.identifier, Literal(voc_details["id"], lang="en")))
-        g.add((uri, DCTERMS.type, MOD.SemanticArtefact))
-        g.add((uri, DCTERMS.accessRights, Literal("public", lang="en")))
-        g.add((uri, DCAT.landingPage, URIRef("https://finto.fi/" + voc_details["id"])))
+        # Add vocabulary artefacts
+        vocabularies = sorted(ret["vocabularies"], key=lambda d: d["id"])
+        keys = [voc["id"] for voc in vocabularies]
+        start_index, end_index = page_window(params, lambda after: bisect.bisect_right(keys, after))
+        vocabulary_details = upstream.map(lambda voc: upstream.get(voc["id"] + "/", params={ "lang": "en" }).json(), vocabularies[start_index:end_index])
+    serve_cached([ret] + vocabulary_details)
 
-        for lang in voc_details["languages"]:
-            g.add((uri, DCTERMS.language, Literal(lang)))
+    for voc_details in vocabulary_details:
+        add_artefact(g, voc_details)
 
-    add_hydra_collection_view(g, "artefacts", MOD.SemanticArtefact, len(ret["vocabularies"]), page, pagesize)
+    add_hydra_collection_view(g, "artefacts", MOD.SemanticArtefact, len(ret["vocabularies"]), page, pagesize, next_cursor(keys, end_index))
 
-    response = make_response(g.serialize(format=return_format[0], context=JSONLD_CONTEXT))
+    with timed("serialize"):
+        response = make_response(serialize(g, return_format[0], JSONLD_CONTEXT))
     response.headers["Content-Type"] = return_format[1]
     return response
 
@@ -80,27 +329,18 @@ def artefact(artefactID):
     params = get_common_params()
     return_format = params["format"]
 
-    g = Graph()
+    g = Descriptions()
 
-    ret = requests.get(API_BASE_URL + artefactID + "/", params={ "lang": "en" })
+    with timed("upstream"):
+        ret = upstream.get(artefactID + "/", params={ "lang": "en" })
     if ret.status_code == 404:
         abort(404, description="Artefact not found")
+    serve_cached([ret.content])
 
-    voc_details = ret.json()
-
-    uri = URIRef(request.url_root + "artefacts/" + voc_details["id"])
-
-    g.add((uri, RDF.type, MOD.SemanticArtefact))
-    g.add((uri, DCTERMS.title, Literal(voc_details["title"], lang="en")))
-    g.add((uri, DCTERMS.identifier, Literal(voc_details["id"], lang="en")))
-    g.add((uri, DCTERMS.type, MOD.SemanticArtefact))
-    g.add((uri, DCTERMS.accessRights, Literal("public", lang="en")))
-    g.add((uri, DCAT.landingPage, URIRef("https://finto.fi/" + voc_details["id"])))
-
-    for lang in voc_details["languages"]:
-        g.add((uri, DCTERMS.language, Literal(lang)))
+    add_artefact(g, ret.json())
 
-    response = make_response(g.serialize(format=return_format[0], context=JSONLD_CONTEXT))
+    with timed("serialize"):
+        response = make_response(serialize(g, return_format[0], JSONLD_CONTEXT))
     response.headers["Content-Type"] = return_format[1]
     return response
 
@@ -112,27 +352,25 @@ def artefact_distributions(artefactID):
     page = params["page"]
     return_format = params["format"]
     
-    g = Graph()
+    g = Descriptions()
 
     start_index = (int(page) - 1) * int(pagesize)
     end_index = start_index + int(pagesize)
-    for i, f in enumerate(FORMATS[start_index:end_index]):
-        data = requests.head(API_BASE_URL + artefactID + "/data", params={"format": f["format"]})
+    formats = FORMATS[start_index:end_index]
+    with timed("upstream"):
+        heads = upstream.map(lambda f: upstream.head(artefactID + "/data", params={"format": f["format"]}), formats)
+    serve_cached([(data.status_code, data.headers.get("location")) for data in heads])
+    for i, (f, data) in enumerate(zip(formats, heads)):
         if data.status_code == 404:
             return abort(404, description="Artefact not found")
 
         if data.status_code == 302:
-            uri = URIRef(request.url_root + "artefacts/" + artefactID + "/distributions/" + str(i + 1))
-
-            g.add((uri, RDF.type, MOD.semanticArtefactDistribution))
-            g.add((uri, DCAT.downloadURL, URIRef(data.headers["location"])))
-            g.add((uri, DCAT.accessURL, URIRef("https://finto.fi/" + artefactID)))
-            g.add((uri, DCTERMS.accessRights, Literal("public", lang="en")))
-            g.add((uri, MOD.hasSyntax, URIRef(f["uri"])))
+            add_distribution(g, artefactID, str(start_index + i + 1), data.headers["location"])
 
     add_hydra_collection_view(g, "artefacts/" + artefactID + "/distributions", MOD.semanticArtefactDistribution, len(set(g.subjects())), page, pagesize)
 
-    response = make_response(g.serialize(format=return_format[0], context=JSONLD_CONTEXT))
+    with timed("serialize"):
+        response = make_response(serialize(g, return_format[0], JSONLD_CONTEXT))
     response.headers["Content-Type"] = return_format[1]
     return response
 
@@ -142,86 +380,97 @@ def artefact_distribution(artefactID, distributionID):
     params = get_common_params()
     return_format = params["format"]
 
-    g = Graph()
+    g = Descriptions()
 
     if (not distributionID.isdigit() or int(distributionID) < 1 or int(distributionID) > len(FORMATS)):
         abort(404, description="Distribution not found")
 
     f = FORMATS[int(distributionID) - 1]
-    data = requests.head(API_BASE_URL + artefactID + "/data", params={"format": f["format"]})
+    with timed("upstream"):
+        data = upstream.head(artefactID + "/data", params={"format": f["format"]})
     if data.status_code == 404:
         abort(404, description="Artefact not found")
+    serve_cached([data.status_code, data.headers.get("location")])
     
     if data.status_code == 302:
-        uri = URIRef(request.url_root + "artefacts/" + artefactID + "/distributions/" + distributionID)
+        add_distribution(g, artefactID, distributionID, data.headers["location"])
 
-        g.add((uri, RDF.type, MOD.semanticArtefactDistribution))
-        g.add((uri, DCAT.downloadURL, URIRef(data.headers["location"])))
-        g.add((uri, DCAT.accessURL, URIRef("https://finto.fi/" + artefactID)))
-        g.add((uri, DCTERMS.accessRights, Literal("public", lang="en")))
-        g.add((uri, MOD.hasSyntax, URIRef(f["uri"])))
-
-    response = make_response(g.serialize(format=return_format[0], context=JSONLD_CONTEXT))
+    with timed("serialize"):
+        response = make_response(serialize(g, return_format[0], JSONLD_CONTEXT))
     response.headers["Content-Type"] = return_format[1]
     return response
 
 
 @app.route("/artefacts/<artefactID>/distributions/latest", methods=["GET"])
 def artefact_distribution_latest(artefactID):
-    return "/artefacts/" + artefactID + "/distributions/latest"
+    snapshot = snapshot_store.get(artefactID)
+    if snapshot is None:
+        # Without a snapshot there is no hash or date of the dataset, only the Turtle distribution of SKOSMOS
+        return artefact_distribution(artefactID, "1")
+
+    params = get_common_params()
+    return_format = params["format"]
+
+    header = snapshot.header
+    serve_cached([header.get("hash")], header.get("last_modified"))
+
+    g = Descriptions()
+
+    # Snapshots are built from the Turtle distribution, the newest one synced
+    uri = add_distribution(g, artefactID, "1", header["download_url"])
+    g.add((uri, DCTERMS.modified, Literal(dataset_modified(header))))
+    g.add((uri, DCAT.byteSize, Literal(header["size"], datatype=XSD.nonNegativeInteger)))
+
+    checksum = BNode()
+    g.add((uri, SPDX.checksum, checksum))
+    g.add((checksum, RDF.type, SPDX.Checksum))
+    g.add((checksum, SPDX.algorithm, SPDX.checksumAlgorithm_sha256))
+    g.add((checksum, SPDX.checksumValue, Literal(header["hash"], datatype=XSD.hexBinary)))
+
+    with timed("serialize"):
+        response = make_response(serialize(g, return_format[0], dict(JSONLD_CONTEXT, spdx=str(SPDX))))
+    response.headers["Content-Type"] = return_format[1]
+    return response
 
 
 @app.route("/artefacts/<artefactID>/record", methods=["GET"])
 def artefact_record(artefactID):
-    return "/artefacts/" + artefactID + "/record"
+    return record(artefactID)
 
 
 @app.route("/artefacts/<artefactID>/resources", methods=["GET"])
 def artefact_resources(artefactID):
+    if "uri" in request.args:
+        return describe_resources(artefactID, request.args.getlist("uri"))
+
+    facets = get_facets()
+    if request.args.get("pagesize") == "all":
+        return export_collection(artefactID, None, facets)
+
     params = get_common_params()
     pagesize = params["pagesize"]
     page = params["page"]
     return_format = params["format"]
     
-    ret = requests.get(API_BASE_URL + artefactID + "/data", params={"lang": "en", "format": "text/turtle"})
-    if ret.status_code == 404:
-        abort(404, description="Artefact not found")
-
-    data = ret.text
+    index = get_resource_index(artefactID)
+    serve_cached([index.header.get("hash")], index.header.get("last_modified"))
 
-    g = Graph()
-    g.parse(data=data)
-
-    query = """
-        DESCRIBE ?s
-        WHERE {
-            ?s ?p ?o .
-        }
-        ORDER BY (str(?s))
-        LIMIT %s
-        OFFSET %s
-    """ % (pagesize, (int(page) - 1) * int(pagesize))
-    
-    query2 = """
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        SELECT (COUNT(?s) AS ?count)
-        WHERE {
-            ?s ?p ?o .
-        }
-    """
+    with timed("query"):
+        start_index, end_index = page_window(params, lambda after: index.seek(None, after, facets))
+        count = index.count(None, facets)
+        subjects = index.page(None, start_index, end_index, facets)
+        more = end_index < count
 
-    result_graph = Graph()
-    result_graph += g.query(query)
-    
-    count = 0
-    for x in g.query(query2):
-        count = int(x[0])
+    return stream_collection(index, subjects, "artefacts/" + artefactID + "/resources", count, page, pagesize, return_format, more)
 
-    add_hydra_collection_view(result_graph, "artefacts/" + artefactID + "/resources", None, count, page, pagesize)
 
-    response = make_response(result_graph.serialize(format=return_format[0], context=JSONLD_CONTEXT))
-    response.headers["Content-Type"] = return_format[1]
-    return response
+@app.route("/artefacts/<artefactID>/resources", methods=["POST"])
+def artefact_resources_batch(artefactID):
+    # A JSON array of resource URIs or form fields named uri
+    uris = request.get_json(silent=True) if request.is_json else request.form.getlist("uri")
+    if not isinstance(uris, list) or not all(isinstance(uri, str) for uri in uris):
+        abort(400, description="Resource URIs must be a JSON array of strings or uri form fields")
+    return describe_resources(artefactID, uris)
 
 
 @app.route("/artefacts/<artefactID>/resources/<path:resourceID>", methods=["GET"])
@@ -231,11 +480,13 @@ def artefact_resource(artefactID, resourceID):
 
     resourceID = re.sub(r'^(https?):/(?!/)', r'\1://', resourceID) # Fixing malformed URIs (http:/ -> http:// or https:/ -> https://)
 
-    ret = requests.get(API_BASE_URL + artefactID + "/data", params={"uri": resourceID, "lang": "en", "format": return_format[1]})
+    with timed("upstream"):
+        ret = upstream.get(artefactID + "/data", params={"uri": resourceID, "lang": "en", "format": return_format[1]})
     if ret.status_code == 404:
         abort(404, description="Artefact or resource not found")
     if ret.status_code == 406:
         abort(415, description="Unsupported format")
+    serve_cached([ret.content])
 
     data = ret.text
 
@@ -251,132 +502,98 @@ def artefact_resource_classes(artefactID):
     page = params["page"]
     return_format = params["format"]
 
-    g = Graph()
+    g = Descriptions()
 
-    ret = requests.get(API_BASE_URL + artefactID + "/types", params={ "lang": "en" })
+    with timed("upstream"):
+        ret = upstream.get(artefactID + "/types", params={ "lang": "en" })
     if ret.status_code == 404:
         abort(404, description="Artefact not found")
+    serve_cached([ret.content])
 
     data = ret.json()
 
-    start_index = (int(page) - 1) * int(pagesize)
-    end_index = start_index + int(pagesize)
-    types = sorted(data.get("types", []), key=lambda d: d["uri"])[start_index:end_index]
-    for voc_type in types:
+    types = sorted(data.get("types", []), key=lambda d: d["uri"])
+    keys = [voc_type["uri"] for voc_type in types]
+    start_index, end_index = page_window(params, lambda after: bisect.bisect_right(keys, after))
+    for voc_type in types[start_index:end_index]:
         uri = URIRef(voc_type["uri"])
         if voc_type.get("label"):
             g.add((uri, RDFS.label, Literal(voc_type["label"], lang="en")))
         if voc_type.get("superclass"):
             g.add((uri, RDFS.subClassOf, URIRef(voc_type["superclass"])))
 
-    add_hydra_collection_view(g, "artefacts/" + artefactID + "/resources/classes", None, len(data["types"]), page, pagesize)
+    add_hydra_collection_view(g, "artefacts/" + artefactID + "/resources/classes", None, len(data["types"]), page, pagesize, next_cursor(keys, end_index))
 
-    response = make_response(g.serialize(format=return_format[0], context=JSONLD_CONTEXT))
+    with timed("serialize"):
+        response = make_response(serialize(g, return_format[0], JSONLD_CONTEXT))
     response.headers["Content-Type"] = return_format[1]
     return response
 
 
 @app.route("/artefacts/<artefactID>/resources/concepts", methods=["GET"])
 def artefact_resource_concepts(artefactID):
+    if request.args.get("pagesize") == "all":
+        return export_collection(artefactID, SKOS.Concept)
+
     params = get_common_params()
     pagesize = params["pagesize"]
     page = params["page"]
     return_format = params["format"]
 
-    ret = requests.get(API_BASE_URL + artefactID + "/data", params={"lang": "en", "format": "text/turtle"})
-    if ret.status_code == 404:
-        abort(404, description="Artefact not found")
-
-    data = ret.text
-
-    query = """
-        PREFIX skos:<http://www.w3.org/2004/02/skos/core#>
-        DESCRIBE ?s
-        WHERE {
-            ?s a skos:Concept .
-        }
-        ORDER BY (str(?s))
-        LIMIT %s
-        OFFSET %s
-    """ % (pagesize, (int(page) - 1) * int(pagesize))
-
-    query2 = """
-        PREFIX skos:<http://www.w3.org/2004/02/skos/core#>
-        SELECT (COUNT(?concept) AS ?count)
-        WHERE {
-            ?concept a skos:Concept .
-        }
-    """
-    
-    g=Graph()
-    g.parse(data=data)
-
-    result_graph = Graph()
-    result_graph += g.query(query)
-    
-    count = 0
-    for x in g.query(query2):
-        count = int(x[0])
+    index = get_resource_index(artefactID)
+    serve_cached([index.header.get("hash")], index.header.get("last_modified"))
 
-    add_hydra_collection_view(result_graph, "artefacts/" + artefactID + "/resources/concepts", SKOS.Concept, count, page, pagesize)
+    with timed("query"):
+        start_index, end_index = page_window(params, lambda after: index.seek(SKOS.Concept, after))
+        count = index.count(SKOS.Concept)
+        subjects = index.page(SKOS.Concept, start_index, end_index)
+        more = end_index < count
 
-    response = make_response(result_graph.serialize(format=return_format[0], context=JSONLD_CONTEXT))
-    response.headers["Content-Type"] = return_format[1]
-    return response
+    return stream_collection(index, subjects, "artefacts/" + artefactID + "/resources/concepts", count, page, pagesize, return_format, more)
 
 
 @app.route("/artefacts/<artefactID>/resources/properties", methods=["GET"])
 def artefact_resource_properties(artefactID):
+    if request.args.get("pagesize") == "all":
+        return export_collection(artefactID, RDF.Property)
+
     params = get_common_params()
     pagesize = params["pagesize"]
     page = params["page"]
     return_format = params["format"]
 
-    ret = requests.get(API_BASE_URL + artefactID + "/data", params={"lang": "en", "format": "text/turtle"})
-    if ret.status_code == 404:
-        abort(404, description="Artefact not found")
-
-    data = ret.text
+    index = get_resource_index(artefactID)
+    serve_cached([index.header.get("hash")], index.header.get("last_modified"))
 
-    query = """
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        DESCRIBE ?p
-        WHERE {
-            ?p a rdf:Property .
-        }
-        ORDER BY (str(?p))
-        LIMIT %s
-        OFFSET %s
-    """ % (pagesize, (int(page) - 1) * int(pagesize))
-    
-    query2 = """
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        SELECT (COUNT(?property) AS ?count)
-        WHERE {
-            ?property a rdf:Property .
-        }
-    """
+    with timed("query"):
+        start_index, end_index = page_window(params, lambda after: index.seek(RDF.Property, after))
+        count = index.count(RDF.Property)
+        subjects = index.page(RDF.Property, start_index, end_index)
+        more = end_index < count
 
-    g=Graph()
-    g.parse(data=data)
+    return stream_collection(index, subjects, "artefacts/" + artefactID + "/resources/properties", count, page, pagesize, return_format, more)
 
-    result_graph = Graph()
-    result_graph += g.query(query)
 
-    count = 0
-    for x in g.query(query2):
-        count = int(x[0])
+@app.route("/artefacts/<artefactID>/resources/individuals", methods=["GET"])
+def artefact_resource_individuals(artefactID):
+    if request.args.get("pagesize") == "all":
+        return export_collection(artefactID, INDIVIDUALS)
 
-    add_hydra_collection_view(result_graph, "artefacts/" + artefactID + "/resources/properties", RDF.Property, count, page, pagesize)
+    params = get_common_params()
+    pagesize = params["pagesize"]
+    page = params["page"]
+    return_format = params["format"]
 
-    response = make_response(result_graph.serialize(format=return_format[0], context=JSONLD_CONTEXT))
-    response.headers["Content-Type"] = return_format[1]
-    return response
+    index = get_resource_index(artefactID)
+    serve_cached([index.header.get("hash")], index.header.get("last_modified"))
 
+    with timed("query"):
+        start_index, end_index = page_window(params, lambda after: index.seek(INDIVIDUALS, after))
+        count = index.count(INDIVIDUALS)
+        subjects = index.page(INDIVIDUALS, start_index, end_index)
+        more = end_index < count
 
-@app.route("/artefacts/<artefactID>/resources/individuals", methods=["GET"])
-def artefact_resource_individuals(artefactID):
-    return "/artefacts/" + artefactID + "/resources/individuals"
+    return stream_collection(index, subjects, "artefacts/" + artefactID + "/resources/individuals", count, page, pagesize, return_format, more)
 
 
 @app.route("/artefacts/<artefactID>/resources/schemes", methods=["GET"])
@@ -386,18 +603,20 @@ def artefact_resource_schemes(artefactID):
     page = params["page"]
     return_format = params["format"]
 
-    g = Graph()
+    g = Descriptions()
 
-    ret = requests.get(API_BASE_URL + artefactID + "/", params={ "lang": "en" })
+    with timed("upstream"):
+        ret = upstream.get(artefactID + "/", params={ "lang": "en" })
     if ret.status_code == 404:
         abort(404, description="Artefact not found")
+    serve_cached([ret.content])
 
     data = ret.json()
 
-    start_index = (int(page) - 1) * int(pagesize)
-    end_index = start_index + int(pagesize)
-    schemes = sorted(data.get("conceptschemes", []), key=lambda d: d["uri"])[start_index:end_index]
-    for scheme in schemes:
+    schemes = sorted(data.get("conceptschemes", []), key=lambda d: d["uri"])
+    keys = [scheme["uri"] for scheme in schemes]
+    start_index, end_index = page_window(params, lambda after: bisect.bisect_right(keys, after))
+    for scheme in schemes[start_index:end_index]:
         uri = URIRef(scheme["uri"])
         g.add((uri, RDF.type, URIRef(scheme["type"])))
         if scheme.get("label"):
@@ -407,9 +626,10 @@ def artefact_resource_schemes(artefactID):
         if scheme.get("title"):
             g.add((uri, DCTERMS.title, Literal(scheme["title"], lang="en")))
 
-    add_hydra_collection_view(g, "artefacts/" + artefactID + "/resources/schemes", None, len(data["conceptschemes"]), page, pagesize)
+    add_hydra_collection_view(g, "artefacts/" + artefactID + "/resources/schemes", None, len(data["conceptschemes"]), page, pagesize, next_cursor(keys, end_index))
 
-    response = make_response(g.serialize(format=return_format[0], context=JSONLD_CONTEXT))
+    with timed("serialize"):
+        response = make_response(serialize(g, return_format[0], JSONLD_CONTEXT))
     response.headers["Content-Type"] = return_format[1]
     return response
 
@@ -421,18 +641,20 @@ def artefact_resource_collection(artefactID):
     page = params["page"]
     return_format = params["format"]
 
-    g = Graph()
+    g = Descriptions()
 
-    ret = requests.get(API_BASE_URL + artefactID + "/groups", params={ "lang": "en" })
+    with timed("upstream"):
+        ret = upstream.get(artefactID + "/groups", params={ "lang": "en" })
     if ret.status_code == 404:
         abort(404, description="Artefact not found")
+    serve_cached([ret.content])
 
     data = ret.json()
 
-    start_index = (int(page) - 1) * int(pagesize)
-    end_index = start_index + int(pagesize)
-    groups = sorted(data.get("groups", []), key=lambda d: d["uri"])[start_index:end_index]
-    for group in groups:
+    groups = sorted(data.get("groups", []), key=lambda d: d["uri"])
+    keys = [group["uri"] for group in groups]
+    start_index, end_index = page_window(params, lambda after: bisect.bisect_right(keys, after))
+    for group in groups[start_index:end_index]:
         uri = URIRef(group["uri"])
         
         g.add((uri, RDF.type, ISOTHES.ConceptGroup))
@@ -442,75 +664,118 @@ def artefact_resource_collection(artefactID):
         for child in group.get("childGroups", []):
             g.add((uri, SKOS.member, URIRef(child)))
 
-    add_hydra_collection_view(g, "artefacts/" + artefactID + "/resources/collection", ISOTHES.ConceptGroup, len(data["groups"]), page, pagesize)
+    add_hydra_collection_view(g, "artefacts/" + artefactID + "/resources/collection", ISOTHES.ConceptGroup, len(data["groups"]), page, pagesize, next_cursor(keys, end_index))
 
-    response = make_response(g.serialize(format=return_format[0], context=JSONLD_CONTEXT))
+    with timed("serialize"):
+        response = make_response(serialize(g, return_format[0], JSONLD_CONTEXT))
     response.headers["Content-Type"] = return_format[1]
     return response
 
 
 @app.route("/artefacts/<artefactID>/resources/labels", methods=["GET"])
 def artefact_resource_labels(artefactID):
+    if request.args.get("pagesize") == "all":
+        return export_collection(artefactID, SKOSXL.Label)
+
     params = get_common_params()
     pagesize = params["pagesize"]
     page = params["page"]
     return_format = params["format"]
 
-    ret = requests.get(API_BASE_URL + artefactID + "/data", params={"lang": "en", "format": "text/turtle"})
-    if ret.status_code == 404:
-        abort(404, description="Artefact not found")
+    index = get_resource_index(artefactID)
+    serve_cached([index.header.get("hash")], index.header.get("last_modified"))
 
-    data = ret.text
+    with timed("query"):
+        start_index, end_index = page_window(params, lambda after: index.seek(SKOSXL.Label, after))
+        count = index.count(SKOSXL.Label)
+        subjects = index.page(SKOSXL.Label, start_index, end_index)
+        more = end_index < count
 
-    query = """
-        PREFIX skosxl: <http://www.w3.org/2008/05/skos-xl#>
-        DESCRIBE ?s
-        WHERE {
-            ?s a skosxl:Label .
-        }
-        ORDER BY (str(?s))
-        LIMIT %s
-        OFFSET %s
-    """ % (pagesize, (int(page) - 1) * int(pagesize))
-    
-    query2 = """
-        PREFIX skosxl: <http://www.w3.org/2008/05/skos-xl#>
-        SELECT (COUNT(?label) AS ?count)
-        WHERE {
-            ?label a skosxl:Label .
-        }
-    """
+    return stream_collection(index, subjects, "artefacts/" + artefactID + "/resources/labels", count, page, pagesize, return_format, more)
 
-    g=Graph()
-    g.parse(data=data)
 
-    result_graph = Graph()
-    result_graph += g.query(query)
+@app.route("/", methods=["GET"])
+def catalogue():
+    params = get_common_params()
+    return_format = params["format"]
 
-    count = 0
-    for x in g.query(query2):
-        count = int(x[0])
+    g = Descriptions()
 
-    add_hydra_collection_view(result_graph, "artefacts/" + artefactID + "/resources/labels", SKOSXL.Label, count, page, pagesize)
+    with timed("upstream"):
+        ret = upstream.get("vocabularies/", params={ "lang": "en" }).json()
+    artefact_ids = sorted(voc["id"] for voc in ret["vocabularies"])
+    snapshots = [snapshot for snapshot in map(snapshot_store.get, artefact_ids) if snapshot is not None]
+    serve_cached([ret] + [snapshot.header.get("hash") for snapshot in snapshots])
 
-    response = make_response(result_graph.serialize(format=return_format[0], context=JSONLD_CONTEXT))
-    response.headers["Content-Type"] = return_format[1]
-    return response
+    uri = URIRef(request.url_root)
+    g.add((uri, RDF.type, MOD.SemanticArtefactCatalog))
+    g.add((uri, RDF.type, DCAT.Catalog))
+    g.add((uri, DCTERMS.title, Literal("Finto", lang="en")))
+    g.add((uri, DCTERMS.accessRights, Literal("public", lang="en")))
+    g.add((uri, DCAT.landingPage, URIRef("https://finto.fi/")))
+    if snapshots:
+        g.add((uri, DCTERMS.modified, Literal(max(record_modified(snapshot.header) for snapshot in snapshots))))
 
+    for artefactID in artefact_ids:
+        g.add((uri, DCAT.dataset, URIRef(request.url_root + "artefacts/" + artefactID)))
+        g.add((uri, DCAT.record, URIRef(request.url_root + "records/" + artefactID)))
 
-@app.route("/", methods=["GET"])
-def catalogue():
-    return "/"
+    with timed("serialize"):
+        response = make_response(serialize(g, return_format[0], JSONLD_CONTEXT))
+    response.headers["Content-Type"] = return_format[1]
+    return response
 
 
 @app.route("/records", methods=["GET"])
 def records():
-    return "/records"
+    params = get_common_params()
+    pagesize = params["pagesize"]
+    page = params["page"]
+    return_format = params["format"]
+
+    g = Descriptions()
+
+    with timed("upstream"):
+        ret = upstream.get("vocabularies/", params={ "lang": "en" }).json()
+
+        vocabularies = sorted(ret["vocabularies"], key=lambda d: d["id"])
+        keys = [voc["id"] for voc in vocabularies]
+        start_index, end_index = page_window(params, lambda after: bisect.bisect_right(keys, after))
+        vocabulary_details = upstream.map(lambda voc: upstream.get(voc["id"] + "/", params={ "lang": "en" }).json(), vocabularies[start_index:end_index])
+    snapshots = [snapshot_store.get(voc["id"]) for voc in vocabularies[start_index:end_index]]
+    serve_cached([ret] + vocabulary_details + [snapshot.header.get("hash") if snapshot else "" for snapshot in snapshots])
+
+    for voc_details, snapshot in zip(vocabulary_details, snapshots):
+        add_record(g, voc_details, snapshot)
+
+    add_hydra_collection_view(g, "records", MOD.SemanticArtefactCatalogRecord, len(ret["vocabularies"]), page, pagesize, next_cursor(keys, end_index))
+
+    with timed("serialize"):
+        response = make_response(serialize(g, return_format[0], dict(JSONLD_CONTEXT, foaf=str(FOAF))))
+    response.headers["Content-Type"] = return_format[1]
+    return response
 
 
 @app.route("/records/<artefactID>", methods=["GET"])
 def record(artefactID):
-    return "/records/" + artefactID
+    params = get_common_params()
+    return_format = params["format"]
+
+    g = Descriptions()
+
+    with timed("upstream"):
+        ret = upstream.get(artefactID + "/", params={ "lang": "en" })
+    if ret.status_code == 404:
+        abort(404, description="Artefact not found")
+    snapshot = snapshot_store.get(artefactID)
+    serve_cached([ret.content, snapshot.header.get("hash") if snapshot else ""])
+
+    add_record(g, ret.json(), snapshot)
+
+    with timed("serialize"):
+        response = make_response(serialize(g, return_format[0], dict(JSONLD_CONTEXT, foaf=str(FOAF))))
+    response.headers["Content-Type"] = return_format[1]
+    return response
 
 
 @app.route("/search", methods=["GET"])
@@ -529,54 +794,247 @@ def search_content():
     if not q:
         abort(400, description="Search query parameter is required")
     
+    lang = request.args.get("lang")
+
     g = Graph()
-    
-    search_results = requests.get(API_BASE_URL + "/search/", params={ "query": q, "unique": True }).json()["results"]
-    for res in search_results:
-        uri = URIRef(res["uri"])
 
-        g.add((uri, SKOS.prefLabel, Literal(res["prefLabel"], lang="en")))
-        for res_type in res.get("type"):
-            g.add((uri, RDF.type, URIRef(res_type)))
-        if res.get("altLabel"):
-            g.add((uri, SKOS.altLabel, Literal(res["altLabel"], lang="en")))
-        if res.get("hiddenLabel"):
-            g.add((uri, SKOS.hiddenLabel, Literal(res["hiddenLabel"], lang="en")))
+    if not search_index.is_empty():
+        serve_cached([search_index.generation()])
+
+        start_index = (int(page) - 1) * int(pagesize)
+        with timed("search"):
+            # One extra result tells whether there is a next page
+            count, results = search_index.search_content(q, lang, start_index, int(pagesize) + 1, params["cursor"])
+        cursor_key = results[int(pagesize) - 1]["uri"] if len(results) > int(pagesize) else None
+        for res in results[:int(pagesize)]:
+            uri = URIRef(res["uri"])
+
+            for label_property, label, label_lang in res["labels"]:
+                g.add((uri, URIRef(label_property), Literal(label, lang=label_lang or None)))
+            for res_type in res["types"]:
+                g.add((uri, RDF.type, URIRef(res_type)))
+    else:
+        search_params = { "query": q, "unique": True }
+        if lang:
+            search_params["lang"] = lang
+        with timed("upstream"):
+            search_results = upstream.get("search/", params=search_params).json()["results"]
+        serve_cached([search_results])
+
+        # Results with the same URI describe a single resource
+        results_by_uri = {}
+        for res in search_results:
+            results_by_uri.setdefault(res["uri"], []).append(res)
+
+        count = len(results_by_uri)
+
+        keys = sorted(results_by_uri)
+        start_index, end_index = page_window(params, lambda after: bisect.bisect_right(keys, after))
+        cursor_key = next_cursor(keys, end_index)
+        for key in keys[start_index:end_index]:
+            uri = URIRef(key)
+            for res in results_by_uri[key]:
+                g.add((uri, SKOS.prefLabel, Literal(res["prefLabel"], lang=lang or "en")))
+                for res_type in res.get("type"):
+                    g.add((uri, RDF.type, URIRef(expand_curie(res_type))))
+                if res.get("altLabel"):
+                    g.add((uri, SKOS.altLabel, Literal(res["altLabel"], lang=lang or "en")))
+                if res.get("hiddenLabel"):
+                    g.add((uri, SKOS.hiddenLabel, Literal(res["hiddenLabel"], lang=lang or "en")))
+
+    add_hydra_collection_view(g, "search/content", None, count, page, pagesize, cursor_key)
+
+    with timed("serialize"):
+        response = make_response(g.serialize(format=return_format[0], context=JSONLD_CONTEXT))
+    response.headers["Content-Type"] = return_format[1]
+    return response
+
 
-    jsonld = json.loads(g.serialize(format="json-ld", context=JSONLD_CONTEXT))
+@app.route("/search/metadata", methods=["GET"])
+def search_metadata():
+    params = get_common_params()
+    pagesize = params["pagesize"]
+    page = params["page"]
+    return_format = params["format"]
 
-    count = len(jsonld["@graph"])
+    q = request.args.get("q")
+    if not q:
+        abort(400, description="Search query parameter is required")
 
-    start_index = (int(page) - 1) * int(pagesize)
-    end_index = start_index + int(pagesize)
-    jsonld["@graph"] = sorted(jsonld["@graph"], key=lambda d: d["@id"])[start_index:end_index]
+    serve_cached([search_index.generation()])
 
     g = Graph()
 
-    g.parse(data=json.dumps(jsonld), format="json-ld")
+    start_index = (int(page) - 1) * int(pagesize)
+    with timed("search"):
+        # One extra result tells whether there is a next page
+        count, artefact_details = search_index.search_metadata(q, start_index, int(pagesize) + 1, params["cursor"])
+    cursor_key = artefact_details[int(pagesize) - 1]["id"] if len(artefact_details) > int(pagesize) else None
+    for voc_details in artefact_details[:int(pagesize)]:
+        add_artefact(g, voc_details)
 
-    add_hydra_collection_view(g, "search/content", None, count, page, pagesize)
+    add_hydra_collection_view(g, "search/metadata", MOD.SemanticArtefact, count, page, pagesize, cursor_key)
 
-    response = make_response(g.serialize(format=return_format[0], context=JSONLD_CONTEXT))
+    with timed("serialize"):
+        response = make_response(g.serialize(format=return_format[0], context=JSONLD_CONTEXT))
     response.headers["Content-Type"] = return_format[1]
     return response
 
 
-@app.route("/search/metadata", methods=["GET"])
-def search_metadata():
-    return "/search/metadata"
-
-
 @app.route("/doc/api", methods=["GET"])
 def doc_api():
     return "/doc/api"
 
 
+@app.cli.command("sync-snapshots")
+@click.argument("artefact_ids", nargs=-1)
+def sync_snapshots(artefact_ids):
+    """Download vocabulary datasets, write their snapshots and update the search index."""
+    if not artefact_ids:
+        # The list is read from SKOSMOS as it is now, not from the response cache
+        artefact_ids = list_artefacts(upstream_client)
+
+    for artefactID in artefact_ids:
+        try:
+            details = sync_artefact(artefactID, parse_pool)
+        except Exception as e:
+            click.echo(artefactID + ": failed (" + str(e) + ")", err=True)
+            continue
+        click.echo(artefactID + (": updated" if details["changed"] else ": unchanged"))
+        if details["indexed"]:
+            click.echo(artefactID + ": search index updated")
+
+
+def list_artefacts(http):
+    ret = http.get("vocabularies/", params={ "lang": "en" })
+    ret.raise_for_status()
+    return sorted(voc["id"] for voc in ret.json()["vocabularies"])
+
+
+def sync_artefact(artefactID, pool=None):
+    """Update the snapshot and search index entry of the artefact if its dataset or details have changed."""
+    changed = snapshot_store.sync(upstream_client, artefactID, pool)
+    snapshot = snapshot_store.get(artefactID)
+    details = { "changed": changed, "indexed": False }
+    if snapshot is not None:
+        voc_details = upstream.get(artefactID + "/", params={ "lang": "en" }).json()
+        details["indexed"] = search_index.update(artefactID, snapshot, voc_details)
+        details.update(size=os.path.getsize(snapshot.path), triples=snapshot.triple_count(), hash=snapshot.header.get("hash"))
+        # The snapshot is served from now on, so a dataset parsed on demand is no longer needed
+        graph_cache.invalidate(artefactID)
+    return details
+
+
+def remove_artefact(artefactID):
+    snapshot_store.remove(artefactID)
+    search_index.remove(artefactID)
+
+
+def close_connections():
+    """Close the upstream and database connections of the current thread before worker processes are forked."""
+    upstream_client.close()
+    search_index.close()
+    if RESPONSE_CACHE_BACKEND == "sqlite":
+        response_cache_backend.close()
+
+
+def finish_request(timer, route, method, status, size):
+    metrics.observe(route, method, status, timer, size)
+
+    elapsed = timer.elapsed()
+    profile_path = profiler.stop(timer.profile, route, elapsed) if timer.profile else None
+    if SLOW_REQUEST_THRESHOLD and elapsed >= SLOW_REQUEST_THRESHOLD:
+        metrics.observe_slow()
+        app.logger.warning("Slow request %s %s took %.3f s (%s)%s", method, route, elapsed, timer.server_timing(), ", profile in " + profile_path if profile_path else "")
+
+
+def get_resource_index(artefactID):
+    index = snapshot_store.get(artefactID)
+    if index is None:
+        try:
+            index = graph_cache.get(artefactID)
+        except GraphCacheBusy:
+            abort(503, description="Too many vocabulary datasets are being loaded, try again later", retry_after=GRAPH_CACHE_RETRY_AFTER)
+    if index is None:
+        abort(404, description="Artefact not found")
+    return index
+
+
+def serve_cached(versions, last_modified=None):
+    """Answer with 304 Not Modified if the client already has this version of the response
+    and otherwise with its stored rendering if there is one.
+
+    versions identify the data the response is built from. The strong ETag
+    is their hash together with the request URL, so it changes with the
+    query parameters and the data but not between worker processes, and it
+    has the negotiated content coding as a suffix.
+    """
+    if None in versions:
+        return
+
+    digest = hashlib.sha256(request.url.encode("utf-8"))
+    for version in versions:
+        digest.update(b"\0" + (version if isinstance(version, bytes) else str(version).encode("utf-8")))
+    key = digest.hexdigest()[:32]
+    coding = negotiate(request.headers.get("Accept-Encoding"), COMPRESSION_CODINGS)
+    flask_g.coding = coding
+    flask_g.rendered_key = key
+    flask_g.etag = key + "-" + coding if coding else key
+    flask_g.last_modified = last_modified
+
+    if request.if_none_match:
+        # If-None-Match uses the weak comparison, proxies that compress responses weaken their ETags
+        matched = request.if_none_match.contains_weak(flask_g.etag)
+    else:
+        modified = parse_date(last_modified) if last_modified else None
+        matched = modified is not None and request.if_modified_since is not None and modified <= request.if_modified_since
+    if matched:
+        abort(Response(status=304))
+
+    cached = rendered_cache.get(key)
+    if cached:
+        bodies, headers = cached
+        body = bodies.get(coding or "identity")
+        if body is None:
+            # Stored compressed variants save compressing the response again on later hits
+            with timed("compress"):
+                body = compress(bodies["identity"], coding, COMPRESSION_LEVELS[coding])
+            rendered_cache.add_variant(key, coding, body)
+
+        flask_g.rendered = True
+        response = Response(body, headers=headers)
+        if coding:
+            response.headers["Content-Encoding"] = coding
+        abort(response)
+
+
+def schedule_warm(artefactID):
+    # Only snapshots opened while serving a request are warmed, their URLs depend on the URL root of the request
+    if RENDERED_CACHE_WARM_PAGES > 0 and request:
+        threading.Thread(target=warm_rendered_cache, args=(artefactID, request.url_root), daemon=True).start()
+
+
+def warm_rendered_cache(artefactID, url_root):
+    """Render the dataset collections of a new snapshot without parameters and their first pages as linked from their collection views."""
+    client = app.test_client()
+    snapshot = snapshot_store.get(artefactID)
+    if snapshot is None:
+        return
+    for endpoint, subject_type in [("resources", None), ("resources/concepts", SKOS.Concept), ("resources/properties", RDF.Property), ("resources/individuals", INDIVIDUALS), ("resources/labels", SKOSXL.Label)]:
+        pages = min(RENDERED_CACHE_WARM_PAGES, math.ceil(snapshot.count(subject_type) / 50))
+        urls = ["/artefacts/" + artefactID + "/" + endpoint] + ["/artefacts/" + artefactID + "/" + endpoint + "?page=" + str(page) + "&pagesize=50" for page in range(1, pages + 1)]
+        for url in urls:
+            # Buffering runs the streamed body to the end, which stores it
+            client.get(url, base_url=url_root, buffered=True, environ_overrides={ INTERNAL_REQUEST: True })
+
+
 def get_common_params():
     pagesize = request.args.get("pagesize", "50")
     page = request.args.get("page", "1")
     if not (pagesize.isdigit() and page.isdigit()):
         abort(400, description="Pagesize and page must be integers")
+    if int(pagesize) < 1 or int(page) < 1:
+        abort(400, description="Pagesize and page must be at least 1")
 
     formats = { 
         "jsonld": ("json-ld", "application/json"),
@@ -591,33 +1049,313 @@ def get_common_params():
         if not return_format:
             abort(415, description="Unsupported format")
     
+    cursor = request.args.get("cursor")
+    if cursor is not None:
+        cursor = decode_cursor(cursor)
+
     return {
         "pagesize": pagesize,
         "page": page,
-        "format": return_format
+        "format": return_format,
+        "cursor": cursor
     }
 
 
-def add_hydra_collection_view(graph, endpoint, subject_type, count, page, pagesize):
-    url = request.url_root + endpoint
+def get_facets():
+    """Return the facets of the request as (predicate, object) pairs, with "lang" as the predicate of a label language."""
+    facets = [(RDF.type, URIRef(expand_curie(value))) for value in request.args.getlist("type") if value]
+    facets += [(SKOS.inScheme, URIRef(expand_curie(value))) for value in request.args.getlist("inScheme") if value]
+    facets += [("lang", value.lower()) for value in request.args.getlist("lang") if value]
+    return tuple(facets)
+
+
+def page_window(params, seek):
+    """Return the start and end position of the requested page.
+
+    With a cursor, seek is called with the sort key the cursor encodes and
+    returns the position of the first item after it.
+    """
+    pagesize = int(params["pagesize"])
+    if params["cursor"] is None:
+        start = (int(params["page"]) - 1) * pagesize
+    else:
+        start = seek(params["cursor"])
+    return start, start + pagesize
+
+
+def next_cursor(keys, end):
+    # Sort key of the last item on the page if there are items after it
+    return keys[end - 1] if end < len(keys) else None
+
 
-    collection_uri = URIRef(url)
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    # Cursors are unpadded URL-safe base64, which the base64 module would otherwise decode leniently
+    if not re.fullmatch(r"[A-Za-z0-9_-]*", cursor):
+        abort(400, description="Invalid cursor")
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+    except ValueError:
+        abort(400, description="Invalid cursor")
+
+
+def stream_collection(index, subjects, endpoint, count, page, pagesize, return_format, more=False):
+    # The status has been sent when the body is streamed, so what can fail is done first
+    with timed("hydra"):
+        # Blank nodes are described with the subjects that refer to them but are not members
+        members = [member for member in map(index.term, subjects) if not isinstance(member, BNode)]
+        view = hydra_collection_view(endpoint, members, count, page, pagesize, str(members[-1]) if more and members else None)
+    namespaces = dict(index.namespaces(), **JSONLD_CONTEXT)
+    check_serializable(index, subjects, return_format[0], namespaces)
+
+    def descriptions():
+        yield from index.descriptions(subjects)
+        yield from view
+
+    return Response(stream_with_context(serialize_stream(descriptions(), return_format[0], namespaces)), content_type=return_format[1])
+
+
+def check_serializable(index, subjects, rdflib_format, namespaces):
+    """Raise ValueError if the descriptions of the subject IDs, or of all subjects if None, cannot be written in the format."""
+    try:
+        # The predicates of the whole snapshot are known, those of the subjects have to be read
+        check_predicates(index.predicates(), rdflib_format, namespaces)
+    except ValueError:
+        if subjects is None:
+            raise
+        check_predicates(index.predicates(subjects), rdflib_format, namespaces)
+
+
+def export_collection(artefactID, subject_type, facets=()):
+    """Stream the descriptions of all subjects of the type that match the facets in one response."""
+    formats = {
+        "ndjson": ("ndjson", "application/x-ndjson"),
+        "nt": ("nt", "application/n-triples"),
+        "jsonld": ("json-ld", "application/json"),
+        "ttl": ("ttl", "text/turtle"),
+        "rdfxml": ("xml", "application/rdf+xml")
+    }
+    return_format = formats.get(request.args.get("format") or "ndjson")
+    if not return_format:
+        abort(415, description="Unsupported format")
+
+    index = get_resource_index(artefactID)
+    serve_cached([index.header.get("hash")], index.header.get("last_modified"))
+
+    def descriptions():
+        # Subjects are read a batch at a time, so memory use does not grow with the vocabulary
+        for start in range(0, index.count(subject_type, facets), EXPORT_BATCH_SIZE):
+            with timed("query"):
+                subjects = index.page(subject_type, start, start + EXPORT_BATCH_SIZE, facets)
+            yield from index.descriptions(subjects)
+
+    namespaces = dict(index.namespaces(), **JSONLD_CONTEXT)
+    check_serializable(index, None, return_format[0], namespaces)
+    return Response(stream_with_context(serialize_stream(descriptions(), return_format[0], namespaces)), content_type=return_format[1])
+
+
+def describe_resources(artefactID, uris):
+    """Return the descriptions of the resources in one document with the status of every URI that was not found.
+
+    Resources are described from the snapshot or cached dataset of the
+    artefact when there is one and otherwise fetched from SKOSMOS in parallel.
+    """
+    params = get_common_params()
+    return_format = params["format"]
+
+    uris = list(dict.fromkeys(uri for uri in uris if uri))
+    if not uris:
+        abort(400, description="No resource URIs given")
+    if len(uris) > RESOURCE_BATCH_MAX_URIS:
+        abort(400, description="At most " + str(RESOURCE_BATCH_MAX_URIS) + " resources can be looked up at a time")
+
+    g = Descriptions()
+    statuses = {}
+
+    index = snapshot_store.get(artefactID)
+    if index is None:
+        index = graph_cache.peek(artefactID)
+
+    if index is not None:
+        # POST bodies are not part of the request URL the ETag and rendered response are keyed by
+        if request.method == "GET":
+            serve_cached([index.header.get("hash")], index.header.get("last_modified"))
+        namespaces = index.namespaces()
+
+        with timed("query"):
+            ids = [index.lookup(URIRef(uri)) for uri in uris]
+            described = set()
+            for s, predicate_objects in index.descriptions([i for i in ids if i is not None]):
+                described.add(s)
+                for p, o in predicate_objects:
+                    g.add((s, p, o))
+        for uri in uris:
+            statuses[uri] = 200 if URIRef(uri) in described else 404
+    else:
+        with timed("upstream"):
+            ret = upstream.get(artefactID + "/", params={ "lang": "en" })
+            if ret.status_code == 404:
+                abort(404, description="Artefact not found")
+            responses = upstream.map(lambda uri: upstream.get(artefactID + "/data", params={"uri": uri, "lang": "en", "format": "text/turtle"}), uris)
+        if request.method == "GET":
+            serve_cached([data.status_code for data in responses] + [data.content for data in responses])
+        namespaces = {}
+
+        with timed("parse"):
+            for uri, data in zip(uris, responses):
+                statuses[uri] = data.status_code
+                if data.status_code != 200:
+                    continue
+                graph = Graph()
+                graph.parse(data=data.content, format="turtle")
+                for triple in graph:
+                    g.add(triple)
+                namespaces.update(graph.namespaces())
+
+    add_batch_view(g, uris, statuses)
+
+    with timed("serialize"):
+        response = make_response(serialize(g, return_format[0], dict(namespaces, **JSONLD_CONTEXT)))
+    response.headers["Content-Type"] = return_format[1]
+    return response
+
+
+def add_batch_view(graph, uris, statuses):
+    # The found resources are the members of the batch, the others are reported with their status
+    batch = URIRef(request.url) if request.method == "GET" else BNode()
+    found = [uri for uri in uris if statuses[uri] == 200]
+
+    graph.add((batch, RDF.type, HYDRA.Collection))
+    graph.add((batch, HYDRA.totalItems, Literal(len(found), datatype=XSD.nonNegativeInteger)))
+    for uri in found:
+        graph.add((batch, HYDRA.member, URIRef(uri)))
+
+    for uri in uris:
+        if statuses[uri] == 200:
+            continue
+        status = BNode()
+        graph.add((status, RDF.type, HYDRA.Status))
+        graph.add((status, HYDRA.statusCode, Literal(statuses[uri], datatype=XSD.integer)))
+        graph.add((status, HYDRA.title, Literal(HTTP_STATUS_CODES.get(statuses[uri], "Error"))))
+        graph.add((status, DCTERMS.subject, URIRef(uri)))
+
+
+def add_distribution(graph, artefactID, distributionID, download_url):
+    uri = URIRef(request.url_root + "artefacts/" + artefactID + "/distributions/" + distributionID)
+
+    graph.add((uri, RDF.type, MOD.semanticArtefactDistribution))
+    graph.add((uri, DCAT.downloadURL, URIRef(download_url)))
+    graph.add((uri, DCAT.accessURL, URIRef("https://finto.fi/" + artefactID)))
+    graph.add((uri, DCTERMS.accessRights, Literal("public", lang="en")))
+    graph.add((uri, MOD.hasSyntax, URIRef(FORMATS[int(distributionID) - 1]["uri"])))
+    return uri
+
+
+def add_record(graph, voc_details, snapshot=None):
+    uri = URIRef(request.url_root + "records/" + voc_details["id"])
+    artefact_uri = URIRef(request.url_root + "artefacts/" + voc_details["id"])
+
+    graph.add((uri, RDF.type, MOD.SemanticArtefactCatalogRecord))
+    graph.add((uri, RDF.type, DCAT.CatalogRecord))
+    graph.add((uri, DCTERMS.identifier, Literal(voc_details["id"])))
+    graph.add((uri, FOAF.primaryTopic, artefact_uri))
+
+    # Only the snapshot of a synced artefact tells when its dataset changed
+    if snapshot is not None:
+        graph.add((uri, DCTERMS.modified, Literal(record_modified(snapshot.header))))
+        graph.add((artefact_uri, DCTERMS.modified, Literal(dataset_modified(snapshot.header))))
+
+    add_artefact(graph, voc_details)
+
+
+def dataset_modified(header):
+    # Last-Modified of the dataset if SKOSMOS sent one, otherwise the time its change was synced
+    if header.get("last_modified"):
+        return parse_date(header["last_modified"])
+    return record_modified(header)
+
+
+def record_modified(header):
+    return datetime.fromtimestamp(int(header["synced"]), timezone.utc)
+
+
+def add_artefact(graph, voc_details):
+    uri = URIRef(request.url_root + "artefacts/" + voc_details["id"])
+
+    graph.add((uri, RDF.type, MOD.SemanticArtefact))
+    graph.add((uri, DCTERMS.title, Literal(voc_details["title"], lang="en")))
+    graph.add((uri, DCTERMS.identifier, Literal(voc_details["id"], lang="en")))
+    graph.add((uri, DCTERMS.type, MOD.SemanticArtefact))
+    graph.add((uri, DCTERMS.accessRights, Literal("public", lang="en")))
+    graph.add((uri, DCAT.landingPage, URIRef("https://finto.fi/" + voc_details["id"])))
+
+    for lang in voc_details["languages"]:
+        graph.add((uri, DCTERMS.language, Literal(lang)))
+
+
+def expand_curie(value):
+    # SKOSMOS returns types as compact IRIs such as skos:Concept
+    prefix, _, local = value.partition(":")
+    if prefix in JSONLD_CONTEXT and not local.startswith("//"):
+        return JSONLD_CONTEXT[prefix] + local
+    return value
+
+
+def add_hydra_collection_view(graph, endpoint, subject_type, count, page, pagesize, next_cursor=None):
+    with timed("hydra"):
+        subjects = graph.subjects(RDF.type, subject_type) if subject_type else graph.subjects()
+        for s, predicate_objects in hydra_collection_view(endpoint, list(dict.fromkeys(subjects)), count, page, pagesize, next_cursor):
+            for p, o in predicate_objects:
+                graph.add((s, p, o))
+
+
+def hydra_collection_view(endpoint, members, count, page, pagesize, next_cursor=None):
+    url = request.url_root + endpoint
+    cursor = request.args.get("cursor")
+    # A filtered collection is identified by its facets, which its page links keep
+    facets = urlencode([(k, v) for k, v in request.args.items(multi=True) if k in FACET_PARAMS])
+    filters = "&" + facets if facets else ""
+
+    collection_uri = URIRef(url + "?" + facets if facets else url)
+    if cursor is None:
+        view_uri = URIRef(url + "?page=" + page + "&pagesize=" + pagesize + filters)
+    else:
+        view_uri = URIRef(cursor_url(url, cursor, pagesize))
 
     # Add subjects as hydra:members
-    subjects = graph.subjects(RDF.type, subject_type) if subject_type else graph.subjects()
-    for s in subjects:
-        graph.add((collection_uri, HYDRA.member, s))
-    
+    collection = [(HYDRA.member, s) for s in members]
+
     # Add hydra collection
-    graph.add((collection_uri, RDF.type, HYDRA.Collection))
-    graph.add((collection_uri, HYDRA.itemsPerPage, Literal(pagesize, datatype=XSD.nonNegativeInteger)))
-    graph.add((collection_uri, HYDRA.totalItems, Literal(count, datatype=XSD.nonNegativeInteger)))
+    collection.append((RDF.type, HYDRA.Collection))
+    collection.append((HYDRA.itemsPerPage, Literal(pagesize, datatype=XSD.nonNegativeInteger)))
+    collection.append((HYDRA.totalItems, Literal(count, datatype=XSD.nonNegativeInteger)))
 
     # Add hydra view
-    view_uri = URIRef(url + "?page=" + page + "&pagesize=" + pagesize)
-    graph.add((collection_uri, HYDRA.view, view_uri))
-    graph.add((view_uri, RDF.type, HYDRA.PartialCollectionView))
-    graph.add((view_uri, HYDRA.first, URIRef(url + "?page=1&pagesize=" + pagesize)))
-    graph.add((view_uri, HYDRA.last, URIRef(url + "?page=" + str(math.ceil(count / int(pagesize))) + "&pagesize=" + pagesize)))
-    graph.add((view_uri, HYDRA.next, URIRef(url + "?page=" + str(min(int(page) + 1, math.ceil(count / int(pagesize)))) + "&pagesize=" + pagesize)))
-    graph.add((view_uri, HYDRA.previous, URIRef(url + "?page=" + str(max(int(page) - 1, 1)) + "&pagesize=" + pagesize)))
+    collection.append((HYDRA.view, view_uri))
+    if cursor is None:
+        view = [
+            (RDF.type, HYDRA.PartialCollectionView),
+            (HYDRA.first, URIRef(url + "?page=1&pagesize=" + pagesize + filters)),
+            (HYDRA.last, URIRef(url + "?page=" + str(math.ceil(count / int(pagesize))) + "&pagesize=" + pagesize + filters)),
+            (HYDRA.next, URIRef(url + "?page=" + str(min(int(page) + 1, math.ceil(count / int(pagesize)))) + "&pagesize=" + pagesize + filters)),
+            (HYDRA.previous, URIRef(url + "?page=" + str(max(int(page) - 1, 1)) + "&pagesize=" + pagesize + filters))
+        ]
+    else:
+        # Cursors only lead forward, the last view has no next link
+        view = [
+            (RDF.type, HYDRA.PartialCollectionView),
+            (HYDRA.first, URIRef(cursor_url(url, "", pagesize)))
+        ]
+        if next_cursor is not None:
+            view.append((HYDRA.next, URIRef(cursor_url(url, encode_cursor(next_cursor), pagesize))))
+
+    return [(collection_uri, collection), (view_uri, view)]
+
+
+def cursor_url(url, cursor, pagesize):
+    # Harvesters follow the links, so they keep the other parameters of the request
+    params = [(k, v) for k, v in request.args.items(multi=True) if k not in ("cursor", "page", "pagesize")]
+    return url + "?" + urlencode([("cursor", cursor), ("pagesize", pagesize)] + params)
@@ -0,0 +1,188 @@
+"""ASGI entry point of the MOD API.
+
+    uvicorn asgi:application --workers 4
+
+The event loop only moves requests and response chunks. Each request runs
+the Flask app in the thread pool of its lane, so requests that load whole
+vocabulary datasets cannot take the threads of the cheap metadata routes,
+and datasets are parsed in a process pool instead of in the serving process.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import re
+import sys
+import threading
+
+# Parsing in worker processes keeps the GIL of the serving process free
+os.environ.setdefault("GRAPH_CACHE_PARSE_PROCESSES", "2")
+
+from app import app
+
+
+# Lanes as (name, path pattern, threads), the first matching lane serves the request
+LANES = [
+    ("datasets", r"/artefacts/[^/]+/resources(/(concepts|properties|individuals|labels))?/?", int(os.environ.get("ASGI_DATASET_THREADS", 4))),
+    ("default", r".*", int(os.environ.get("ASGI_DEFAULT_THREADS", 32)))
+]
+
+# Response chunks buffered per request before the worker thread waits for the client
+RESPONSE_QUEUE_SIZE = 16
+
+
+class LaneApplication:
+    """ASGI application running a WSGI application in per-lane thread pools."""
+
+    def __init__(self, wsgi_app, lanes):
+        self.wsgi_app = wsgi_app
+        self.lanes = [(name, re.compile(pattern), ThreadPoolExecutor(max_workers=threads, thread_name_prefix="lane-" + name)) for name, pattern, threads in lanes]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(RESPONSE_QUEUE_SIZE)
+        disconnected = threading.Event()
+        environ = wsgi_environ(scope, body)
+        executor = self.lane(scope["path"])
+
+        worker = loop.run_in_executor(executor, self._run, environ, loop, queue, disconnected)
+        watcher = asyncio.ensure_future(watch_disconnect(receive, disconnected))
+        try:
+            while True:
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait([getter, watcher], return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    # The client went away, the worker stops without queueing the end of the response
+                    getter.cancel()
+                    break
+                kind, value = getter.result()
+                if kind == "start":
+                    status, headers = value
+                    await send({ "type": "http.response.start", "status": status, "headers": headers })
+                elif kind == "body":
+                    await send({ "type": "http.response.body", "body": value, "more_body": True })
+                elif kind == "end":
+                    await send({ "type": "http.response.body", "body": b"", "more_body": False })
+                    break
+                else:
+                    raise value
+        finally:
+            # Stops the worker thread between chunks if the client went away
+            watcher.cancel()
+            disconnected.set()
+            while not worker.done():
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.wait([worker], timeout=0.05)
+
+    def lane(self, path):
+        for name, pattern, executor in self.lanes:
+            if pattern.fullmatch(path):
+                return executor
+        return self.lanes[-1][2]
+
+    def _run(self, environ, loop, queue, disconnected):
+        def put(kind, value):
+            if disconnected.is_set():
+                return False
+            asyncio.run_coroutine_threadsafe(queue.put((kind, value)), loop).result()
+            return True
+
+        response = { "start": None, "sent": False }
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response["sent"]:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response["start"] = (int(status.split(" ", 1)[0]), [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers])
+            return write
+
+        def write(data):
+            if not response["sent"]:
+                response["sent"] = True
+                put("start", response["start"])
+            if data:
+                put("body", data)
+
+        try:
+            result = self.wsgi_app(environ, start_response)
+            try:
+                for chunk in result:
+                    write(chunk)
+                    if disconnected.is_set():
+                        break
+                write(b"")
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+            put("end", None)
+        except BaseException as e:
+            put("error", e)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({ "type": "lifespan.startup.complete" })
+            elif message["type"] == "lifespan.shutdown":
+                for _, _, executor in self.lanes:
+                    executor.shutdown(wait=False)
+                await send({ "type": "lifespan.shutdown.complete" })
+                return
+
+
+async def watch_disconnect(receive, disconnected):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            disconnected.set()
+            return
+
+
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = "HTTP_" + name
+            environ[key] = environ[key] + "," + value if key in environ else value
+    return environ
+
+
+application = LaneApplication(app, LANES)
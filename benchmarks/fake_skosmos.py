@@ -0,0 +1,252 @@
+"""Local stand-in for the SKOSMOS REST API used by the benchmarks.
+
+Serves synthetic vocabularies of the given sizes, and recorded vocabularies
+read from Turtle files, for the SKOSMOS methods the MOD API calls.
+
+    python benchmarks/fake_skosmos.py --port 8090 --sizes 1000,100000,1000000
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from rdflib import Graph
+
+
+BASE = "http://bench.example.org/"
+
+PREFIXES = """@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+@prefix skosxl: <http://www.w3.org/2008/05/skos-xl#> .
+@prefix rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+@prefix dcterms: <http://purl.org/dc/terms/> .
+"""
+
+FORMATS = {
+    "text/turtle": "turtle",
+    "application/json": "json-ld",
+    "application/ld+json": "json-ld",
+    "application/rdf+xml": "xml"
+}
+
+MAX_SEARCH_HITS = 1000
+
+# Last-Modified of every dataset
+LAST_MODIFIED = "Mon, 01 Jan 2024 00:00:00 GMT"
+
+
+class Vocabulary:
+    def __init__(self, vocabulary_id, size=None, path=None):
+        self.id = vocabulary_id
+        self.size = size
+        self.path = path
+        self.namespace = BASE + vocabulary_id + "/"
+        self._data = None
+        self._lock = threading.Lock()
+
+    def details(self):
+        return {
+            "id": self.id,
+            "title": "Benchmark vocabulary " + self.id,
+            "languages": ["en", "fi"],
+            "defaultLanguage": "en",
+            "conceptschemes": [{
+                "uri": self.namespace + "scheme",
+                "type": "http://www.w3.org/2004/02/skos/core#ConceptScheme",
+                "prefLabel": "Scheme " + self.id,
+                "title": "Scheme " + self.id
+            }]
+        }
+
+    def data(self):
+        """Return the Turtle dataset and its ETag, generated or read on first use."""
+        with self._lock:
+            if self._data is None:
+                if self.path:
+                    with open(self.path, "rb") as f:
+                        content = f.read()
+                else:
+                    content = "".join(self._generate()).encode("utf-8")
+                self._data = (content, '"' + hashlib.sha256(content).hexdigest()[:32] + '"')
+            return self._data
+
+    def concept(self, uri):
+        """Return the Turtle description of a synthetic concept or None if it does not exist."""
+        match = re.fullmatch(re.escape(self.namespace) + r"c(\d+)", uri)
+        if self.size is None or not match or int(match.group(1)) >= self.size:
+            return None
+        return PREFIXES + self._concept(int(match.group(1)))
+
+    def search(self, query):
+        if self.size is None:
+            return []
+        pattern = re.compile(re.escape(query.strip("*")).replace(r"\*", ".*"), re.IGNORECASE)
+        results = []
+        for i in range(self.size):
+            if pattern.search("Concept %d" % i):
+                results.append({
+                    "uri": self.namespace + "c%d" % i,
+                    "type": ["skos:Concept"],
+                    "prefLabel": "Concept %d" % i,
+                    "lang": "en",
+                    "vocab": self.id
+                })
+                if len(results) >= MAX_SEARCH_HITS:
+                    break
+        return results
+
+    def _generate(self):
+        yield PREFIXES
+        yield "<%sscheme> a skos:ConceptScheme ;\n    skos:prefLabel \"Scheme %s\"@en .\n\n" % (self.namespace, self.id)
+        yield "<%sgroup> a skos:Collection ;\n    skos:prefLabel \"Group\"@en .\n\n" % self.namespace
+        yield "<%sproperty> a rdf:Property ;\n    rdfs:label \"Property\"@en .\n\n" % self.namespace
+        for i in range(self.size):
+            yield self._concept(i)
+
+    def _concept(self, i):
+        ns = self.namespace
+        lines = [
+            "<%sc%d> a skos:Concept ;" % (ns, i),
+            "    skos:prefLabel \"Concept %d\"@en, \"K\\u00e4site %d\"@fi ;" % (i, i),
+            "    skos:altLabel \"Alternative %d\"@en ;" % i,
+            "    skos:inScheme <%sscheme> ;" % ns,
+            "    dcterms:modified \"2024-01-01\" ;"
+        ]
+        if i > 0:
+            lines.append("    skos:broader <%sc%d> ;" % (ns, (i - 1) // 10))
+        if i % 10 == 0:
+            lines.append("    skosxl:prefLabel <%sl%d> ;" % (ns, i))
+        lines.append("    skos:definition [ rdf:value \"Definition of concept %d\"@en ] .\n" % i)
+        if i % 10 == 0:
+            lines.append("<%sl%d> a skosxl:Label ;\n    skosxl:literalForm \"Concept %d\"@en .\n" % (ns, i, i))
+        return "\n".join(lines) + "\n"
+
+
+class Handler(BaseHTTPRequestHandler):
+    vocabularies = {}
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        path = url.path.split("/rest/v1/", 1)[-1].strip("/")
+
+        if path == "vocabularies":
+            vocabularies = [{ "id": v.id, "title": v.details()["title"] } for v in self.vocabularies.values()]
+            return self._json({ "vocabularies": vocabularies })
+
+        if path == "search":
+            results = []
+            for vocabulary in self.vocabularies.values():
+                results.extend(vocabulary.search(params.get("query", "")))
+            return self._json({ "results": results[:MAX_SEARCH_HITS] })
+
+        parts = path.split("/")
+        vocabulary = self.vocabularies.get(parts[0])
+        if vocabulary is None or len(parts) > 2:
+            return self._send(404, b"Not found", "text/plain")
+
+        if len(parts) == 1:
+            return self._json(vocabulary.details())
+        if parts[1] == "types":
+            return self._json({ "types": [
+                { "uri": "http://www.w3.org/2004/02/skos/core#Concept", "label": "Concept" },
+                { "uri": "http://www.w3.org/2004/02/skos/core#Collection", "label": "Collection" }
+            ]})
+        if parts[1] == "groups":
+            return self._json({ "groups": [
+                { "uri": vocabulary.namespace + "group", "prefLabel": "Group", "hasMembers": True }
+            ]})
+        if parts[1] == "data":
+            return self._data(vocabulary, params)
+        return self._send(404, b"Not found", "text/plain")
+
+    def _data(self, vocabulary, params):
+        mime = params.get("format", "text/turtle")
+
+        if "uri" in params:
+            description = vocabulary.concept(params["uri"])
+            if description is None:
+                return self._send(404, b"Not found", "text/plain")
+            if mime not in FORMATS:
+                return self._send(406, b"Not acceptable", "text/plain")
+            if mime == "text/turtle":
+                return self._send(200, description.encode("utf-8"), mime)
+            graph = Graph().parse(data=description, format="turtle")
+            return self._send(200, graph.serialize(format=FORMATS[mime]).encode("utf-8"), mime)
+
+        # Like SKOSMOS, downloads of other formats are redirected to a static file
+        if self.command == "HEAD" or mime != "text/turtle":
+            extension = { "application/rdf+xml": "rdf" }.get(mime, "ttl")
+            location = "http://downloads.bench.example.org/" + vocabulary.id + "." + extension
+            return self._send(302, b"", "text/plain", { "Location": location })
+
+        content, etag = vocabulary.data()
+        if self.headers.get("If-None-Match") == etag:
+            return self._send(304, b"", "text/turtle", { "ETag": etag, "Last-Modified": LAST_MODIFIED })
+        return self._send(200, content, "text/turtle; charset=utf-8", { "ETag": etag, "Last-Modified": LAST_MODIFIED, "Cache-Control": "max-age=60" })
+
+    def _json(self, data):
+        return self._send(200, json.dumps(data).encode("utf-8"), "application/json; charset=utf-8")
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD" and status != 304:
+            self.wfile.write(body)
+
+
+def load_vocabularies(sizes, recorded=None):
+    """Return the synthetic vocabularies of the sizes and the recorded ones in the directory by ID."""
+    vocabularies = {}
+    for size in sizes:
+        vocabulary = Vocabulary("bench" + str(size), size=size)
+        vocabularies[vocabulary.id] = vocabulary
+    if recorded:
+        for name in sorted(os.listdir(recorded)):
+            if name.endswith(".ttl"):
+                vocabulary = Vocabulary(name[:-len(".ttl")], path=os.path.join(recorded, name))
+                vocabularies[vocabulary.id] = vocabulary
+    return vocabularies
+
+
+def serve(host, port, vocabularies):
+    handler = type("FakeSkosmosHandler", (Handler,), { "vocabularies": vocabularies })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--sizes", default="1000", help="comma-separated concept counts of the synthetic vocabularies")
+    parser.add_argument("--recorded", help="directory of recorded vocabularies as <id>.ttl files")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    server = serve(args.host, args.port, load_vocabularies(sizes, args.recorded))
+    print("Fake SKOSMOS API at http://%s:%d/rest/v1/" % (args.host, args.port), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
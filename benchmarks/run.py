@@ -0,0 +1,292 @@
+"""Latency and throughput benchmark of the MOD API routes.
+
+Starts the fake SKOSMOS API and the Flask app unless their URLs are given,
+requests every route at the given concurrency and writes p50/p95/p99
+latency, throughput and peak RSS of the app per endpoint as JSON.
+
+    python benchmarks/run.py --sizes 1000,100000 --concurrency 8 --output results.json
+    python benchmarks/run.py --compare results.json
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_skosmos
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ROUTES = [
+    "/artefacts",
+    "/artefacts/{artefact}",
+    "/artefacts/{artefact}/distributions",
+    "/artefacts/{artefact}/distributions/1",
+    "/artefacts/{artefact}/distributions/latest",
+    "/artefacts/{artefact}/record",
+    "/artefacts/{artefact}/resources?page={page}",
+    "/artefacts/{artefact}/resources/{resource}",
+    "/artefacts/{artefact}/resources/classes",
+    "/artefacts/{artefact}/resources/concepts?page={page}",
+    "/artefacts/{artefact}/resources/concepts?page={page}&format=ttl",
+    "/artefacts/{artefact}/resources/concepts?page={page}&format=rdfxml",
+    "/artefacts/{artefact}/resources/properties",
+    "/artefacts/{artefact}/resources/individuals",
+    "/artefacts/{artefact}/resources/schemes",
+    "/artefacts/{artefact}/resources/collections",
+    "/artefacts/{artefact}/resources/labels?page={page}",
+    "/records",
+    "/search/content?q=concept+{page}",
+    "/search/metadata?q=bench"
+]
+
+PAGES = 5
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000", help="comma-separated concept counts of the synthetic vocabularies")
+    parser.add_argument("--recorded", help="directory of recorded vocabularies as <id>.ttl files")
+    parser.add_argument("--skosmos-url", help="SKOSMOS API base URL instead of a local fake server")
+    parser.add_argument("--app-url", help="URL of a running MOD API instead of starting the Flask app")
+    parser.add_argument("--app-pid", type=int, help="process ID of the running MOD API for RSS measurements")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests per endpoint")
+    parser.add_argument("--routes", help="only benchmark routes containing this string")
+    parser.add_argument("--sync", action="store_true", help="sync snapshots and the search index before the benchmark")
+    parser.add_argument("--output", help="file to write the JSON results to instead of stdout")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare p95 latencies against")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    vocabularies = fake_skosmos.load_vocabularies(sizes, args.recorded)
+
+    skosmos_url = args.skosmos_url
+    if not skosmos_url:
+        server = fake_skosmos.serve("127.0.0.1", 0, vocabularies)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        skosmos_url = "http://127.0.0.1:%d/rest/v1/" % server.server_address[1]
+
+    app_process = None
+    app_url, app_pid = args.app_url, args.app_pid
+    workdir = tempfile.mkdtemp(prefix="mod-api-bench-")
+    if not app_url:
+        env = dict(os.environ, **{
+            "API_BASE_URL": skosmos_url,
+            "SNAPSHOT_DIR": os.path.join(workdir, "snapshots"),
+            "SEARCH_INDEX_PATH": os.path.join(workdir, "search_index.sqlite3"),
+            "RESPONSE_CACHE_PATH": os.path.join(workdir, "response_cache.sqlite3")
+        })
+        if args.sync:
+            subprocess.run([sys.executable, "-m", "flask", "--app", "app", "sync-snapshots"] + list(vocabularies), cwd=ROOT, env=env, check=True)
+        port = free_port()
+        app_process = subprocess.Popen(
+            [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port), "--with-threads", "--no-reload", "--no-debugger"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        app_url, app_pid = "http://127.0.0.1:%d" % port, app_process.pid
+        wait_for(app_url)
+
+    try:
+        results = {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "concurrency": args.concurrency,
+                "requests": args.requests,
+                "sizes": sizes,
+                "skosmos_url": skosmos_url
+            },
+            "endpoints": []
+        }
+        for artefact, vocabulary in vocabularies.items():
+            for route in ROUTES:
+                if args.routes and args.routes not in route:
+                    continue
+                if "{artefact}" not in route and artefact != next(iter(vocabularies)):
+                    continue
+                result = benchmark(app_url, app_pid, route, artefact, vocabulary, args.concurrency, args.requests, args.warmup)
+                results["endpoints"].append(result)
+                print(summary(result), file=sys.stderr, flush=True)
+        results["meta"]["peak_rss_bytes"] = read_status(app_pid, "VmHWM")
+    finally:
+        if app_process:
+            app_process.terminate()
+            app_process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+def benchmark(app_url, app_pid, route, artefact, vocabulary, concurrency, count, warmup):
+    session = threading.local()
+
+    def fetch(i):
+        if not hasattr(session, "http"):
+            session.http = requests.Session()
+        url = app_url + route.format(
+            artefact=artefact,
+            page=i % PAGES + 1,
+            resource=vocabulary.namespace + "c%d" % (i % (vocabulary.size or 1))
+        )
+        start = time.perf_counter()
+        try:
+            response = session.http.get(url)
+            status = response.status_code
+        except requests.RequestException:
+            status = None
+        return time.perf_counter() - start, status
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(fetch, range(warmup)))
+
+        sampler = RSSSampler(app_pid)
+        sampler.start()
+        start = time.perf_counter()
+        timings = list(executor.map(fetch, range(count)))
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+
+    latencies = sorted(t for t, _ in timings)
+    statuses = {}
+    for _, status in timings:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    return {
+        "endpoint": "GET " + route.format(artefact=artefact, page="{page}", resource="{resource}"),
+        "artefact": artefact,
+        "concepts": vocabulary.size,
+        "requests": count,
+        "errors": sum(n for status, n in statuses.items() if not status.startswith(("2", "3"))),
+        "statuses": statuses,
+        "throughput": count / elapsed,
+        "latency_ms": {
+            "mean": 1000 * sum(latencies) / len(latencies),
+            "p50": 1000 * percentile(latencies, 50),
+            "p95": 1000 * percentile(latencies, 95),
+            "p99": 1000 * percentile(latencies, 99),
+            "max": 1000 * latencies[-1]
+        },
+        "peak_rss_bytes": sampler.peak
+    }
+
+
+def percentile(values, p):
+    # Nearest-rank percentile of sorted values
+    index = max(0, -(-len(values) * p // 100) - 1)
+    return values[int(index)]
+
+
+class RSSSampler:
+    """Samples the resident set size of a process on Linux."""
+
+    def __init__(self, pid, interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._sample()
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self._sample()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        rss = read_status(self.pid, "VmRSS")
+        if rss is not None:
+            self.peak = max(self.peak or 0, rss)
+
+
+def read_status(pid, field):
+    """Return a memory field of /proc/<pid>/status in bytes or None if it cannot be read."""
+    if pid is None:
+        return None
+    try:
+        with open("/proc/%d/status" % pid) as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def summary(result):
+    return "%-80s %8.1f req/s  p50 %8.1f ms  p95 %8.1f ms  p99 %8.1f ms  errors %d" % (
+        result["endpoint"], result["throughput"], result["latency_ms"]["p50"],
+        result["latency_ms"]["p95"], result["latency_ms"]["p99"], result["errors"]
+    )
+
+
+def compare(previous, current):
+    baseline = { r["endpoint"]: r for r in previous["endpoints"] }
+    print("p95 latency against %s:" % previous["meta"].get("commit"), file=sys.stderr)
+    for result in current["endpoints"]:
+        before = baseline.get(result["endpoint"])
+        if before is None:
+            continue
+        ratio = result["latency_ms"]["p95"] / max(before["latency_ms"]["p95"], 1e-9)
+        print("%-80s %8.1f ms -> %8.1f ms (%+.0f%%)" % (
+            result["endpoint"], before["latency_ms"]["p95"], result["latency_ms"]["p95"], 100 * (ratio - 1)
+        ), file=sys.stderr)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url + "/artefacts", timeout=5)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError("The app did not start at " + url)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import zlib
+
+
+# Content codings that response bodies can be compressed with, by preference.
+# br needs the optional brotli package and zstd the zstandard package.
+CODINGS = ["zstd", "br", "gzip"]
+
+OPTIONAL_MODULES = {
+    "br": "brotli",
+    "zstd": "zstandard"
+}
+
+
+def available_codings(preferred=CODINGS):
+    """Return the codings of preferred whose compression modules are installed."""
+    codings = []
+    for coding in preferred:
+        if coding not in CODINGS:
+            continue
+        if coding in OPTIONAL_MODULES:
+            try:
+                __import__(OPTIONAL_MODULES[coding])
+            except ImportError:
+                continue
+        codings.append(coding)
+    return codings
+
+
+def negotiate(accept_encoding, codings):
+    """Return the preferred coding of the Accept-Encoding header value among codings or None for identity."""
+    qualities = {}
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+
+    best = None
+    for coding in codings:
+        quality = qualities.get(coding, qualities.get("*", 0.0))
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (coding, quality)
+    return best[0] if best else None
+
+
+def compress(data, coding, level):
+    if coding == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if coding == "br":
+        import brotli
+        return brotli.compress(data, quality=level)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks, coding, level):
+    """Compress an iterable of text or byte chunks, flushing after every chunk so clients receive data as it is produced."""
+    if coding == "zstd":
+        import zstandard
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        process = compressor.compress
+        flush, finish = lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), compressor.flush
+    elif coding == "br":
+        import brotli
+        compressor = brotli.Compressor(quality=level)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process = compressor.compress
+        flush, finish = lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = process(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
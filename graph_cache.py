@@ -0,0 +1,306 @@
+import atexit
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from instrumentation import timed
+from snapshot_store import build_snapshot, download, Snapshot, SnapshotFormatError
+
+
+class GraphCacheBusy(Exception):
+    """Raised when a dataset load is shed because max_queued loads are already waiting."""
+
+
+class GraphCache:
+    """Process-wide LRU cache of parsed and indexed vocabulary datasets keyed by artefact ID.
+
+    Entries are revalidated against the upstream ETag/Last-Modified once their
+    TTL has passed and concurrent requests for the same artefact share a single
+    download and parse.
+
+    Datasets are streamed to disk and parsed into temporary snapshots in
+    snapshot_dir, in worker processes if there is a parse pool. Snapshots are
+    memory-mapped and their file size counts towards the memory budget.
+    Without a snapshot_dir they go to a temporary directory removed at exit.
+
+    At most max_loads datasets are loaded at a time and at most max_queued
+    loads wait for their turn, further loads raise GraphCacheBusy. The limits
+    are per process, so worker processes may load up to max_loads datasets
+    each. Processes sharing snapshot_dir load an artefact one at a time, and
+    a process that finds a snapshot another one has loaded within the TTL
+    maps it instead of downloading the dataset again.
+
+    Every artefact has a lock file and a file that tells where its snapshot
+    is in snapshot_dir. The lock file is kept for good, as a lock file removed
+    while another process waits for it would let two processes load the
+    artefact at once. The other file is removed with the snapshot.
+    """
+
+    def __init__(self, http, max_bytes, ttl, parse_pool=None, snapshot_dir=None, max_loads=2, max_queued=16):
+        self.http = http
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.parse_pool = parse_pool
+        self.snapshot_dir = snapshot_dir
+        self.max_loads = max_loads
+        self.max_queued = max_queued
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._size = 0
+        self._active = 0
+        self._queued = 0
+        self._shed = 0
+        self._lock = threading.Lock()
+        self._slots = threading.Condition(self._lock)
+
+    def get(self, artefact_id):
+        """Return the Snapshot of the artefact or None if it does not exist."""
+        with self._lock:
+            entry = self._entries.get(artefact_id)
+            if entry and time.monotonic() - entry["checked"] < self.ttl:
+                self._entries.move_to_end(artefact_id)
+                return entry["index"]
+
+            flight = self._loading.get(artefact_id)
+            leader = flight is None
+            if leader:
+                flight = Future()
+                self._loading[artefact_id] = flight
+
+        if not leader:
+            return flight.result()
+
+        try:
+            index = self._load(artefact_id, entry)
+            flight.set_result(index)
+            return index
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._loading[artefact_id]
+
+    def peek(self, artefact_id):
+        """Return the Snapshot of the artefact if it is cached and fresh, without downloading it otherwise."""
+        with self._lock:
+            entry = self._entries.get(artefact_id)
+            if entry and time.monotonic() - entry["checked"] < self.ttl:
+                self._entries.move_to_end(artefact_id)
+                return entry["index"]
+        return None
+
+    def invalidate(self, artefact_id):
+        with self._lock:
+            self._remove(artefact_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "loading": len(self._loading),
+                "loads": self._active,
+                "max_loads": self.max_loads,
+                "queued": self._queued,
+                "max_queued": self.max_queued,
+                "shed": self._shed
+            }
+
+    def _load(self, artefact_id, entry):
+        with self._lock:
+            if self.snapshot_dir is None:
+                self.snapshot_dir = tempfile.mkdtemp(prefix="mod-api-graphs-")
+                # A directory of this process alone, its snapshots cannot be used after it exits
+                atexit.register(shutil.rmtree, self.snapshot_dir, True)
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+
+        self._admit()
+        try:
+            with self._artefact_lock(artefact_id):
+                index = self._join(artefact_id, entry)
+                if index is None:
+                    index = self._fetch(artefact_id, entry)
+                return index
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._slots.notify()
+
+    def _admit(self):
+        with self._lock:
+            if self._active >= self.max_loads:
+                if self._queued >= self.max_queued:
+                    self._shed += 1
+                    raise GraphCacheBusy("Too many vocabulary datasets are being loaded")
+                self._queued += 1
+                try:
+                    while self._active >= self.max_loads:
+                        self._slots.wait()
+                finally:
+                    self._queued -= 1
+            self._active += 1
+
+    @contextmanager
+    def _artefact_lock(self, artefact_id):
+        with open(os.path.join(self.snapshot_dir, artefact_id + ".lock"), "a") as f:
+            # Released when the file is closed
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _join(self, artefact_id, entry):
+        """Return the snapshot of the artefact if a process sharing snapshot_dir has loaded or revalidated it within the TTL."""
+        try:
+            with open(self._shared_path(artefact_id)) as f:
+                shared = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        age = time.time() - shared["checked"]
+        if age >= self.ttl:
+            return None
+
+        if entry and entry["path"] == shared["path"]:
+            with self._lock:
+                entry["checked"] = time.monotonic() - age
+                if artefact_id in self._entries:
+                    self._entries.move_to_end(artefact_id)
+            return entry["index"]
+
+        try:
+            index = Snapshot(shared["path"])
+        except OSError:
+            # The process that loaded it has evicted it
+            return None
+        except SnapshotFormatError:
+            # Loaded by a process of another version
+            return None
+
+        # The process that loaded the snapshot removes its file, mappings of it stay valid
+        self._add(artefact_id, {
+            "etag": shared["etag"],
+            "last_modified": shared["last_modified"],
+            "checked": time.monotonic() - age,
+            "index": index,
+            "path": shared["path"],
+            "size": os.path.getsize(shared["path"]),
+            "joined": True
+        })
+        return index
+
+    def _shared_path(self, artefact_id):
+        return os.path.join(self.snapshot_dir, artefact_id + ".json")
+
+    def _share(self, artefact_id, entry):
+        shared = {
+            "path": entry["path"],
+            "etag": entry["etag"],
+            "last_modified": entry["last_modified"],
+            "checked": time.time()
+        }
+        path = self._shared_path(artefact_id)
+        with open(path + ".tmp", "w") as f:
+            json.dump(shared, f)
+        os.replace(path + ".tmp", path)
+
+    def _fetch(self, artefact_id, entry):
+        # The snapshot of the entry may have been removed since, by this process or the one that loaded it
+        if entry and not os.path.exists(entry["path"]):
+            entry = None
+
+        headers = {}
+        if entry:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        # Every load gets a file of its own, so requests still reading an evicted snapshot keep their mapping
+        path = os.path.join(self.snapshot_dir, artefact_id + "-" + uuid.uuid4().hex + ".snapshot")
+
+        try:
+            with timed("upstream"):
+                with self.http.get(artefact_id + "/data", params={"lang": "en", "format": "text/turtle"}, headers=headers, stream=True) as ret:
+                    if ret.status_code == 304 and entry:
+                        if not os.path.exists(entry["path"]):
+                            # Removed while revalidating, it must not be shared again
+                            return self._fetch(artefact_id, None)
+                        with self._lock:
+                            entry["checked"] = time.monotonic()
+                            if artefact_id in self._entries:
+                                self._entries.move_to_end(artefact_id)
+                        self._share(artefact_id, entry)
+                        return entry["index"]
+
+                    if ret.status_code == 404:
+                        self.invalidate(artefact_id)
+                        return None
+
+                    ret.raise_for_status()
+                    digest = download(ret, path + ".ttl")
+
+            new_entry = {
+                "etag": ret.headers.get("ETag"),
+                "last_modified": ret.headers.get("Last-Modified"),
+                "checked": time.monotonic()
+            }
+            metadata = {
+                "artefact": artefact_id,
+                "etag": new_entry["etag"],
+                "last_modified": new_entry["last_modified"],
+                "hash": digest
+            }
+            with timed("parse"):
+                if self.parse_pool is not None:
+                    self.parse_pool.submit(build_snapshot, path + ".ttl", path, metadata).result()
+                else:
+                    build_snapshot(path + ".ttl", path, metadata)
+        finally:
+            if os.path.exists(path + ".ttl"):
+                os.remove(path + ".ttl")
+
+        index = Snapshot(path)
+        new_entry.update(index=index, path=path, size=os.path.getsize(path))
+        self._add(artefact_id, new_entry)
+        self._share(artefact_id, new_entry)
+
+        return index
+
+    def _add(self, artefact_id, entry):
+        with self._lock:
+            self._remove(artefact_id)
+            self._entries[artefact_id] = entry
+            self._size += entry["size"]
+            # Evict least recently used graphs but always keep the one just loaded
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, artefact_id):
+        entry = self._entries.pop(artefact_id, None)
+        if entry:
+            self._size -= entry["size"]
+            if entry.get("path") and not entry.get("joined"):
+                try:
+                    os.remove(entry["path"])
+                except OSError:
+                    pass
+                self._unshare(artefact_id, entry["path"])
+
+    def _unshare(self, artefact_id, path):
+        # Unless another process has shared a newer snapshot of the artefact since
+        try:
+            with open(self._shared_path(artefact_id)) as f:
+                shared = json.load(f)
+            if shared["path"] == path:
+                os.remove(self._shared_path(artefact_id))
+        except (OSError, ValueError):
+            pass
@@ -0,0 +1,285 @@
+from contextlib import contextmanager
+import cProfile
+import os
+import random
+import threading
+import time
+
+from upstream import LATENCY_BUCKETS
+
+
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2, 1024 ** 3)
+
+_local = threading.local()
+
+
+class RequestTimer:
+    """Durations of the stages of the request handled by the current thread."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    def add(self, stage, duration):
+        self.stages[stage] = self.stages.get(stage, 0.0) + duration
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self):
+        timings = ["%s;dur=%.1f" % (stage, 1000 * duration) for stage, duration in self.stages.items()]
+        timings.append("total;dur=%.1f" % (1000 * self.elapsed()))
+        return ", ".join(timings)
+
+
+def start_request():
+    _local.timer = RequestTimer()
+    return _local.timer
+
+
+def current_request():
+    return getattr(_local, "timer", None)
+
+
+def end_request():
+    _local.timer = None
+
+
+@contextmanager
+def timed(stage):
+    """Add the duration of the block to the stage of the current request, if any."""
+    timer = getattr(_local, "timer", None)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timer is not None:
+            timer.add(stage, time.perf_counter() - start)
+
+
+def timed_chunks(chunks, timer, stage, on_close):
+    """Wrap a response body iterable, adding the time spent producing chunks to the stage.
+
+    on_close is called with the number of bytes in the body once it has been sent.
+    """
+    size = 0
+    iterator = iter(chunks)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                timer.add(stage, time.perf_counter() - start)
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            size += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+        on_close(size)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class Metrics:
+    """Per-route request, stage and response size metrics in the Prometheus text format."""
+
+    def __init__(self):
+        self._requests = {}
+        self._durations = {}
+        self._stages = {}
+        self._sizes = {}
+        self._slow = 0
+        self._lock = threading.Lock()
+
+    def observe(self, route, method, status, timer, size):
+        with self._lock:
+            key = (route, method, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self._durations.setdefault(route, Histogram(LATENCY_BUCKETS)).observe(timer.elapsed())
+            for stage, duration in timer.stages.items():
+                self._stages.setdefault((route, stage), Histogram(LATENCY_BUCKETS)).observe(duration)
+            if size is not None:
+                self._sizes.setdefault(route, Histogram(SIZE_BUCKETS)).observe(size)
+
+    def observe_slow(self):
+        with self._lock:
+            self._slow += 1
+
+    def render(self, upstream_metrics, response_cache_stats, graph_cache_stats, rendered_cache_stats, snapshots):
+        lines = []
+        with self._lock:
+            family(lines, "mod_api_requests_total", "counter", "Handled requests")
+            for (route, method, status), count in sorted(self._requests.items()):
+                sample(lines, "mod_api_requests_total", { "route": route, "method": method, "status": status }, count)
+
+            family(lines, "mod_api_request_duration_seconds", "histogram", "Request duration including streaming the response")
+            for route, histogram in sorted(self._durations.items()):
+                histogram_samples(lines, "mod_api_request_duration_seconds", { "route": route }, histogram.buckets, histogram.counts, histogram.count, histogram.sum)
+
+            family(lines, "mod_api_stage_duration_seconds", "histogram", "Duration of request stages")
+            for (route, stage), histogram in sorted(self._stages.items()):
+                histogram_samples(lines, "mod_api_stage_duration_seconds", { "route": route, "stage": stage }, histogram.buckets, histogram.counts, histogram.count, histogram.sum)
+
+            family(lines, "mod_api_response_size_bytes", "histogram", "Response body size")
+            for route, histogram in sorted(self._sizes.items()):
+                histogram_samples(lines, "mod_api_response_size_bytes", { "route": route }, histogram.buckets, histogram.counts, histogram.count, histogram.sum)
+
+            family(lines, "mod_api_slow_requests_total", "counter", "Requests slower than the profiling threshold")
+            sample(lines, "mod_api_slow_requests_total", {}, self._slow)
+
+        family(lines, "mod_api_upstream_responses_total", "counter", "Upstream responses by status code")
+        for status, count in sorted(upstream_metrics["statuses"].items()):
+            sample(lines, "mod_api_upstream_responses_total", { "status": str(status) }, count)
+        family(lines, "mod_api_upstream_errors_total", "counter", "Upstream requests that failed without a response")
+        sample(lines, "mod_api_upstream_errors_total", {}, upstream_metrics["errors"])
+        family(lines, "mod_api_upstream_in_flight", "gauge", "Upstream requests in flight")
+        sample(lines, "mod_api_upstream_in_flight", {}, upstream_metrics["in_flight"])
+        family(lines, "mod_api_upstream_request_duration_seconds", "histogram", "Upstream request duration")
+        for method, histogram in sorted(upstream_metrics["latency"].items()):
+            histogram_samples(lines, "mod_api_upstream_request_duration_seconds", { "method": method }, upstream_metrics["latency_buckets"], histogram["buckets"], histogram["count"], histogram["sum"])
+        for name, value in upstream_metrics["pool"].items():
+            family(lines, "mod_api_upstream_pool_" + name, "gauge", "Upstream connection pool " + name.replace("_", " "))
+            sample(lines, "mod_api_upstream_pool_" + name, {}, value)
+
+        family(lines, "mod_api_response_cache_events_total", "counter", "Upstream response cache lookups by outcome")
+        for event, count in sorted(response_cache_stats.items()):
+            if event != "entries":
+                sample(lines, "mod_api_response_cache_events_total", { "event": event }, count)
+        family(lines, "mod_api_response_cache_entries", "gauge", "Stored upstream responses")
+        sample(lines, "mod_api_response_cache_entries", {}, response_cache_stats["entries"])
+
+        for name, value in graph_cache_stats.items():
+            if name == "shed":
+                continue
+            family(lines, "mod_api_graph_cache_" + name, "gauge", "Parsed vocabulary dataset cache " + name.replace("_", " "))
+            sample(lines, "mod_api_graph_cache_" + name, {}, value)
+        family(lines, "mod_api_graph_cache_shed_total", "counter", "Dataset loads shed with 503 because the load queue was full")
+        sample(lines, "mod_api_graph_cache_shed_total", {}, graph_cache_stats["shed"])
+
+        family(lines, "mod_api_rendered_cache_events_total", "counter", "Rendered response cache events")
+        for event in ("hits", "misses", "stored", "evicted"):
+            sample(lines, "mod_api_rendered_cache_events_total", { "event": event }, rendered_cache_stats[event])
+        for name in ("entries", "bytes", "max_bytes"):
+            family(lines, "mod_api_rendered_cache_" + name, "gauge", "Rendered response cache " + name.replace("_", " "))
+            sample(lines, "mod_api_rendered_cache_" + name, {}, rendered_cache_stats[name])
+
+        family(lines, "mod_api_snapshot_bytes", "gauge", "Size of vocabulary snapshots")
+        for artefact_id, size in sorted(snapshots.items()):
+            sample(lines, "mod_api_snapshot_bytes", { "artefact": artefact_id }, size)
+
+        return "\n".join(lines) + "\n"
+
+
+class SlowRequestProfiler:
+    """Profiles a sample of requests and keeps the profiles of those slower than the threshold.
+
+    Profiles are written to the directory as cProfile .prof files, or as
+    pyinstrument HTML when pyinstrument is the chosen profiler.
+    """
+
+    def __init__(self, directory, threshold, sample_rate, profiler="cprofile"):
+        self.directory = directory
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.profiler = profiler
+        # Only one profiler can be active in a process at a time
+        self._active = threading.Lock()
+
+    def start(self):
+        """Return a running profiler for the current request or None if it is not sampled."""
+        if self.threshold <= 0 or random.random() >= self.sample_rate:
+            return None
+        if not self._active.acquire(blocking=False):
+            return None
+
+        try:
+            if self.profiler == "pyinstrument":
+                import pyinstrument
+                profile = pyinstrument.Profiler(async_mode="disabled")
+                profile.start()
+            else:
+                profile = cProfile.Profile()
+                profile.enable()
+            return profile
+        except Exception:
+            self._active.release()
+            raise
+
+    def stop(self, profile, route, elapsed):
+        """Stop the profiler and return the path of the written profile or None if the request was fast."""
+        try:
+            if self.profiler == "pyinstrument":
+                profile.stop()
+            else:
+                profile.disable()
+        finally:
+            self._active.release()
+
+        if elapsed < self.threshold:
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        name = "%s-%dms-%s" % (
+            time.strftime("%Y%m%dT%H%M%S"),
+            int(elapsed * 1000),
+            route.strip("/").replace("/", "_").replace("<", "").replace(">", "")
+        )
+        if self.profiler == "pyinstrument":
+            path = os.path.join(self.directory, name + ".html")
+            with open(path, "w") as f:
+                f.write(profile.output_html())
+        else:
+            path = os.path.join(self.directory, name + ".prof")
+            profile.dump_stats(path)
+        return path
+
+
+def family(lines, name, metric_type, description):
+    lines.append("# HELP " + name + " " + description)
+    lines.append("# TYPE " + name + " " + metric_type)
+
+
+def sample(lines, name, labels, value):
+    if labels:
+        name += "{" + ",".join('%s="%s"' % (k, escape_label(v)) for k, v in labels.items()) + "}"
+    lines.append(name + " " + format_value(value))
+
+
+def histogram_samples(lines, name, labels, buckets, counts, count, total):
+    # Bucket counts are stored per bucket, Prometheus buckets are cumulative
+    cumulative = 0
+    for bound, bucket_count in zip(buckets, counts):
+        cumulative += bucket_count
+        sample(lines, name + "_bucket", dict(labels, le=format_value(bound)), cumulative)
+    sample(lines, name + "_bucket", dict(labels, le="+Inf"), count)
+    sample(lines, name + "_sum", labels, total)
+    sample(lines, name + "_count", labels, count)
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,91 @@
+from collections import OrderedDict
+import threading
+
+
+class RenderedCache:
+    """Process-wide LRU cache of serialized API responses keyed by their ETag.
+
+    ETags are derived from the request URL and the version of the data a
+    response is built from, so responses of a changed snapshot or dataset are
+    never served and their entries age out of the cache. Compressed variants
+    of a response are stored alongside its uncompressed body, and the total
+    size of all stored bodies is bounded by max_bytes.
+    """
+
+    def __init__(self, max_bytes, max_entry_bytes):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._counters = { "hits": 0, "misses": 0, "stored": 0, "evicted": 0 }
+
+    def get(self, key):
+        """Return the stored (bodies, headers) of the key with bodies by content coding, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return dict(entry["bodies"]), entry["headers"]
+
+    def set(self, key, body, headers):
+        if len(body) > self.max_entry_bytes:
+            return
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = { "bodies": { "identity": body }, "headers": headers }
+            self._size += len(body)
+            self._counters["stored"] += 1
+            self._evict()
+
+    def add_variant(self, key, coding, body):
+        """Store the body of a stored response in another content coding."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or coding in entry["bodies"]:
+                return
+            entry["bodies"][coding] = body
+            self._size += len(body)
+            self._evict()
+
+    def capture(self, key, chunks, headers):
+        """Wrap a streamed response body and store it once it has been sent completely."""
+        parts = []
+        size = 0
+        complete = False
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                if parts is not None:
+                    size += len(chunk)
+                    # Bodies too large to store are not buffered any further
+                    if size <= self.max_entry_bytes:
+                        parts.append(chunk)
+                    else:
+                        parts = None
+                yield chunk
+            complete = True
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+            if complete and parts is not None:
+                self.set(key, b"".join(parts), headers)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries), bytes=self._size, max_bytes=self.max_bytes)
+
+    def _evict(self):
+        while self._size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self._counters["evicted"] += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._size -= sum(len(body) for body in entry["bodies"].values())
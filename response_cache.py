@@ -0,0 +1,277 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from requests.structures import CaseInsensitiveDict
+
+
+STORED_HEADERS = ("Cache-Control", "Content-Type", "ETag", "Last-Modified", "Location")
+
+
+class CachedResponse:
+    """Stored upstream response with the parts of the requests.Response interface the routes use."""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class MemoryBackend:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """Response store in a SQLite database that can be shared by several worker processes."""
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._connection() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    status INTEGER NOT NULL,
+                    headers TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    fresh_until REAL NOT NULL,
+                    stale_until REAL NOT NULL
+                )
+            """)
+
+    def get(self, key):
+        row = self._connection().execute("SELECT status, headers, body, fresh_until, stale_until FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "status": row[0],
+            "headers": json.loads(row[1]),
+            "body": row[2],
+            "fresh_until": row[3],
+            "stale_until": row[4]
+        }
+
+    def set(self, key, entry):
+        with self._connection() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, entry["status"], json.dumps(entry["headers"]), entry["body"], entry["fresh_until"], entry["stale_until"])
+            )
+            db.execute("DELETE FROM responses WHERE stale_until < ?", (time.time(),))
+            db.execute("DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY stale_until DESC LIMIT ?)", (self.max_entries,))
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        """Close the connection of the current thread, connections must not be used by forked processes."""
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+
+class ResponseCache:
+    """HTTP response cache in front of an UpstreamClient.
+
+    Calls matching a policy are served from the backend while fresh. Stale
+    responses are served within the stale-while-revalidate window while they
+    are refreshed in the background, and revalidated with a conditional
+    request after it. Upstream Cache-Control max-age, stale-while-revalidate
+    and no-store directives override the policy. Concurrent misses of the
+    same call share a single upstream request, and the callers that joined
+    it get copies of its status, headers and content. Other calls are passed
+    through to the client unchanged.
+    """
+
+    def __init__(self, client, backend, policies, negative_ttl):
+        self.client = client
+        self.backend = backend
+        self.policies = [(method, re.compile(pattern), ttl, stale) for method, pattern, ttl, stale in policies]
+        self.negative_ttl = negative_ttl
+        self._refreshing = set()
+        self._fetching = {}
+        self._lock = threading.Lock()
+        self._counters = { "hits": 0, "stale_hits": 0, "negative_hits": 0, "misses": 0, "joined": 0, "revalidated": 0, "bypassed": 0 }
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def head(self, path, **kwargs):
+        return self.request("HEAD", path, **kwargs)
+
+    def map(self, fn, items):
+        return self.client.map(fn, items)
+
+    def metrics(self):
+        return self.client.metrics()
+
+    def request(self, method, path, params=None, **kwargs):
+        policy = self._policy(method, path)
+        if policy is None or kwargs.get("headers"):
+            self._count("bypassed")
+            return self.client.request(method, path, params=params, **kwargs)
+
+        key = method + " " + path + "?" + "&".join(k + "=" + str(v) for k, v in sorted((params or {}).items()))
+        entry = self.backend.get(key)
+        now = time.time()
+
+        if entry and now < entry["fresh_until"]:
+            self._count("negative_hits" if entry["status"] == 404 else "hits")
+            return self._response(entry)
+
+        if entry and now < entry["stale_until"]:
+            self._count("stale_hits")
+            self._refresh_in_background(key, policy, method, path, params, entry, kwargs)
+            return self._response(entry)
+
+        with self._lock:
+            flight = self._fetching.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._fetching[key] = Future()
+        if not leader:
+            self._count("joined")
+            # Every caller gets a response of its own, only the leader's is read from upstream
+            return CachedResponse(*flight.result())
+
+        self._count("misses")
+        try:
+            ret = self._fetch(key, policy, method, path, params, entry, kwargs)
+            flight.set_result((ret.status_code, dict(ret.headers), ret.content))
+            return ret
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._fetching[key]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, entries=len(self.backend))
+
+    def _fetch(self, key, policy, method, path, params, entry, kwargs):
+        headers = {}
+        if entry:
+            if entry["headers"].get("ETag"):
+                headers["If-None-Match"] = entry["headers"]["ETag"]
+            if entry["headers"].get("Last-Modified"):
+                headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+
+        ret = self.client.request(method, path, params=params, headers=headers, **kwargs)
+
+        if ret.status_code == 304 and entry:
+            self._count("revalidated")
+            self._store(key, policy, entry["status"], entry["headers"], entry["body"], ret.headers.get("Cache-Control", ""))
+            return self._response(entry)
+
+        if ret.status_code in (200, 302, 404):
+            stored_headers = { h: ret.headers[h] for h in STORED_HEADERS if h in ret.headers }
+            self._store(key, policy, ret.status_code, stored_headers, ret.content, ret.headers.get("Cache-Control", ""))
+
+        return ret
+
+    def _store(self, key, policy, status, headers, body, cache_control):
+        directives = parse_cache_control(cache_control)
+        if "no-store" in directives:
+            return
+
+        ttl, stale = policy[2], policy[3]
+        if status == 404:
+            ttl, stale = self.negative_ttl, 0
+        elif "no-cache" in directives:
+            ttl = 0
+        elif directives.get("max-age", "").isdigit():
+            ttl = int(directives["max-age"])
+        if directives.get("stale-while-revalidate", "").isdigit():
+            stale = int(directives["stale-while-revalidate"])
+
+        now = time.time()
+        self.backend.set(key, {
+            "status": status,
+            "headers": headers,
+            "body": body,
+            "fresh_until": now + ttl,
+            "stale_until": now + ttl + stale
+        })
+
+    def _refresh_in_background(self, key, policy, method, path, params, entry, kwargs):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._fetch(key, policy, method, path, params, entry, kwargs)
+            except Exception:
+                # The stale response stays in use until the next attempt
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _policy(self, method, path):
+        for policy in self.policies:
+            if policy[0] == method and policy[1].fullmatch(path):
+                return policy
+        return None
+
+    def _response(self, entry):
+        return CachedResponse(entry["status"], entry["headers"], entry["body"])
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+
+def parse_cache_control(value):
+    directives = {}
+    for directive in value.split(","):
+        name, _, argument = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"')
+    return directives
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import sqlite3
+import threading
+
+from rdflib.namespace import RDF, SKOS
+
+
+LABEL_PROPERTIES = (SKOS.prefLabel, SKOS.altLabel, SKOS.hiddenLabel)
+
+
+class SearchIndex:
+    """SQLite FTS5 index over the labels of synced vocabularies and over artefact metadata.
+
+    Vocabularies are reindexed only when their snapshot or artefact details change.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as db:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS artefacts (
+                    id INTEGER PRIMARY KEY,
+                    artefact TEXT UNIQUE NOT NULL,
+                    version TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    languages TEXT NOT NULL,
+                    details TEXT NOT NULL
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS artefacts_fts USING fts5(
+                    title, artefact, languages, content='artefacts', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                );
+                CREATE TABLE IF NOT EXISTS labels (
+                    id INTEGER PRIMARY KEY,
+                    artefact TEXT NOT NULL,
+                    uri TEXT NOT NULL,
+                    property TEXT NOT NULL,
+                    label TEXT NOT NULL,
+                    lang TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS labels_artefact ON labels (artefact);
+                CREATE INDEX IF NOT EXISTS labels_uri ON labels (uri);
+                CREATE VIRTUAL TABLE IF NOT EXISTS labels_fts USING fts5(
+                    label, content='labels', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                );
+                CREATE TABLE IF NOT EXISTS types (
+                    artefact TEXT NOT NULL,
+                    uri TEXT NOT NULL,
+                    type TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS types_artefact ON types (artefact);
+                CREATE INDEX IF NOT EXISTS types_uri ON types (uri);
+            """)
+
+    def is_empty(self):
+        return self._connection().execute("SELECT COUNT(*) FROM artefacts").fetchone()[0] == 0
+
+    def version(self, artefact_id):
+        row = self._connection().execute("SELECT version FROM artefacts WHERE artefact = ?", (artefact_id,)).fetchone()
+        return row[0] if row else None
+
+    def generation(self):
+        """Return a string that changes whenever any vocabulary is reindexed or removed."""
+        rows = self._connection().execute("SELECT artefact, version FROM artefacts ORDER BY artefact").fetchall()
+        return hashlib.sha256(json.dumps(rows).encode("utf-8")).hexdigest()
+
+    def update(self, artefact_id, snapshot, details):
+        """Reindex the labels of the snapshot and the artefact details if either has changed."""
+        version = snapshot.header["hash"] + ":" + hashlib.sha256(json.dumps(details, sort_keys=True).encode("utf-8")).hexdigest()
+        if self.version(artefact_id) == version:
+            return False
+
+        labels = []
+        labeled = set()
+        for prop in LABEL_PROPERTIES:
+            for s, o in snapshot.subject_objects(prop):
+                labels.append((artefact_id, str(s), str(prop), str(o), getattr(o, "language", None) or ""))
+                labeled.add(s)
+        types = [(artefact_id, str(s), str(o)) for s, o in snapshot.subject_objects(RDF.type) if s in labeled]
+
+        with self._connection() as db:
+            self._delete(db, artefact_id)
+            db.execute(
+                "INSERT INTO artefacts (artefact, version, title, languages, details) VALUES (?, ?, ?, ?, ?)",
+                (artefact_id, version, details.get("title", ""), " ".join(details.get("languages", [])), json.dumps(details))
+            )
+            db.execute(
+                "INSERT INTO artefacts_fts (rowid, title, artefact, languages) SELECT id, title, artefact, languages FROM artefacts WHERE artefact = ?",
+                (artefact_id,)
+            )
+            db.executemany("INSERT INTO labels (artefact, uri, property, label, lang) VALUES (?, ?, ?, ?, ?)", labels)
+            db.execute("INSERT INTO labels_fts (rowid, label) SELECT id, label FROM labels WHERE artefact = ?", (artefact_id,))
+            db.executemany("INSERT INTO types (artefact, uri, type) VALUES (?, ?, ?)", types)
+        return True
+
+    def remove(self, artefact_id):
+        with self._connection() as db:
+            self._delete(db, artefact_id)
+
+    def search_content(self, q, lang, start, limit, after=None):
+        """Return the number of resources with a label matching q and the resources of the requested window.
+
+        The window starts after the URI given in after, or at the offset start if it is None.
+        """
+        match = fts_query(q)
+        if match is None:
+            return 0, []
+
+        where = "labels_fts MATCH ?"
+        args = [match]
+        if lang:
+            where += " AND labels.lang = ?"
+            args.append(lang)
+
+        db = self._connection()
+        matches = "SELECT DISTINCT labels.uri FROM labels_fts JOIN labels ON labels.id = labels_fts.rowid WHERE " + where
+        count = db.execute("SELECT COUNT(*) FROM (" + matches + ")", args).fetchone()[0]
+        if after is not None:
+            matches += " AND labels.uri > ?"
+            args = args + [after]
+            start = 0
+        uris = [row[0] for row in db.execute(matches + " ORDER BY labels.uri LIMIT ? OFFSET ?", args + [limit, start])]
+
+        results = []
+        for uri in uris:
+            label_args = [uri] + ([lang] if lang else [])
+            labels = db.execute(
+                "SELECT DISTINCT property, label, lang FROM labels WHERE uri = ?" + (" AND lang = ?" if lang else ""),
+                label_args
+            ).fetchall()
+            types = [row[0] for row in db.execute("SELECT DISTINCT type FROM types WHERE uri = ?", (uri,))]
+            results.append({ "uri": uri, "labels": labels, "types": types })
+
+        return count, results
+
+    def search_metadata(self, q, start, limit, after=None):
+        """Return the number of artefacts with metadata matching q and the artefact details of the requested window.
+
+        The window starts after the artefact ID given in after, or at the offset start if it is None.
+        """
+        match = fts_query(q)
+        if match is None:
+            return 0, []
+
+        db = self._connection()
+        matches = "FROM artefacts_fts JOIN artefacts ON artefacts.id = artefacts_fts.rowid WHERE artefacts_fts MATCH ?"
+        count = db.execute("SELECT COUNT(*) " + matches, (match,)).fetchone()[0]
+        args = [match]
+        if after is not None:
+            matches += " AND artefacts.artefact > ?"
+            args.append(after)
+            start = 0
+        rows = db.execute("SELECT artefacts.details " + matches + " ORDER BY artefacts.artefact LIMIT ? OFFSET ?", args + [limit, start])
+        return count, [json.loads(row[0]) for row in rows]
+
+    def _delete(self, db, artefact_id):
+        # External content FTS tables need the old values of deleted rows
+        db.execute(
+            "INSERT INTO labels_fts (labels_fts, rowid, label) SELECT 'delete', id, label FROM labels WHERE artefact = ?",
+            (artefact_id,)
+        )
+        db.execute(
+            "INSERT INTO artefacts_fts (artefacts_fts, rowid, title, artefact, languages) SELECT 'delete', id, title, artefact, languages FROM artefacts WHERE artefact = ?",
+            (artefact_id,)
+        )
+        db.execute("DELETE FROM labels WHERE artefact = ?", (artefact_id,))
+        db.execute("DELETE FROM types WHERE artefact = ?", (artefact_id,))
+        db.execute("DELETE FROM artefacts WHERE artefact = ?", (artefact_id,))
+
+    def close(self):
+        """Close the connection of the current thread, connections must not be used by forked processes."""
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+
+def fts_query(q):
+    """Turn a user query into an FTS5 query matching every word as a prefix."""
+    words = [w.strip('*"') for w in q.split()]
+    words = ['"' + w.replace('"', '""') + '"*' for w in words if w]
+    return " ".join(words) if words else None
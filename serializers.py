@@ -0,0 +1,258 @@
+import json
+import re
+from xml.sax.saxutils import escape, quoteattr
+
+from rdflib import BNode, Literal, URIRef
+from rdflib.namespace import RDF
+
+
+# Serializers that write a sequence of subject descriptions, each a subject
+# with its (predicate, object) pairs, one description at a time. Unlike
+# Graph.serialize they never hold the whole document in memory, and their
+# output is graph-isomorphic with the rdflib serializers.
+
+TURTLE_LOCAL_NAME = re.compile(r"[A-Za-z0-9_]([A-Za-z0-9_.-]*[A-Za-z0-9_-])?")
+XML_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_.-]*")
+
+CHUNK_SIZE = 64 * 1024
+
+
+class Descriptions:
+    """Subject descriptions built with the add and subjects methods of a Graph.
+
+    Small responses of a fixed shape are collected in one and written with
+    the serializers below, without the indexing and serializer plugins of an
+    rdflib Graph.
+    """
+
+    def __init__(self):
+        self._subjects = {}
+
+    def add(self, triple):
+        s, p, o = triple
+        self._subjects.setdefault(s, {})[(p, o)] = None
+
+    def subjects(self, predicate=None, object=None):
+        for s, predicate_objects in self._subjects.items():
+            if predicate is None or any(p == predicate and (object is None or o == object) for p, o in predicate_objects):
+                yield s
+
+    def __iter__(self):
+        for s, predicate_objects in self._subjects.items():
+            yield s, list(predicate_objects)
+
+    def __len__(self):
+        return sum(len(predicate_objects) for predicate_objects in self._subjects.values())
+
+
+def serialize(descriptions, rdflib_format, namespaces):
+    """Return the descriptions in the rdflib format as a string."""
+    return "".join(serialize_stream(iter(descriptions), rdflib_format, namespaces))
+
+
+def serialize_stream(descriptions, rdflib_format, namespaces):
+    """Return a generator of text chunks of the descriptions in the rdflib format json-ld, ttl, xml or nt, or as ndjson."""
+    namespaces = _declared_namespaces(namespaces)
+    writers = {
+        "json-ld": write_jsonld,
+        "ttl": write_turtle,
+        "xml": write_rdfxml,
+        "nt": write_ntriples,
+        "ndjson": write_ndjson
+    }
+    return _buffered(writers[rdflib_format](descriptions, namespaces))
+
+
+def check_predicates(predicates, rdflib_format, namespaces):
+    """Raise ValueError if the predicates cannot be written in the rdflib format.
+
+    Streamed responses have been sent in part by the time a serializer
+    fails, so the predicates are checked before the response starts.
+    """
+    if rdflib_format == "xml":
+        namespaces = _declared_namespaces(namespaces)
+        for predicate in predicates:
+            _xml_name(predicate, namespaces)
+
+
+def _declared_namespaces(namespaces):
+    # The default namespace and reserved xml prefixes cannot be declared in every format
+    namespaces = {prefix: str(namespace) for prefix, namespace in namespaces.items() if prefix and not prefix.lower().startswith("xml")}
+    namespaces["rdf"] = str(RDF)
+    return namespaces
+
+
+def write_turtle(descriptions, namespaces):
+    yield "".join("@prefix %s: <%s> .\n" % (prefix, namespace) for prefix, namespace in namespaces.items()) + "\n"
+
+    for subject, predicate_objects in descriptions:
+        statements = []
+        for predicate, objects in _group_by_predicate(predicate_objects):
+            name = "a" if predicate == RDF.type else _turtle_term(predicate, namespaces)
+            statements.append("    " + name + " " + ",\n        ".join(_turtle_term(o, namespaces) for o in objects))
+        yield _turtle_term(subject, namespaces) + "\n" + " ;\n".join(statements) + " .\n\n"
+
+
+def write_jsonld(descriptions, namespaces):
+    yield '{\n  "@context": ' + json.dumps(namespaces) + ',\n  "@graph": ['
+
+    separator = "\n    "
+    for subject, predicate_objects in descriptions:
+        node = { "@id": _jsonld_id(subject) }
+        for predicate, o in predicate_objects:
+            if predicate == RDF.type and isinstance(o, URIRef):
+                node.setdefault("@type", []).append(_compact(o, namespaces))
+            else:
+                node.setdefault(_compact(predicate, namespaces), []).append(_jsonld_value(o, namespaces))
+        yield separator + json.dumps(node, ensure_ascii=False)
+        separator = ",\n    "
+
+    yield "\n  ]\n}\n"
+
+
+def write_rdfxml(descriptions, namespaces):
+    declarations = "".join("\n   xmlns:%s=%s" % (prefix, quoteattr(namespace)) for prefix, namespace in namespaces.items())
+    yield '<?xml version="1.0" encoding="utf-8"?>\n<rdf:RDF%s\n>\n' % declarations
+
+    for subject, predicate_objects in descriptions:
+        if isinstance(subject, BNode):
+            lines = ["  <rdf:Description rdf:nodeID=%s>" % quoteattr(_bnode_id(subject))]
+        else:
+            lines = ["  <rdf:Description rdf:about=%s>" % quoteattr(str(subject))]
+
+        for predicate, o in predicate_objects:
+            name, declaration = _xml_name(predicate, namespaces)
+            if isinstance(o, URIRef):
+                lines.append("    <%s%s rdf:resource=%s/>" % (name, declaration, quoteattr(str(o))))
+            elif isinstance(o, BNode):
+                lines.append("    <%s%s rdf:nodeID=%s/>" % (name, declaration, quoteattr(_bnode_id(o))))
+            else:
+                if o.language:
+                    attributes = " xml:lang=" + quoteattr(o.language)
+                elif o.datatype:
+                    attributes = " rdf:datatype=" + quoteattr(str(o.datatype))
+                else:
+                    attributes = ""
+                # XML parsers read a bare carriage return as a line feed
+                lines.append("    <%s%s%s>%s</%s>" % (name, declaration, attributes, escape(str(o), { "\r": "&#13;" }), name))
+
+        lines.append("  </rdf:Description>\n")
+        yield "\n".join(lines)
+
+    yield "</rdf:RDF>\n"
+
+
+def write_ntriples(descriptions, namespaces):
+    for subject, predicate_objects in descriptions:
+        s = _ntriples_term(subject)
+        yield "".join(s + " " + _ntriples_term(p) + " " + _ntriples_term(o) + " .\n" for p, o in predicate_objects)
+
+
+def write_ndjson(descriptions, namespaces):
+    # Every line is a JSON-LD node object of its own, so IRIs are not compacted against a shared context
+    for subject, predicate_objects in descriptions:
+        node = { "@id": _jsonld_id(subject) }
+        for predicate, o in predicate_objects:
+            if predicate == RDF.type and isinstance(o, URIRef):
+                node.setdefault("@type", []).append(str(o))
+            else:
+                node.setdefault(str(predicate), []).append(_jsonld_value(o, {}))
+        yield json.dumps(node, ensure_ascii=False) + "\n"
+
+
+def _group_by_predicate(predicate_objects):
+    groups = {}
+    for predicate, o in predicate_objects:
+        groups.setdefault(predicate, []).append(o)
+    return groups.items()
+
+
+def _qname(uri, namespaces, local_name):
+    best = None
+    for prefix, namespace in namespaces.items():
+        if uri.startswith(namespace) and local_name.fullmatch(uri[len(namespace):]):
+            if best is None or len(namespace) > len(namespaces[best]):
+                best = prefix
+    if best is None:
+        return None
+    return best + ":" + uri[len(namespaces[best]):]
+
+
+def _turtle_term(term, namespaces):
+    if isinstance(term, URIRef):
+        return _qname(term, namespaces, TURTLE_LOCAL_NAME) or "<" + _escape_iri(term) + ">"
+    if isinstance(term, BNode):
+        return "_:" + _bnode_id(term)
+    return term.n3()
+
+
+def _ntriples_term(term):
+    if isinstance(term, URIRef):
+        return "<" + _escape_iri(term) + ">"
+    if isinstance(term, BNode):
+        return "_:" + _bnode_id(term)
+    # N-Triples has no long quotes, so line breaks in literals are escaped
+    value = '"' + str(term).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "\\r") + '"'
+    if term.language:
+        return value + "@" + term.language
+    if term.datatype:
+        return value + "^^<" + _escape_iri(term.datatype) + ">"
+    return value
+
+
+def _escape_iri(uri):
+    return re.sub(r'[\x00-\x20<>"{}|^`\\]', lambda m: "\\u%04X" % ord(m.group()), str(uri))
+
+
+def _compact(uri, namespaces):
+    for prefix, namespace in namespaces.items():
+        if uri.startswith(namespace) and len(uri) > len(namespace) and not uri[len(namespace):].startswith("//"):
+            return prefix + ":" + uri[len(namespace):]
+    return str(uri)
+
+
+def _jsonld_id(term):
+    if isinstance(term, BNode):
+        return "_:" + _bnode_id(term)
+    return str(term)
+
+
+def _jsonld_value(term, namespaces):
+    if isinstance(term, Literal):
+        value = { "@value": str(term) }
+        if term.language:
+            value["@language"] = term.language
+        elif term.datatype:
+            value["@type"] = _compact(term.datatype, namespaces)
+        return value
+    return { "@id": _jsonld_id(term) }
+
+
+def _xml_name(uri, namespaces):
+    # Predicates outside the declared namespaces get a namespace declaration of their own
+    name = _qname(uri, namespaces, XML_NAME)
+    if name:
+        return name, ""
+    match = re.search(r"[A-Za-z_][A-Za-z0-9_.-]*$", uri)
+    if not match or match.start() == 0:
+        raise ValueError("Predicate cannot be serialized as RDF/XML: " + uri)
+    return "ns0:" + match.group(), " xmlns:ns0=" + quoteattr(uri[:match.start()])
+
+
+def _bnode_id(bnode):
+    node_id = re.sub(r"[^A-Za-z0-9_-]", "_", str(bnode))
+    return node_id if XML_NAME.fullmatch(node_id) else "b" + node_id
+
+
+def _buffered(chunks):
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= CHUNK_SIZE:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
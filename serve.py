@@ -0,0 +1,154 @@
+"""Prefork development and benchmark launcher of the MOD API.
+
+    python serve.py
+
+The parent process syncs the vocabulary snapshots, opens them and reads
+them into the page cache before it forks the worker processes, which share
+the memory-mapped snapshots and everything else loaded during the warm-up
+copy-on-write. Until the warm-up has finished the parent answers
+/health/live itself and every other request, including /health/ready,
+with 503 Service Unavailable. Workers that exit are replaced.
+
+The workers run the werkzeug development server, so this launcher is for
+development and benchmarks, not for production.
+"""
+import atexit
+import gc
+import logging
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import time
+
+from rdflib.namespace import RDF, SKOS
+from werkzeug.serving import make_server
+
+from app import app, close_connections, graph_cache, list_artefacts, snapshot_store, SKOSXL, sync_artefact, upstream_client
+
+
+SERVE_HOST = os.environ.get("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.environ.get("SERVE_PORT", 8000))
+SERVE_WORKERS = int(os.environ.get("SERVE_WORKERS", 4))
+# Comma-separated artefact IDs synced during the warm-up, * for all vocabularies listed upstream
+SERVE_VOCABULARIES = os.environ.get("SERVE_VOCABULARIES", "*")
+
+logger = logging.getLogger("serve")
+
+
+def warming_up(environ, start_response):
+    if environ.get("PATH_INFO") == "/health/live":
+        status, body = "200 OK", b'{"status": "ok"}\n'
+    else:
+        status, body = "503 Service Unavailable", b'{"status": "warming up"}\n'
+    start_response(status, [("Content-Type", "application/json"), ("Cache-Control", "no-store"), ("Retry-After", "10")])
+    return [body]
+
+
+def warm_up(vocabularies):
+    """Sync the vocabularies and read all snapshots into the page cache."""
+    if vocabularies == "*":
+        try:
+            artefact_ids = list_artefacts(upstream_client)
+        except Exception as e:
+            logger.warning("Listing vocabularies failed, serving the existing snapshots: %s", e)
+            artefact_ids = []
+    else:
+        artefact_ids = [artefact_id.strip() for artefact_id in vocabularies.split(",") if artefact_id.strip()]
+
+    for artefact_id in artefact_ids:
+        try:
+            # Parsed in this process, a parse pool started here could not be used by the forked workers
+            details = sync_artefact(artefact_id)
+        except Exception as e:
+            logger.warning("Syncing %s failed: %s", artefact_id, e)
+            continue
+        logger.info("%s: %s", artefact_id, "updated" if details["changed"] else "unchanged")
+
+    for artefact_id in snapshot_store.artefact_ids():
+        snapshot = snapshot_store.get(artefact_id)
+        if snapshot is None:
+            continue
+        snapshot.preload()
+        # The subject selections of the collection types are found once for all workers
+        for subject_type in (SKOS.Concept, RDF.Property, SKOSXL.Label):
+            snapshot.page(subject_type, 0, 0)
+
+    close_connections()
+
+
+def run_worker(listener):
+    server = make_server(SERVE_HOST, SERVE_PORT, app, threaded=True, fd=listener.fileno())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # shutdown waits for serve_forever to return, so it cannot be called from the signal handler directly
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    server.serve_forever()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(process)d %(name)s %(levelname)s %(message)s")
+
+    listener = socket.create_server((SERVE_HOST, SERVE_PORT), backlog=1024)
+
+    # Probes are answered from the start, the server thread has exited before the workers are forked
+    probes = make_server(SERVE_HOST, SERVE_PORT, warming_up, fd=listener.fileno())
+    probe_thread = threading.Thread(target=probes.serve_forever, name="warm-up-probes")
+    probe_thread.start()
+    try:
+        warm_up(SERVE_VOCABULARIES)
+    finally:
+        probes.shutdown()
+        probe_thread.join()
+
+    # Workers join each other's loads of datasets parsed on demand through a directory they share
+    if graph_cache.snapshot_dir is None:
+        graph_cache.snapshot_dir = tempfile.mkdtemp(prefix="mod-api-graphs-")
+        # Removed by the parent on exit, workers leave through os._exit
+        atexit.register(shutil.rmtree, graph_cache.snapshot_dir, True)
+
+    # Objects of the warm-up are never written by the garbage collector of the workers, so their pages stay shared
+    gc.freeze()
+
+    workers = set()
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while True:
+        while not stopping and len(workers) < SERVE_WORKERS:
+            pid = os.fork()
+            if pid == 0:
+                code = 0
+                try:
+                    run_worker(listener)
+                except BaseException:
+                    logger.exception("Worker failed")
+                    code = 1
+                os._exit(code)
+            workers.add(pid)
+            logger.info("Started worker %d", pid)
+
+        if not workers:
+            break
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            logger.warning("Worker %d exited with status %d, restarting it", pid, os.waitstatus_to_exitcode(status))
+            # Workers failing on start are not restarted in a busy loop
+            time.sleep(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,676 @@
+from array import array
+from collections import OrderedDict
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.namespace import OWL, RDF, RDFS, SKOS
+
+from search_index import LABEL_PROPERTIES
+from turtle_parser import TurtleParser
+
+
+# Snapshot file layout:
+#
+#   MAGIC | uint32 header length | JSON header | sections aligned to 8 bytes
+#
+# Terms are dictionary-encoded and numbered in the order of their string
+# value, so sorting subjects by ID sorts them the same way as the former
+# ORDER BY (str(?s)) queries. Triples are stored twice as flat uint32 arrays,
+# sorted as (s, p, o) and (p, o, s), with offset tables from subject and
+# predicate IDs to the first triple of the ID.
+#
+# The number in MAGIC is the format version. It changes with the sections or
+# header fields, and snapshots of another version are rebuilt, not read.
+MAGIC = b"MODSNAP3"
+
+SECTIONS = [
+    ("term_offsets", "Q"),
+    ("terms", "B"),
+    ("spo", "I"),
+    ("spo_index", "Q"),
+    ("pos", "I"),
+    ("pos_index", "Q"),
+    ("subjects", "I"),
+    ("individuals", "I")
+]
+
+# Subject type of the individuals of a vocabulary, the instances of its own classes
+INDIVIDUALS = "individuals"
+
+# Namespaces of the classes of vocabulary terms rather than individuals
+SCHEMA_NAMESPACES = (
+    str(RDF),
+    str(RDFS),
+    str(OWL),
+    str(SKOS),
+    "http://www.w3.org/2008/05/skos-xl#",
+    "http://purl.org/iso25964/skos-thes#"
+)
+
+# Facet selections of subjects kept per snapshot
+SELECTION_CACHE_SIZE = 16
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class SnapshotFormatError(ValueError):
+    """Raised for a file that is not a snapshot of this format version and platform."""
+
+
+def encode_term(term):
+    if isinstance(term, URIRef):
+        return "U" + str(term)
+    if isinstance(term, BNode):
+        return "B" + str(term)
+    return "L" + (term.language or "") + "\0" + str(term.datatype or "") + "\0" + str(term)
+
+
+def decode_term(data):
+    kind, value = data[0], data[1:]
+    if kind == "U":
+        return URIRef(value)
+    if kind == "B":
+        return BNode(value)
+    lang, datatype, lexical = value.split("\0", 2)
+    return Literal(lexical, lang=lang or None, datatype=URIRef(datatype) if datatype else None)
+
+
+def term_language(data):
+    # The lowercase language of an encoded literal, or None for other terms
+    return data[1:].split("\0", 1)[0].lower() if data[0] == "L" else None
+
+
+def term_sort_key(data):
+    # The string value of the term followed by its kind to break ties
+    if data[0] == "L":
+        return (data[1:].split("\0", 2)[2], data[0])
+    return (data[1:], data[0])
+
+
+class SnapshotBuilder:
+    """Sink of parsed triples that interns their terms and writes them as a snapshot.
+
+    Triples are added as encoded terms, so a dataset is parsed straight into
+    flat arrays of term IDs without building a Graph of term objects.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._terms = []
+        self._triples = array("I")
+        # Prefixes are bound as in a Graph(bind_namespaces="core") the dataset is parsed into
+        self._namespaces = Graph(bind_namespaces="core").namespace_manager
+
+    def add(self, triple):
+        for data in triple:
+            term_id = self._ids.get(data)
+            if term_id is None:
+                term_id = self._ids[data] = len(self._terms)
+                self._terms.append(data)
+            self._triples.append(term_id)
+
+    def bind(self, prefix, namespace):
+        self._namespaces.bind(prefix, namespace, override=True, replace=False)
+
+    def write(self, path, metadata):
+        """Write the terms and triples to path, replacing any existing snapshot atomically."""
+        order = sorted(range(len(self._terms)), key=lambda i: term_sort_key(self._terms[i]))
+        terms = [self._terms[i] for i in order]
+        ids = array("I", bytes(4 * len(order)))
+        for term_id, i in enumerate(order):
+            ids[i] = term_id
+        del order
+
+        triples = self._triples
+        keys = sorted({(ids[triples[i]] << 64) | (ids[triples[i + 1]] << 32) | ids[triples[i + 2]] for i in range(0, len(triples), 3)})
+        del ids
+
+        mask = 0xFFFFFFFF
+        spo = array("I")
+        pos_keys = []
+        for key in keys:
+            s, p, o = key >> 64, (key >> 32) & mask, key & mask
+            spo.extend((s, p, o))
+            pos_keys.append((p << 64) | (o << 32) | s)
+        del keys
+        pos_keys.sort()
+        pos = array("I")
+        for key in pos_keys:
+            pos.extend((key >> 64, (key >> 32) & mask, key & mask))
+        del pos_keys
+
+        term_offsets = array("Q", [0])
+        term_bytes = bytearray()
+        for t in terms:
+            term_bytes += t.encode("utf-8")
+            term_offsets.append(len(term_bytes))
+
+        spo_index = _offset_index(spo, len(terms))
+        pos_index = _offset_index(pos, len(terms))
+        subjects = array("I", [i for i in range(len(terms)) if terms[i][0] == "U" and spo_index[i + 1] > spo_index[i]])
+        term_ids = { t: i for i, t in enumerate(terms) }
+        sections = {
+            "term_offsets": term_offsets,
+            "terms": array("B", term_bytes),
+            "spo": spo,
+            "spo_index": spo_index,
+            "pos": pos,
+            "pos_index": pos_index,
+            "subjects": subjects,
+            "individuals": find_individuals(pos, pos_index, terms.__getitem__, term_ids.get(encode_term(RDF.type)))
+        }
+
+        header = dict(metadata)
+        header.update({
+            "byteorder": sys.byteorder,
+            "terms": len(terms),
+            "triples": len(spo) // 3,
+            "prefixes": { prefix: str(namespace) for prefix, namespace in self._namespaces.namespaces() },
+            "stats": collect_stats(pos, pos_index, terms.__getitem__, lambda term: term_ids.get(encode_term(term)), len(subjects)),
+            "sections": {}
+        })
+        offset = 0
+        for name, _ in SECTIONS:
+            length = len(sections[name]) * sections[name].itemsize
+            header["sections"][name] = [offset, length]
+            offset = _align(offset + length)
+
+        header_bytes = json.dumps(header).encode("utf-8")
+        data_start = _align(len(MAGIC) + 4 + len(header_bytes))
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header_bytes)))
+            f.write(header_bytes)
+            for name, _ in SECTIONS:
+                f.seek(data_start + header["sections"][name][0])
+                sections[name].tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        return header
+
+
+def collect_stats(pos, pos_index, term_data, lookup, subject_count):
+    """Return the statistics of a vocabulary from its triples in POS order.
+
+    The number of subjects that are not blank nodes, the number of subjects
+    by type and by concept scheme, the number of labels by language and the
+    number of labelled subjects by language, with lowercase languages. Blank
+    node subjects are not counted, as they are not members of collections.
+    Only the triples of rdf:type, skos:inScheme and the label properties are
+    read.
+    """
+    def predicate_range(predicate):
+        p = lookup(predicate)
+        return range(pos_index[p], pos_index[p + 1]) if p is not None else range(0)
+
+    def object_counts(predicate):
+        counts = {}
+        for i in predicate_range(predicate):
+            if term_data(pos[3 * i + 2])[0] != "U":
+                continue
+            o = pos[3 * i + 1]
+            counts[o] = counts.get(o, 0) + 1
+        return { str(decode_term(term_data(o))): count for o, count in counts.items() }
+
+    labels = {}
+    labelled = {}
+    languages = {}
+    for label_property in LABEL_PROPERTIES:
+        for i in predicate_range(label_property):
+            if term_data(pos[3 * i + 2])[0] != "U":
+                continue
+            o = pos[3 * i + 1]
+            if o not in languages:
+                languages[o] = term_language(term_data(o))
+            lang = languages[o]
+            if lang is not None:
+                labels[lang] = labels.get(lang, 0) + 1
+                labelled.setdefault(lang, set()).add(pos[3 * i + 2])
+
+    return {
+        "subjects": subject_count,
+        "types": object_counts(RDF.type),
+        "schemes": object_counts(SKOS.inScheme),
+        "labels": labels,
+        "languages": { lang: len(subjects) for lang, subjects in labelled.items() }
+    }
+
+
+def find_individuals(pos, pos_index, term_data, type_id):
+    """Return the IDs of the individuals of a vocabulary from its triples in POS order.
+
+    Individuals are the subjects that are not blank nodes and are instances
+    of classes outside SCHEMA_NAMESPACES, or of owl:NamedIndividual, but not
+    of any other class in them, such as skos:Concept or owl:Class.
+    """
+    if type_id is None:
+        return array("I")
+
+    instances = set()
+    terms = set()
+    individual_types = {}
+    for i in range(pos_index[type_id], pos_index[type_id + 1]):
+        o, s = pos[3 * i + 1], pos[3 * i + 2]
+        if o not in individual_types:
+            data = term_data(o)
+            individual_types[o] = data[0] == "U" and (data[1:] == str(OWL.NamedIndividual) or not data[1:].startswith(SCHEMA_NAMESPACES))
+        (instances if individual_types[o] else terms).add(s)
+    return array("I", sorted(s for s in instances - terms if term_data(s)[0] == "U"))
+
+
+def stats_count(stats, subject_type, facets):
+    """Return the number of subjects of the type that match the facets from the statistics, or None if it has to be counted."""
+    constraints = ((RDF.type, subject_type),) + facets if subject_type is not None else facets
+    if not constraints:
+        return stats["subjects"]
+    if len(constraints) > 1 or subject_type == INDIVIDUALS:
+        return None
+
+    predicate, value = constraints[0]
+    counts = { RDF.type: stats["types"], SKOS.inScheme: stats["schemes"], "lang": stats["languages"] }.get(predicate)
+    if counts is None:
+        return None
+    return counts.get(str(value), 0)
+
+
+def parse_turtle(data_path):
+    """Parse the Turtle file at data_path into a SnapshotBuilder."""
+    builder = SnapshotBuilder()
+    with open(data_path, encoding="utf-8-sig") as f:
+        parser = TurtleParser(f)
+        for triple in parser.triples():
+            builder.add(triple)
+    for prefix, namespace in parser.prefixes.items():
+        builder.bind(prefix, namespace)
+    return builder
+
+
+def build_snapshot(data_path, path, metadata):
+    """Parse the Turtle file at data_path into a snapshot at path and return the number of triples.
+
+    Runs in parse worker processes as well, so that the parse does not hold
+    the GIL of the process serving requests.
+    """
+    return parse_turtle(data_path).write(path, metadata)["triples"]
+
+
+def download(response, path):
+    """Write the streamed body of the response to path and return its SHA-256 hex digest.
+
+    The body is decoded from the content coding of the response, so the
+    digest is that of the dataset whether or not upstream compressed it.
+    """
+    digest = hashlib.sha256()
+    with open(path, "wb") as f:
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+
+class Snapshot:
+    """Read-only memory-mapped snapshot of a vocabulary.
+
+    Collections are paged by subject type and facets, which narrow a
+    collection down to the subjects with all of the given (predicate, object)
+    pairs, where the predicate "lang" stands for a label in the lowercase
+    language given as the object. The subject type INDIVIDUALS pages the
+    individuals found when the snapshot was written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise SnapshotFormatError("Not a vocabulary snapshot of format " + MAGIC.decode("ascii") + ": " + path)
+        header_length = struct.unpack_from("<I", self._mmap, len(MAGIC))[0]
+        self.header = json.loads(self._mmap[len(MAGIC) + 4:len(MAGIC) + 4 + header_length])
+        if self.header["byteorder"] != sys.byteorder:
+            self._mmap.close()
+            raise SnapshotFormatError("Snapshot byte order does not match the platform: " + path)
+
+        data_start = _align(len(MAGIC) + 4 + header_length)
+        view = memoryview(self._mmap)
+        for name, typecode in SECTIONS:
+            start, length = self.header["sections"][name]
+            setattr(self, "_" + name, view[data_start + start:data_start + start + length].cast(typecode))
+
+        self._selections = OrderedDict()
+        self._predicates = None
+        self._lock = threading.Lock()
+
+    def triple_count(self):
+        return self.header["triples"]
+
+    def stats(self):
+        return self.header["stats"]
+
+    def preload(self):
+        """Read every page of the snapshot, so that requests do not wait for it to be read from disk."""
+        for offset in range(0, len(self._mmap), mmap.PAGESIZE):
+            self._mmap[offset]
+
+    def count(self, subject_type=None, facets=()):
+        count = stats_count(self.stats(), subject_type, facets)
+        if count is None:
+            count = len(self._selection(subject_type, facets))
+        return count
+
+    def page(self, subject_type, start, end, facets=()):
+        return list(self._selection(subject_type, facets)[start:end])
+
+    def seek(self, subject_type, after, facets=()):
+        """Return the position of the first subject whose string value sorts after the given one."""
+        subjects = self._selection(subject_type, facets)
+        low, high = 0, len(subjects)
+        while low < high:
+            middle = (low + high) // 2
+            if term_sort_key(self._term_data(subjects[middle]))[0] <= after:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def namespaces(self):
+        return dict(self.header["prefixes"])
+
+    def descriptions(self, subjects):
+        """Yield each subject ID and the IDs of its blank node objects as terms with their (predicate, object) pairs."""
+        terms = {}
+        seen = set()
+        for subject in subjects:
+            stack = [subject]
+            while stack:
+                s = stack.pop()
+                if s in seen:
+                    continue
+                seen.add(s)
+
+                predicate_objects = []
+                for i in range(self._spo_index[s], self._spo_index[s + 1]):
+                    p, o = self._spo[3 * i + 1], self._spo[3 * i + 2]
+                    predicate_objects.append((self._cached_term(terms, p), self._cached_term(terms, o)))
+                    if self._kind(o) == "B":
+                        stack.append(o)
+                if predicate_objects:
+                    yield self._cached_term(terms, s), predicate_objects
+
+    def predicates(self, subjects=None):
+        """Return the predicates of the descriptions of the subject IDs, or of all triples without subjects."""
+        if subjects is None:
+            if self._predicates is None:
+                self._predicates = [self.term(p) for p in range(self.header["terms"]) if self._pos_index[p + 1] > self._pos_index[p]]
+            return self._predicates
+
+        predicates = set()
+        seen = set()
+        stack = list(subjects)
+        while stack:
+            s = stack.pop()
+            if s in seen:
+                continue
+            seen.add(s)
+            for i in range(self._spo_index[s], self._spo_index[s + 1]):
+                predicates.add(self._spo[3 * i + 1])
+                o = self._spo[3 * i + 2]
+                if self._kind(o) == "B":
+                    stack.append(o)
+        return [self.term(p) for p in predicates]
+
+    def subject_objects(self, predicate):
+        p = self.lookup(predicate)
+        if p is None:
+            return
+
+        terms = {}
+        for i in range(self._pos_index[p], self._pos_index[p + 1]):
+            yield self._cached_term(terms, self._pos[3 * i + 2]), self._cached_term(terms, self._pos[3 * i + 1])
+
+    def describe(self, subjects):
+        """Return the concise bounded description of the subject IDs as a Graph."""
+        result_graph = Graph()
+        for prefix, namespace in self.header["prefixes"].items():
+            result_graph.bind(prefix, namespace)
+
+        for s, predicate_objects in self.descriptions(subjects):
+            for p, o in predicate_objects:
+                result_graph.add((s, p, o))
+
+        return result_graph
+
+    def term(self, term_id):
+        return decode_term(self._term_data(term_id))
+
+    def lookup(self, term):
+        """Return the ID of the term or None if the snapshot does not contain it."""
+        data = encode_term(term)
+        key = term_sort_key(data)
+        low, high = 0, self.header["terms"]
+        while low < high:
+            middle = (low + high) // 2
+            if term_sort_key(self._term_data(middle)) < key:
+                low = middle + 1
+            else:
+                high = middle
+        # Literals with the same lexical form share a sort key
+        while low < self.header["terms"] and term_sort_key(self._term_data(low)) == key:
+            if self._term_data(low) == data:
+                return low
+            low += 1
+        return None
+
+    def _selection(self, subject_type, facets=()):
+        """Return the IDs of the subjects of the type that match the facets in the order of their string values.
+
+        A single constraint is a slice of the POS triples, several are
+        intersected.
+        """
+        if subject_type is None and not facets:
+            return self._subjects
+        if subject_type == INDIVIDUALS and not facets:
+            return self._individuals
+
+        key = (subject_type, facets)
+        with self._lock:
+            if key in self._selections:
+                self._selections.move_to_end(key)
+                return self._selections[key]
+
+        selections = [self._matching(predicate, value) for predicate, value in facets]
+        if subject_type == INDIVIDUALS:
+            selections.append(self._individuals)
+        elif subject_type is not None:
+            selections.append(self._matching(RDF.type, subject_type))
+        if len(selections) == 1:
+            subjects = selections[0]
+        else:
+            # IDs are numbered in the order of the string values, so the intersection only needs sorting by ID
+            matches = set(min(selections, key=len))
+            for selection in selections:
+                matches.intersection_update(selection)
+            subjects = array("I", sorted(matches))
+
+        with self._lock:
+            self._selections[key] = subjects
+            while len(self._selections) > SELECTION_CACHE_SIZE:
+                self._selections.popitem(last=False)
+        return subjects
+
+    def _matching(self, predicate, value):
+        if predicate == "lang":
+            languages = {}
+            subjects = set()
+            for label_property in LABEL_PROPERTIES:
+                p = self.lookup(label_property)
+                if p is None:
+                    continue
+                for i in range(self._pos_index[p], self._pos_index[p + 1]):
+                    o = self._pos[3 * i + 1]
+                    if o not in languages:
+                        languages[o] = term_language(self._term_data(o))
+                    if languages[o] == value:
+                        subjects.add(self._pos[3 * i + 2])
+            return array("I", sorted(s for s in subjects if self._kind(s) == "U"))
+
+        p, o = self.lookup(predicate), self.lookup(value)
+        if p is None or o is None:
+            return array("I")
+        start, end = self._object_range(p, o)
+        # Blank nodes are described with the subjects referring to them, they are not members of collections
+        return array("I", (s for s in self._pos[3 * start + 2:3 * end + 2:3] if self._kind(s) == "U"))
+
+    def _object_range(self, p, o):
+        # Triples of predicate p in POS order with object o
+        def bound(low, high, upper):
+            while low < high:
+                middle = (low + high) // 2
+                value = self._pos[3 * middle + 1]
+                if value < o or (upper and value == o):
+                    low = middle + 1
+                else:
+                    high = middle
+            return low
+
+        start, end = self._pos_index[p], self._pos_index[p + 1]
+        return (bound(start, end, False), bound(start, end, True))
+
+    def _term_data(self, term_id):
+        return bytes(self._terms[self._term_offsets[term_id]:self._term_offsets[term_id + 1]]).decode("utf-8")
+
+    def _kind(self, term_id):
+        return chr(self._terms[self._term_offsets[term_id]])
+
+    def _cached_term(self, terms, term_id):
+        term = terms.get(term_id)
+        if term is None:
+            term = terms[term_id] = self.term(term_id)
+        return term
+
+
+class SnapshotStore:
+    """Directory of vocabulary snapshots shared by all worker processes through the page cache.
+
+    on_open is called with the artefact ID and the Snapshot whenever a new or
+    rewritten snapshot is opened.
+    """
+
+    def __init__(self, directory, on_open=None):
+        self.directory = directory
+        self.on_open = on_open
+        self._open = {}
+        self._lock = threading.Lock()
+
+    def path(self, artefact_id):
+        return os.path.join(self.directory, artefact_id + ".snapshot")
+
+    def get(self, artefact_id):
+        """Return the Snapshot of the artefact or None if it has not been synced in this format."""
+        try:
+            stat = os.stat(self.path(artefact_id))
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+        version = (stat.st_ino, stat.st_mtime_ns)
+        with self._lock:
+            opened = self._open.get(artefact_id)
+            if opened and opened[0] == version:
+                return opened[1]
+
+        try:
+            snapshot = Snapshot(self.path(artefact_id))
+        except SnapshotFormatError:
+            # Written by another version, the next sync rebuilds it
+            return None
+        with self._lock:
+            opened = self._open.get(artefact_id)
+            if opened and opened[0] == version:
+                return opened[1]
+            self._open[artefact_id] = (version, snapshot)
+        if self.on_open:
+            self.on_open(artefact_id, snapshot)
+        return snapshot
+
+    def artefact_ids(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(f[:-len(".snapshot")] for f in os.listdir(self.directory) if f.endswith(".snapshot"))
+
+    def remove(self, artefact_id):
+        with self._lock:
+            self._open.pop(artefact_id, None)
+        try:
+            os.remove(self.path(artefact_id))
+        except FileNotFoundError:
+            pass
+
+    def sync(self, http, artefact_id, parse_pool=None):
+        """Download the vocabulary dataset and rewrite its snapshot if it has changed.
+
+        With a parse pool the dataset is parsed in a worker process. Readers
+        keep the previous snapshot until the new one replaces it.
+        """
+        current = self.get(artefact_id)
+        headers = {}
+        if current and current.header.get("etag"):
+            headers["If-None-Match"] = current.header["etag"]
+        if current and current.header.get("last_modified"):
+            headers["If-Modified-Since"] = current.header["last_modified"]
+
+        os.makedirs(self.directory, exist_ok=True)
+        # The dataset is streamed to disk and parsed from there, it is never held in memory as a whole
+        data_path = self.path(artefact_id) + ".ttl"
+        try:
+            with http.get(artefact_id + "/data", params={"lang": "en", "format": "text/turtle"}, headers=headers, stream=True) as ret:
+                if ret.status_code == 304:
+                    return False
+                ret.raise_for_status()
+                digest = download(ret, data_path)
+
+            if current and current.header.get("hash") == digest:
+                return False
+
+            metadata = {
+                "artefact": artefact_id,
+                "etag": ret.headers.get("ETag"),
+                "last_modified": ret.headers.get("Last-Modified"),
+                "hash": digest,
+                "size": os.path.getsize(data_path),
+                "download_url": ret.url,
+                "synced": time.time()
+            }
+            if parse_pool is not None:
+                parse_pool.submit(build_snapshot, data_path, self.path(artefact_id), metadata).result()
+            else:
+                build_snapshot(data_path, self.path(artefact_id), metadata)
+            return True
+        finally:
+            if os.path.exists(data_path):
+                os.remove(data_path)
+
+
+def _offset_index(triples, term_count):
+    # index[i] is the position of the first triple whose first term is i
+    index = array("Q", [0]) * (term_count + 1)
+    for i in range(0, len(triples), 3):
+        index[triples[i] + 1] += 1
+    for i in range(term_count):
+        index[i + 1] += index[i]
+    return index
+
+
+def _align(offset):
+    return (offset + 7) & ~7
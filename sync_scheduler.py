@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class SyncScheduler:
+    """Background thread that keeps vocabulary snapshots and the search index up to date.
+
+    Every interval the artefacts returned by list_artefacts are synced with
+    sync(artefact_id), which returns a dict of details of the sync including
+    whether the vocabulary had changed, and artefacts that are no longer
+    listed are passed to remove. Only one worker process syncs at a time, the
+    others skip the run, and the status of the latest sync of every artefact
+    is kept in a JSON file that all worker processes can read. A sync that
+    was interrupted shows as running until the next one finishes.
+    """
+
+    def __init__(self, list_artefacts, sync, remove, interval, concurrency, status_path):
+        self.list_artefacts = list_artefacts
+        self.sync = sync
+        self.remove = remove
+        self.interval = interval
+        self.concurrency = concurrency
+        self.status_path = status_path
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the scheduler thread unless it is running or the interval is 0."""
+        with self._lock:
+            if self.interval <= 0 or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="sync-scheduler", daemon=True)
+            self._thread.start()
+
+    def status(self):
+        try:
+            with open(self.status_path) as f:
+                status = json.load(f)
+        except (FileNotFoundError, ValueError):
+            status = { "artefacts": {} }
+        status["interval"] = self.interval
+        # Read from the status file, taking the sync lock here could make a scheduled sync skip its run
+        status["running"] = "started" in status and status["started"] > status.get("finished", 0)
+        return status
+
+    def run_once(self):
+        """Sync all listed artefacts and return False if another process is already syncing."""
+        os.makedirs(os.path.dirname(self.status_path) or ".", exist_ok=True)
+        with open(self.status_path + ".lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+
+            status = self.status()
+            status["started"] = time.time()
+            start = time.monotonic()
+            self._save(status)
+            artefact_ids = self.list_artefacts()
+
+            def sync_artefact(artefact_id):
+                entry = dict(status["artefacts"].get(artefact_id, {}), checked=time.time())
+                sync_start = time.monotonic()
+                try:
+                    details = self.sync(artefact_id)
+                    entry.update(details, error=None)
+                    if details.get("changed"):
+                        entry["synced"] = entry["checked"]
+                        entry["duration"] = time.monotonic() - sync_start
+                except Exception as e:
+                    logger.warning("Syncing %s failed: %s", artefact_id, e)
+                    entry["error"] = str(e)
+                self._save(status, artefact_id, entry)
+
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="sync") as executor:
+                list(executor.map(sync_artefact, artefact_ids))
+
+            # An empty list is more likely an upstream problem than the removal of every vocabulary
+            removed = set(status["artefacts"]) - set(artefact_ids) if artefact_ids else set()
+            for artefact_id in removed:
+                self.remove(artefact_id)
+                self._save(status, artefact_id, None)
+
+            status["finished"] = time.time()
+            status["duration"] = time.monotonic() - start
+            self._save(status)
+            return True
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Vocabulary sync failed")
+            time.sleep(self.interval)
+
+    def _save(self, status, artefact_id=None, entry=None):
+        # Written after every artefact, so the status shows the progress of a running sync
+        with self._lock:
+            if artefact_id is not None:
+                if entry is None:
+                    status["artefacts"].pop(artefact_id, None)
+                else:
+                    status["artefacts"][artefact_id] = entry
+            data = { k: v for k, v in status.items() if k not in ("interval", "running") }
+            tmp_path = self.status_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.status_path)
@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+from rdflib import Graph, Namespace
+from rdflib.namespace import RDF
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import fake_skosmos
+
+
+# The app reads its configuration when it is imported, so the fake SKOSMOS API is started first
+server = fake_skosmos.serve("127.0.0.1", 0, fake_skosmos.load_vocabularies([120, 30]))
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+WORK_DIR = tempfile.mkdtemp(prefix="mod-api-tests-")
+os.environ.update({
+    "API_BASE_URL": "http://127.0.0.1:%d/rest/v1/" % server.server_address[1],
+    "SNAPSHOT_DIR": os.path.join(WORK_DIR, "snapshots"),
+    "SEARCH_INDEX_PATH": os.path.join(WORK_DIR, "search_index.sqlite3"),
+    "GRAPH_CACHE_DIR": os.path.join(WORK_DIR, "graphs"),
+    "RESPONSE_CACHE_BACKEND": "memory",
+    "PROFILE_SAMPLE_RATE": "0"
+})
+
+HYDRA = Namespace("http://www.w3.org/ns/hydra/core#")
+
+# bench120 is served from its snapshot and bench30 from its dataset parsed on demand
+SYNCED = "bench120"
+ON_DEMAND = "bench30"
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    import app
+    app.sync_artefact(SYNCED)
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+def parse(response, format="json-ld"):
+    return Graph().parse(data=response.data.decode("utf-8"), format=format)
+
+
+def collection_of(graph):
+    return graph.value(None, RDF.type, HYDRA.Collection, any=True)
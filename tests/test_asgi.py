@@ -0,0 +1,235 @@
+import asyncio
+import gzip
+import threading
+
+import pytest
+
+from conftest import SYNCED
+
+
+@pytest.fixture(scope="module")
+def asgi(app_module):
+    import asgi
+    return asgi
+
+
+def scope(path, query_string=b"", method="GET", headers=()):
+    return {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "query_string": query_string,
+        "root_path": "",
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 12345)
+    }
+
+
+async def call(application, scope, body_messages=(b"",), disconnect=None):
+    """Run one request and return the sent messages; disconnect is awaited before the client goes away."""
+    incoming = [{ "type": "http.request", "body": body, "more_body": i < len(body_messages) - 1 } for i, body in enumerate(body_messages)]
+    sent = []
+
+    async def receive():
+        if incoming:
+            return incoming.pop(0)
+        if disconnect is None:
+            await asyncio.Event().wait()
+        await disconnect.wait()
+        return { "type": "http.disconnect" }
+
+    async def send(message):
+        sent.append(message)
+
+    await asyncio.wait_for(application(scope, receive, send), 30)
+    return sent
+
+
+def response_of(messages):
+    start = messages[0]
+    assert start["type"] == "http.response.start"
+    assert all(message["type"] == "http.response.body" for message in messages[1:])
+    assert [message["more_body"] for message in messages[1:]] == [True] * (len(messages) - 2) + [False]
+    return start["status"], dict((k.decode("latin-1"), v.decode("latin-1")) for k, v in start["headers"]), b"".join(message["body"] for message in messages[1:])
+
+
+def test_routes_reading_datasets_have_a_lane_of_their_own(asgi):
+    datasets, default = [executor for _, _, executor in asgi.application.lanes]
+    for path in ["/artefacts/a/resources", "/artefacts/a/resources/concepts", "/artefacts/a/resources/labels/"]:
+        assert asgi.application.lane(path) is datasets, path
+    for path in ["/artefacts/a", "/artefacts/a/resources/schemes", "/artefacts/a/resources/c1", "/search/content", "/"]:
+        assert asgi.application.lane(path) is default, path
+
+
+def test_responses_match_the_flask_app(asgi, client):
+    for path, query_string in [("/artefacts/" + SYNCED, b""), ("/artefacts/%s/resources/concepts" % SYNCED, b"pagesize=5&page=2&format=ttl"), ("/artefacts/missing", b"")]:
+        status, headers, body = response_of(asyncio.run(call(asgi.application, scope(path, query_string, headers=[("Accept-Encoding", "identity")]))))
+        expected = client.get(path + "?" + query_string.decode("latin-1"), base_url="http://testserver/", headers={ "Accept-Encoding": "identity" })
+        assert status == expected.status_code
+        assert headers["content-type"] == expected.headers["Content-Type"]
+        assert body == expected.data
+
+
+def test_request_headers_reach_the_app_and_response_headers_the_client(asgi):
+    path = "/artefacts/%s/resources/concepts" % SYNCED
+    status, headers, body = response_of(asyncio.run(call(asgi.application, scope(path, b"format=ttl", headers=[("Accept-Encoding", "gzip")]))))
+    assert status == 200
+    assert headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in headers["vary"]
+    assert headers["content-type"].startswith("text/turtle")
+    assert b"@prefix" in gzip.decompress(body)
+
+    status, headers, body = response_of(asyncio.run(call(asgi.application, scope(path, b"format=ttl", headers=[("Accept-Encoding", "gzip"), ("If-None-Match", headers["etag"])]))))
+    assert status == 304
+    assert body == b""
+
+
+def test_scopes_become_wsgi_environs(asgi):
+    environ = asgi.wsgi_environ(scope("/a/ä b", b"q=%C3%A4", "POST", [("Content-Type", "text/plain"), ("Content-Length", "99"), ("X-A", "1"), ("x-a", "2")]), b"body")
+    assert environ["REQUEST_METHOD"] == "POST"
+    assert environ["PATH_INFO"].encode("latin-1").decode("utf-8") == "/a/ä b"
+    assert environ["QUERY_STRING"] == "q=%C3%A4"
+    assert environ["CONTENT_TYPE"] == "text/plain"
+    # The length is of the body received, repeated headers are joined
+    assert environ["CONTENT_LENGTH"] == "4"
+    assert environ["HTTP_X_A"] == "1,2"
+    assert "HTTP_CONTENT_LENGTH" not in environ
+    assert environ["wsgi.input"].read() == b"body"
+    assert (environ["SERVER_NAME"], environ["SERVER_PORT"], environ["REMOTE_ADDR"]) == ("testserver", "80", "127.0.0.1")
+
+
+def test_app_runs_in_the_threads_of_the_lane():
+    from asgi import LaneApplication
+    threads = []
+
+    def wsgi_app(environ, start_response):
+        threads.append(threading.current_thread().name)
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return [environ["PATH_INFO"].encode("utf-8")]
+
+    application = LaneApplication(wsgi_app, [("slow", r"/slow/.*", 1), ("default", r".*", 2)])
+    for path in ["/slow/a", "/fast", "/slow/b"]:
+        assert response_of(asyncio.run(call(application, scope(path))))[2] == path.encode("utf-8")
+    assert [name.rsplit("_", 1)[0] for name in threads] == ["lane-slow", "lane-default", "lane-slow"]
+
+
+def test_a_busy_lane_does_not_hold_up_the_others():
+    from asgi import LaneApplication
+    release = threading.Event()
+
+    def wsgi_app(environ, start_response):
+        if environ["PATH_INFO"] == "/slow":
+            release.wait(10)
+        start_response("200 OK", [])
+        return [environ["PATH_INFO"].encode("utf-8")]
+
+    application = LaneApplication(wsgi_app, [("slow", r"/slow", 1), ("default", r".*", 1)])
+
+    async def run():
+        slow = [asyncio.ensure_future(call(application, scope("/slow"))) for _ in range(2)]
+        fast = await call(application, scope("/fast"))
+        assert not any(request.done() for request in slow)
+        release.set()
+        return fast, await asyncio.gather(*slow)
+
+    fast, slow = asyncio.run(run())
+    assert response_of(fast)[2] == b"/fast"
+    assert [response_of(messages)[2] for messages in slow] == [b"/slow", b"/slow"]
+
+
+def test_request_and_response_bodies_are_streamed():
+    from asgi import LaneApplication
+
+    def wsgi_app(environ, start_response):
+        body = environ["wsgi.input"].read(int(environ["CONTENT_LENGTH"]))
+        start_response("201 Created", [("Content-Type", "application/octet-stream"), ("X-Method", environ["REQUEST_METHOD"]), ("X-Query", environ["QUERY_STRING"])])
+        # Empty chunks are not sent
+        return iter([b"", body] + [b"%d" % i for i in range(50)])
+
+    application = LaneApplication(wsgi_app, [("default", r".*", 1)])
+    messages = asyncio.run(call(application, scope("/echo", b"a=1", "POST", [("Content-Type", "text/plain")]), [b"first ", b"second ", b"third"]))
+    status, headers, body = response_of(messages)
+    assert status == 201
+    assert headers == { "content-type": "application/octet-stream", "x-method": "POST", "x-query": "a=1" }
+    assert body == b"first second third" + b"".join(b"%d" % i for i in range(50))
+    # One message per chunk, after the response start and before the end
+    assert len(messages) == 1 + 51 + 1
+
+
+def test_clients_going_away_stop_the_response():
+    from asgi import LaneApplication
+    produced = []
+    closed = threading.Event()
+
+    def wsgi_app(environ, start_response):
+        start_response("200 OK", [])
+
+        def chunks():
+            try:
+                while True:
+                    produced.append(len(produced))
+                    yield b"chunk"
+            finally:
+                closed.set()
+        return chunks()
+
+    application = LaneApplication(wsgi_app, [("default", r".*", 1)])
+
+    async def run():
+        disconnect = asyncio.Event()
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+            if len(sent) == 5:
+                disconnect.set()
+                # Gives the watcher the disconnect before the next chunk is sent
+                await asyncio.sleep(0.1)
+
+        incoming = [{ "type": "http.request", "body": b"", "more_body": False }]
+
+        async def receive():
+            if incoming:
+                return incoming.pop(0)
+            await disconnect.wait()
+            return { "type": "http.disconnect" }
+
+        # The request ends without waiting for the rest of the response
+        await asyncio.wait_for(application(scope("/"), receive, send), 10)
+        return sent
+
+    sent = asyncio.run(run())
+    assert closed.is_set()
+    assert len(produced) < 100
+    assert all(message.get("more_body", True) for message in sent)
+
+
+def test_errors_before_the_response_are_raised():
+    from asgi import LaneApplication
+
+    def wsgi_app(environ, start_response):
+        raise RuntimeError("broken")
+
+    with pytest.raises(RuntimeError, match="broken"):
+        asyncio.run(call(LaneApplication(wsgi_app, [("default", r".*", 1)]), scope("/")))
+
+
+def test_lifespan_shuts_the_lanes_down():
+    from asgi import LaneApplication
+    application = LaneApplication(lambda environ, start_response: [], [("default", r".*", 1)])
+    incoming = [{ "type": "lifespan.startup" }, { "type": "lifespan.shutdown" }]
+    sent = []
+
+    async def receive():
+        return incoming.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(application({ "type": "lifespan" }, receive, send))
+    assert [message["type"] for message in sent] == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    with pytest.raises(RuntimeError):
+        application.lanes[0][2].submit(print)
@@ -0,0 +1,119 @@
+import json
+
+from rdflib import BNode, Graph, URIRef
+from rdflib.compare import isomorphic
+from rdflib.namespace import DCTERMS, RDF, SKOS
+
+from conftest import HYDRA, ON_DEMAND, SYNCED, collection_of, parse
+
+RESOURCES = "/artefacts/%s/resources" % SYNCED
+
+
+def uri(artefact_id, name):
+    return "http://bench.example.org/%s/%s" % (artefact_id, name)
+
+
+def members(graph):
+    return sorted(str(member) for member in graph.objects(collection_of(graph), HYDRA.member))
+
+
+def statuses(graph):
+    return dict((str(graph.value(status, DCTERMS.subject)), int(graph.value(status, HYDRA.statusCode))) for status in graph.subjects(RDF.type, HYDRA.Status))
+
+
+def without_batch(graph):
+    """The descriptions of the resources, without the batch collection and statuses."""
+    result = Graph()
+    for s, p, o in graph:
+        if s != collection_of(graph) and (s, RDF.type, HYDRA.Status) not in graph:
+            result.add((s, p, o))
+    return result
+
+
+def test_batches_describe_the_resources_as_the_uri_parameters_do(client):
+    uris = [uri(SYNCED, "c1"), uri(SYNCED, "c2"), uri(SYNCED, "c10")]
+    response = client.post(RESOURCES, json=uris)
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/json"
+    # POST bodies are not in the URL responses are cached by
+    assert "ETag" not in response.headers
+
+    graph = parse(response)
+    assert members(graph) == sorted(uris)
+    assert int(graph.value(collection_of(graph), HYDRA.totalItems)) == 3
+    assert isinstance(collection_of(graph), BNode)
+    assert statuses(graph) == {}
+    for resource in uris:
+        assert (URIRef(resource), SKOS.prefLabel, None) in graph
+
+    expected = parse(client.get(RESOURCES + "?" + "&".join("uri=" + resource for resource in uris)))
+    assert isomorphic(without_batch(graph), without_batch(expected))
+
+
+def test_batches_can_be_form_fields_in_other_formats(client):
+    response = client.post(RESOURCES + "?format=ttl", data={ "uri": [uri(SYNCED, "c1"), uri(SYNCED, "c2")] })
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/turtle")
+    assert members(parse(response, "turtle")) == [uri(SYNCED, "c1"), uri(SYNCED, "c2")]
+
+
+def test_unknown_resources_are_reported_with_their_status(client):
+    missing = [uri(SYNCED, "missing"), "urn:other:resource", uri(SYNCED, "c99999")]
+    graph = parse(client.post(RESOURCES, json=[uri(SYNCED, "c3")] + missing))
+
+    assert members(graph) == [uri(SYNCED, "c3")]
+    assert int(graph.value(collection_of(graph), HYDRA.totalItems)) == 1
+    assert statuses(graph) == dict((resource, 404) for resource in missing)
+    assert len(list(graph.objects(None, HYDRA.title))) == 3
+    for resource in missing:
+        assert (URIRef(resource), None, None) not in graph
+
+    graph = parse(client.post(RESOURCES, json=missing[:1]))
+    assert members(graph) == []
+    assert int(graph.value(collection_of(graph), HYDRA.totalItems)) == 0
+
+
+def test_batches_of_vocabularies_without_a_dataset_are_fetched_from_skosmos(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module.graph_cache, "peek", lambda artefact_id: None)
+    graph = parse(client.post("/artefacts/%s/resources" % ON_DEMAND, json=[uri(ON_DEMAND, "c1"), uri(ON_DEMAND, "missing")]))
+    assert members(graph) == [uri(ON_DEMAND, "c1")]
+    assert statuses(graph) == { uri(ON_DEMAND, "missing"): 404 }
+    assert (URIRef(uri(ON_DEMAND, "c1")), SKOS.prefLabel, None) in graph
+
+    assert client.post("/artefacts/unknown/resources", json=[uri(ON_DEMAND, "c1")]).status_code == 404
+
+
+def test_batch_size_is_limited(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "RESOURCE_BATCH_MAX_URIS", 3)
+    uris = [uri(SYNCED, "c%d" % i) for i in range(1, 5)]
+
+    response = client.post(RESOURCES, json=uris)
+    assert response.status_code == 400
+    assert "At most 3 resources" in response.data.decode("utf-8")
+    assert client.get(RESOURCES + "?" + "&".join("uri=" + resource for resource in uris)).status_code == 400
+
+    # Repeated and empty URIs are not counted
+    response = client.post(RESOURCES, json=uris[:3] + uris[:3] + ["", ""])
+    assert response.status_code == 200
+    assert members(parse(response)) == sorted(uris[:3])
+
+
+def test_malformed_batches_are_rejected(client):
+    for body, content_type in [
+        ("[\"http://bench.example.org/%s/c1\"" % SYNCED, "application/json"),
+        ("not json", "application/json"),
+        (json.dumps({ "uri": uri(SYNCED, "c1") }), "application/json"),
+        (json.dumps(uri(SYNCED, "c1")), "application/json"),
+        (json.dumps([uri(SYNCED, "c1"), 2]), "application/json"),
+        (json.dumps([[uri(SYNCED, "c1")]]), "application/json"),
+        (json.dumps(None), "application/json"),
+        (json.dumps([]), "application/json"),
+        (json.dumps([""]), "application/json"),
+        ("", "application/x-www-form-urlencoded"),
+        ("", None)
+    ]:
+        headers = { "Content-Type": content_type } if content_type else {}
+        response = client.post(RESOURCES, data=body, headers=headers)
+        assert response.status_code == 400, body
+
+    assert client.post(RESOURCES + "?format=unknown", json=[uri(SYNCED, "c1")]).status_code == 415
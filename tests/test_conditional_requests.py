@@ -0,0 +1,73 @@
+import pytest
+
+from conftest import SYNCED
+
+
+CONCEPTS = "/artefacts/" + SYNCED + "/resources/concepts?pagesize=5"
+ARTEFACT = "/artefacts/" + SYNCED
+
+
+@pytest.fixture
+def etag(client):
+    response = client.get(CONCEPTS)
+    assert response.status_code == 200
+    return response.headers["ETag"]
+
+
+def test_strong_match_is_not_modified(client, etag):
+    assert client.get(CONCEPTS, headers={ "If-None-Match": etag }).status_code == 304
+
+
+def test_weak_match_is_not_modified(client, etag):
+    assert client.get(CONCEPTS, headers={ "If-None-Match": "W/" + etag }).status_code == 304
+
+
+def test_match_in_list_is_not_modified(client, etag):
+    assert client.get(CONCEPTS, headers={ "If-None-Match": '"other", ' + etag }).status_code == 304
+
+
+def test_star_is_not_modified(client):
+    assert client.get(CONCEPTS, headers={ "If-None-Match": "*" }).status_code == 304
+
+
+def test_other_etag_is_modified(client, etag):
+    response = client.get(CONCEPTS, headers={ "If-None-Match": '"other"' })
+    assert response.status_code == 200
+    assert response.headers["ETag"] == etag
+
+
+def test_etag_changes_with_query(client, etag):
+    assert client.get(CONCEPTS + "&page=2").headers["ETag"] != etag
+
+
+def test_if_modified_since(client):
+    response = client.get(CONCEPTS)
+    last_modified = response.headers["Last-Modified"]
+    assert client.get(CONCEPTS, headers={ "If-Modified-Since": last_modified }).status_code == 304
+    assert client.get(CONCEPTS, headers={ "If-Modified-Since": "Sun, 01 Jan 2023 00:00:00 GMT" }).status_code == 200
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since(client):
+    response = client.get(CONCEPTS)
+    headers = { "If-None-Match": '"other"', "If-Modified-Since": response.headers["Last-Modified"] }
+    assert client.get(CONCEPTS, headers=headers).status_code == 200
+
+
+def test_if_modified_since_without_last_modified(client):
+    response = client.get(ARTEFACT)
+    assert "Last-Modified" not in response.headers
+    assert client.get(ARTEFACT, headers={ "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT" }).status_code == 200
+    assert client.get(ARTEFACT, headers={ "If-None-Match": response.headers["ETag"] }).status_code == 304
+
+
+def test_etag_of_content_coding(client, etag):
+    response = client.get(CONCEPTS, headers={ "Accept-Encoding": "gzip" })
+    assert response.headers["Content-Encoding"] == "gzip"
+    gzip_etag = response.headers["ETag"]
+    assert gzip_etag == etag[:-1] + '-gzip"'
+
+    assert client.get(CONCEPTS, headers={ "Accept-Encoding": "gzip", "If-None-Match": gzip_etag }).status_code == 304
+    assert client.get(CONCEPTS, headers={ "Accept-Encoding": "gzip", "If-None-Match": "W/" + gzip_etag }).status_code == 304
+    # The identity and gzip responses are different representations
+    assert client.get(CONCEPTS, headers={ "Accept-Encoding": "gzip", "If-None-Match": etag }).status_code == 200
+    assert client.get(CONCEPTS, headers={ "If-None-Match": gzip_etag }).status_code == 200
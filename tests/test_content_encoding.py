@@ -0,0 +1,108 @@
+import gzip
+
+import pytest
+
+import content_encoding
+from conftest import parse, SYNCED
+from content_encoding import available_codings, compress, compress_stream, negotiate
+
+CONCEPTS = "/artefacts/%s/resources/concepts" % SYNCED
+CODINGS = ["zstd", "br", "gzip"]
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    (None, None),
+    ("", None),
+    ("gzip", "gzip"),
+    ("GZIP", "gzip"),
+    ("br", "br"),
+    ("gzip, br, zstd", "zstd"),
+    ("gzip;q=1.0, br;q=0.5, zstd;q=0.1", "gzip"),
+    ("gzip;q=0.5, br;q=0.9", "br"),
+    ("gzip ; q=0.8 , zstd ; q=0.9", "zstd"),
+    ("gzip;q=0", None),
+    ("zstd;q=0, br;q=0, gzip", "gzip"),
+    ("*", "zstd"),
+    ("*;q=0.5, gzip;q=0.8", "gzip"),
+    ("*, zstd;q=0", "br"),
+    ("gzip;q=invalid, br;q=0.1", "br"),
+    ("deflate, compress", None),
+    ("identity;q=0, gzip", "gzip"),
+    # Without an acceptable coding the response is sent as identity anyway
+    ("identity;q=0", None),
+    ("identity", None)
+])
+def test_negotiates_by_quality_and_preference(accept_encoding, expected):
+    assert negotiate(accept_encoding, CODINGS) == expected
+
+
+def test_codings_without_their_modules_are_not_offered(monkeypatch):
+    monkeypatch.setattr(content_encoding, "OPTIONAL_MODULES", { "br": "missing_brotli", "zstd": "missing_zstandard" })
+    assert available_codings() == ["gzip"]
+    assert available_codings(["br", "gzip", "unknown"]) == ["gzip"]
+    assert negotiate("br, zstd", available_codings()) is None
+    assert negotiate("br, zstd, gzip;q=0.1", available_codings()) == "gzip"
+
+
+def test_missing_codings_are_answered_without_compression(client, app_module, monkeypatch):
+    monkeypatch.setattr(content_encoding, "OPTIONAL_MODULES", { "br": "missing_brotli", "zstd": "missing_zstandard" })
+    monkeypatch.setattr(app_module, "COMPRESSION_CODINGS", available_codings())
+
+    response = client.get(CONCEPTS, headers={ "Accept-Encoding": "br, zstd" })
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert len(parse(response)) > 0
+
+    response = client.get(CONCEPTS, headers={ "Accept-Encoding": "br, zstd, gzip;q=0.1" })
+    assert response.headers["Content-Encoding"] == "gzip"
+
+
+@pytest.mark.parametrize("path", [CONCEPTS, "/artefacts/" + SYNCED, "/artefacts/%s/resources/concepts?pagesize=all" % SYNCED])
+def test_compressed_responses_vary_by_accept_encoding(client, path):
+    for accept_encoding in [None, "gzip"]:
+        response = client.get(path, headers={ "Accept-Encoding": accept_encoding } if accept_encoding else {})
+        assert response.status_code == 200
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert response.headers.get("Content-Encoding") == accept_encoding
+
+    body = client.get(path).data
+    assert gzip.decompress(client.get(path, headers={ "Accept-Encoding": "gzip" }).data) == body
+
+
+@pytest.mark.parametrize("coding", [None, "gzip", "br", "zstd"])
+def test_every_coding_has_its_own_etag_and_304(client, app_module, monkeypatch, coding):
+    if coding in content_encoding.OPTIONAL_MODULES:
+        pytest.importorskip(content_encoding.OPTIONAL_MODULES[coding])
+        monkeypatch.setattr(app_module, "COMPRESSION_CODINGS", [coding])
+    headers = { "Accept-Encoding": coding or "identity" }
+
+    response = client.get(CONCEPTS, headers=headers)
+    assert response.headers.get("Content-Encoding") == coding
+    etag = response.headers["ETag"]
+    assert etag.endswith('-' + coding + '"') if coding else "-" not in etag
+
+    not_modified = client.get(CONCEPTS, headers=dict(headers, **{ "If-None-Match": etag }))
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+    assert "Accept-Encoding" in not_modified.headers["Vary"]
+    assert not_modified.data == b""
+
+
+@pytest.mark.parametrize("coding", ["gzip", "br", "zstd"])
+def test_streamed_and_whole_compression_decompress_alike(coding):
+    if coding in content_encoding.OPTIONAL_MODULES:
+        module = pytest.importorskip(content_encoding.OPTIONAL_MODULES[coding])
+    chunks = ["first chunk ", b"second chunk ", "ünïcode " * 1000]
+    data = b"".join(chunk if isinstance(chunk, bytes) else chunk.encode("utf-8") for chunk in chunks)
+
+    whole = compress(data, coding, 5)
+    streamed = b"".join(compress_stream(iter(chunks), coding, 5))
+    if coding == "gzip":
+        decompress = gzip.decompress
+    elif coding == "br":
+        decompress = module.decompress
+    else:
+        decompress = lambda body: module.ZstdDecompressor().decompressobj().decompress(body)
+    assert decompress(whole) == data
+    assert decompress(streamed) == data
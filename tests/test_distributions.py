@@ -0,0 +1,27 @@
+import pytest
+from rdflib import URIRef
+from rdflib.namespace import DCAT, RDF
+
+from conftest import SYNCED, parse
+
+MOD_DISTRIBUTION = URIRef("https://w3id.org/mod#semanticArtefactDistribution")
+MOD_HAS_SYNTAX = URIRef("https://w3id.org/mod#hasSyntax")
+
+
+def distributions(graph):
+    return {
+        str(uri).rsplit("/", 1)[1]: (graph.value(uri, DCAT.downloadURL), graph.value(uri, MOD_HAS_SYNTAX))
+        for uri in graph.subjects(RDF.type, MOD_DISTRIBUTION)
+    }
+
+
+@pytest.mark.parametrize("page", ["1", "2"])
+def test_listed_distributions_match_the_single_distributions(client, app_module, page):
+    listed = distributions(parse(client.get("/artefacts/%s/distributions?pagesize=2&page=%s" % (SYNCED, page))))
+
+    first = (int(page) - 1) * 2 + 1
+    assert sorted(listed) == [str(first), str(first + 1)]
+    for distribution_id, (download_url, syntax) in listed.items():
+        assert syntax == URIRef(app_module.FORMATS[int(distribution_id) - 1]["uri"])
+        single = parse(client.get("/artefacts/%s/distributions/%s" % (SYNCED, distribution_id)))
+        assert distributions(single) == { distribution_id: (download_url, syntax) }
@@ -0,0 +1,142 @@
+import os
+import shutil
+import threading
+
+import pytest
+
+import graph_cache as graph_cache_module
+from conftest import ON_DEMAND
+from graph_cache import GraphCache, GraphCacheBusy
+
+
+class CountingHttp:
+    """Upstream client that counts dataset downloads and holds them until released."""
+
+    def __init__(self, http):
+        self.http = http
+        self.downloads = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def get(self, *args, **kwargs):
+        self.downloads += 1
+        self.started.set()
+        self.release.wait()
+        return self.http.get(*args, **kwargs)
+
+
+def graph_cache(http, directory, **kwargs):
+    return GraphCache(http, 1024 ** 3, 3600, snapshot_dir=str(directory), **kwargs)
+
+
+def test_processes_sharing_the_directory_load_an_artefact_once(app_module, tmp_path):
+    http = CountingHttp(app_module.upstream_client)
+    owner = graph_cache(http, tmp_path)
+    index = owner.get(ON_DEMAND)
+    assert http.downloads == 1
+    assert sorted(os.listdir(tmp_path)) == sorted([os.path.basename(index.path), ON_DEMAND + ".json", ON_DEMAND + ".lock"])
+
+    # Another worker process maps the snapshot instead of downloading the dataset
+    joined = graph_cache(http, tmp_path).get(ON_DEMAND)
+    assert http.downloads == 1
+    assert joined.path == index.path
+    assert joined.triple_count() == index.triple_count()
+
+
+def test_evicted_snapshots_are_removed_with_their_shared_file(app_module, tmp_path):
+    http = CountingHttp(app_module.upstream_client)
+    owner = graph_cache(http, tmp_path)
+    owner.get(ON_DEMAND)
+    joiner = graph_cache(http, tmp_path)
+    joiner.get(ON_DEMAND)
+
+    # Only the process that loaded the snapshot removes it
+    joiner.invalidate(ON_DEMAND)
+    assert len(os.listdir(tmp_path)) == 3
+    owner.invalidate(ON_DEMAND)
+    assert os.listdir(tmp_path) == [ON_DEMAND + ".lock"]
+
+    # The lock file is reused and the next load is not joined to the removed snapshot
+    joiner.get(ON_DEMAND)
+    assert http.downloads == 2
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_loads_beyond_the_queue_are_shed(app_module, tmp_path):
+    http = CountingHttp(app_module.upstream_client)
+    http.release.clear()
+    cache = graph_cache(http, tmp_path, max_loads=1, max_queued=0)
+
+    loader = threading.Thread(target=cache.get, args=(ON_DEMAND,))
+    loader.start()
+    try:
+        assert http.started.wait(10)
+        with pytest.raises(GraphCacheBusy):
+            cache.get("other")
+        assert cache.stats()["shed"] == 1
+        assert cache.stats()["loading"] == 1
+    finally:
+        http.release.set()
+        loader.join()
+    assert cache.peek(ON_DEMAND) is not None
+    assert cache.stats()["loads"] == 0
+
+
+def test_removed_snapshots_are_not_revalidated(app_module, tmp_path):
+    http = CountingHttp(app_module.upstream_client)
+    owner = graph_cache(http, tmp_path)
+    owner.get(ON_DEMAND)
+    joiner = graph_cache(http, tmp_path)
+    joiner.get(ON_DEMAND)
+
+    # The process that loaded the snapshot evicts it while the joined entry expires
+    owner.invalidate(ON_DEMAND)
+    joiner._entries[ON_DEMAND]["checked"] -= 2 * joiner.ttl
+    index = joiner.get(ON_DEMAND)
+    assert http.downloads == 2
+    assert os.path.exists(index.path)
+    assert len(os.listdir(tmp_path)) == 3
+
+    # The snapshot shared again is one that exists
+    assert graph_cache(http, tmp_path).get(ON_DEMAND).path == index.path
+    assert http.downloads == 2
+
+
+def test_snapshots_removed_while_revalidating_are_loaded_again(app_module, tmp_path, monkeypatch):
+    http = CountingHttp(app_module.upstream_client)
+    cache = graph_cache(http, tmp_path)
+    evicted = cache.get(ON_DEMAND)
+    cache._entries[ON_DEMAND]["checked"] -= 2 * cache.ttl
+    os.remove(cache._shared_path(ON_DEMAND))
+
+    # Removed by another process after the conditional request was sent
+    get = http.get
+
+    def get_and_remove(*args, **kwargs):
+        if os.path.exists(evicted.path):
+            os.remove(evicted.path)
+        return get(*args, **kwargs)
+
+    monkeypatch.setattr(http, "get", get_and_remove)
+    index = cache.get(ON_DEMAND)
+    assert index.path != evicted.path
+    assert os.path.exists(index.path)
+    # The load, the revalidation answered with 304 and the load that replaced it
+    assert http.downloads == 3
+    with open(cache._shared_path(ON_DEMAND)) as f:
+        assert index.path in f.read()
+
+
+def test_temporary_snapshot_directories_are_removed_at_exit(app_module, monkeypatch):
+    exit_handlers = []
+    monkeypatch.setattr(graph_cache_module.atexit, "register", lambda function, *args: exit_handlers.append((function, args)))
+    cache = GraphCache(app_module.upstream_client, 1024 ** 3, 3600)
+    cache.get(ON_DEMAND)
+    cache.get("missing")
+
+    assert exit_handlers == [(shutil.rmtree, (cache.snapshot_dir, True))]
+    assert os.path.basename(cache.snapshot_dir).startswith("mod-api-graphs-")
+    for function, args in exit_handlers:
+        function(*args)
+    assert not os.path.exists(cache.snapshot_dir)
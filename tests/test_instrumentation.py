@@ -0,0 +1,146 @@
+import os
+import pstats
+import re
+
+from conftest import SYNCED
+from instrumentation import Metrics, RequestTimer, SlowRequestProfiler, timed_chunks
+
+ROUTE = "/artefacts/<artefactID>/resources/concepts"
+SAMPLE = re.compile(r'^([a-z_]+)(?:\{((?:[a-z]+="(?:[^"\\]|\\.)*",?)*)\})? (\S+)$')
+
+
+def scrape(client):
+    """Return the samples of /metrics by name and labels, checking that each has a declared family."""
+    response = client.get("/metrics", headers={ "Accept-Encoding": "identity" })
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert response.headers["Cache-Control"] == "no-store"
+
+    families = {}
+    samples = {}
+    for line in response.data.decode("utf-8").splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, metric_type = line.split(" ")
+            families[name] = metric_type
+        elif not line.startswith("# HELP "):
+            match = SAMPLE.match(line)
+            assert match, line
+            name, labels, value = match.groups()
+            assert name in families or re.sub(r"_(bucket|sum|count)$", "", name) in families, line
+            samples[(name, labels or "")] = float(value)
+    return samples
+
+
+def route_samples(samples, name, route):
+    return dict((labels, value) for (sample_name, labels), value in samples.items() if sample_name == name and 'route="' + route + '"' in labels)
+
+
+def test_requests_are_exported_once_their_body_is_sent(client):
+    url = "/artefacts/%s/resources/concepts?pagesize=3&page=2" % SYNCED
+    before = scrape(client)
+
+    response = client.get(url, headers={ "Accept-Encoding": "identity" })
+    assert response.status_code == 200
+    assert "total;dur=" in response.headers["Server-Timing"]
+    size = len(response.data)
+    assert client.get("/artefacts/%s/resources/concepts?pagesize=0" % SYNCED).status_code == 400
+    after = scrape(client)
+
+    requests = 'route="%s",method="GET",status="%s"'
+    assert after[("mod_api_requests_total", requests % (ROUTE, 200))] == before.get(("mod_api_requests_total", requests % (ROUTE, 200)), 0) + 1
+    assert after[("mod_api_requests_total", requests % (ROUTE, 400))] == before.get(("mod_api_requests_total", requests % (ROUTE, 400)), 0) + 1
+
+    requests = sum(route_samples(after, "mod_api_requests_total", ROUTE).values())
+    count = after[("mod_api_request_duration_seconds_count", 'route="%s"' % ROUTE)]
+    assert count == requests
+    assert ('mod_api_stage_duration_seconds_count', 'route="%s",stage="query"' % ROUTE) in after
+
+    sizes = ("mod_api_response_size_bytes_sum", 'route="%s"' % ROUTE)
+    assert after[sizes] - before.get(sizes, 0) >= size
+
+    # Buckets are cumulative up to the count
+    buckets = list(route_samples(after, "mod_api_request_duration_seconds_bucket", ROUTE).values())
+    assert buckets == sorted(buckets)
+    assert buckets[-1] == count
+
+    assert ("mod_api_snapshot_bytes", 'artefact="%s"' % SYNCED) in after
+    assert after[("mod_api_upstream_in_flight", "")] == 0
+    assert ("mod_api_rendered_cache_events_total", 'event="hits"') in after
+
+
+def test_unmatched_routes_are_counted_together(client):
+    before = scrape(client).get(("mod_api_requests_total", 'route="unmatched",method="GET",status="404"'), 0)
+    client.get("/no/such/route").data
+    client.get("/another/missing/route").data
+    assert scrape(client)[("mod_api_requests_total", 'route="unmatched",method="GET",status="404"')] == before + 2
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics()
+    timer = RequestTimer()
+    timer.add("query", 0.002)
+    metrics.observe('/a"b\\c\nd', "GET", 200, timer, 2048)
+    lines = metrics.render({ "statuses": {}, "errors": 0, "in_flight": 0, "latency": {}, "latency_buckets": (), "pool": {} }, { "entries": 0 }, { "shed": 0 }, dict.fromkeys(["hits", "misses", "stored", "evicted", "entries", "bytes", "max_bytes"], 0), {}).splitlines()
+
+    assert 'mod_api_requests_total{route="/a\\"b\\\\c\\nd",method="GET",status="200"} 1' in lines
+    assert 'mod_api_stage_duration_seconds_count{route="/a\\"b\\\\c\\nd",stage="query"} 1' in lines
+    assert 'mod_api_response_size_bytes_bucket{route="/a\\"b\\\\c\\nd",le="1024"} 0' in lines
+    assert 'mod_api_response_size_bytes_bucket{route="/a\\"b\\\\c\\nd",le="10240"} 1' in lines
+    assert 'mod_api_response_size_bytes_bucket{route="/a\\"b\\\\c\\nd",le="+Inf"} 1' in lines
+
+
+def test_streamed_bodies_are_timed_and_sized():
+    timer = RequestTimer()
+    finished = []
+    chunks = list(timed_chunks(iter(["ab", b"cde", "ü"]), timer, "serialize", finished.append))
+    assert chunks == [b"ab", b"cde", "ü".encode("utf-8")]
+    assert finished == [7]
+    assert timer.stages["serialize"] > 0
+
+
+def test_sampled_slow_requests_are_profiled(client, app_module, monkeypatch, tmp_path):
+    slow = scrape(client)[("mod_api_slow_requests_total", "")]
+    monkeypatch.setattr(app_module, "profiler", SlowRequestProfiler(str(tmp_path), 1e-6, 1.0))
+    monkeypatch.setattr(app_module, "SLOW_REQUEST_THRESHOLD", 1e-6)
+
+    response = client.get("/artefacts/%s/resources/concepts?pagesize=2" % SYNCED)
+    assert response.status_code == 200
+    # The profile covers streaming the body as well
+    assert not os.listdir(str(tmp_path))
+    response.data
+
+    profiles = os.listdir(str(tmp_path))
+    assert len(profiles) == 1
+    assert re.fullmatch(r"\d{8}T\d{6}-\d+ms-artefacts_artefactID_resources_concepts\.prof", profiles[0])
+    stats = pstats.Stats(os.path.join(str(tmp_path), profiles[0]))
+    assert any(function == "artefact_resource_concepts" for _, _, function in stats.stats)
+
+    # The profiler is released for the next request
+    client.get("/artefacts/%s" % SYNCED).data
+    assert [profile for profile in os.listdir(str(tmp_path)) if profile.endswith("-artefacts_artefactID.prof")]
+    monkeypatch.setattr(app_module, "profiler", SlowRequestProfiler(str(tmp_path), 0, 0))
+    assert scrape(client)[("mod_api_slow_requests_total", "")] == slow + 2
+
+
+def test_requests_are_not_profiled_unless_sampled_and_slow(client, app_module, monkeypatch, tmp_path):
+    monkeypatch.setattr(app_module, "SLOW_REQUEST_THRESHOLD", 1e-6)
+    for threshold, sample_rate in [(1e-6, 0.0), (0, 1.0), (60, 1.0)]:
+        monkeypatch.setattr(app_module, "profiler", SlowRequestProfiler(str(tmp_path), threshold, sample_rate))
+        client.get("/artefacts/%s/resources/concepts?pagesize=2" % SYNCED).data
+        assert not os.path.exists(str(tmp_path)) or not os.listdir(str(tmp_path)), (threshold, sample_rate)
+        assert app_module.profiler._active.acquire(blocking=False)
+        app_module.profiler._active.release()
+
+
+def test_one_request_is_profiled_at_a_time(tmp_path):
+    profiler = SlowRequestProfiler(str(tmp_path), 1e-6, 1.0)
+    profile = profiler.start()
+    assert profile is not None
+    assert profiler.start() is None
+    assert profiler.stop(profile, "/a", 0) is None
+    assert not os.listdir(str(tmp_path))
+
+    profile = profiler.start()
+    path = profiler.stop(profile, "/<a>/b", 0.5)
+    assert os.path.basename(path).endswith("-500ms-a_b.prof")
+    assert os.path.exists(path)
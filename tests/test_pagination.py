@@ -0,0 +1,75 @@
+import pytest
+from rdflib import URIRef
+
+from conftest import collection_of, HYDRA, ON_DEMAND, parse, SYNCED
+
+
+def walk(client, url):
+    """Follow the hydra:next links from url and return the members of all pages and the totalItems of the collection."""
+    members = []
+    total = None
+    while url is not None:
+        response = client.get(url)
+        assert response.status_code == 200, url
+        graph = parse(response)
+        collection = collection_of(graph)
+        total = int(graph.value(collection, HYDRA.totalItems))
+        members.extend(graph.objects(collection, HYDRA.member))
+        url = graph.value(graph.value(collection, HYDRA.view), HYDRA.next)
+    return members, total
+
+
+@pytest.mark.parametrize("url", [
+    "/artefacts?cursor=&pagesize=1",
+    "/records?cursor=&pagesize=1",
+    "/artefacts/" + SYNCED + "/resources?cursor=&pagesize=17",
+    "/artefacts/" + SYNCED + "/resources?cursor=&pagesize=9&type=skos:Concept&lang=fi",
+    "/artefacts/" + SYNCED + "/resources?cursor=&pagesize=5&inScheme=http://bench.example.org/" + SYNCED + "/scheme&type=skos:Concept",
+    "/artefacts/" + SYNCED + "/resources/concepts?cursor=&pagesize=11",
+    "/artefacts/" + SYNCED + "/resources/properties?cursor=&pagesize=1",
+    "/artefacts/" + SYNCED + "/resources/labels?cursor=&pagesize=4",
+    "/artefacts/" + SYNCED + "/resources/classes?cursor=&pagesize=1",
+    "/artefacts/" + SYNCED + "/resources/schemes?cursor=&pagesize=1",
+    "/artefacts/" + SYNCED + "/resources/collections?cursor=&pagesize=1",
+    "/artefacts/" + ON_DEMAND + "/resources/concepts?cursor=&pagesize=7",
+    "/artefacts/" + ON_DEMAND + "/resources?cursor=&pagesize=8&lang=en",
+    "/search/content?q=concept&cursor=&pagesize=13",
+    "/search/metadata?q=benchmark&cursor=&pagesize=1"
+])
+def test_cursor_pages_have_no_duplicates_or_gaps(client, url):
+    members, total = walk(client, url)
+    assert total > 0
+    assert len(set(members)) == len(members) == total
+
+
+def test_cursor_pages_of_search_fallback(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module.search_index, "is_empty", lambda: True)
+    members, total = walk(client, "/search/content?q=concept+1*&cursor=&pagesize=6")
+    assert total > 0
+    assert len(set(members)) == len(members) == total
+
+
+def test_cursor_and_offset_pages_agree(client):
+    members, _ = walk(client, "/artefacts/" + SYNCED + "/resources/concepts?cursor=&pagesize=10")
+    graph = parse(client.get("/artefacts/" + SYNCED + "/resources/concepts?page=3&pagesize=10"))
+    assert set(graph.objects(collection_of(graph), HYDRA.member)) == set(members[20:30])
+
+
+@pytest.mark.parametrize("cursor", ["!!!", "a", "Zm9v=", "Zm9v+", "_w"])
+def test_malformed_cursor_is_rejected(client, cursor):
+    assert client.get("/artefacts/" + SYNCED + "/resources/concepts?pagesize=5&cursor=" + cursor).status_code == 400
+
+
+@pytest.mark.parametrize("query", ["pagesize=0", "page=0", "pagesize=0&cursor="])
+@pytest.mark.parametrize("path", ["/artefacts", "/artefacts/%s/resources" % SYNCED, "/artefacts/%s/resources/concepts" % SYNCED, "/search/content?q=a"])
+def test_pages_must_have_items(client, path, query):
+    response = client.get(path + ("&" if "?" in path else "?") + query)
+    assert response.status_code == 400
+
+
+def test_unserializable_collections_fail_before_the_response_starts(client, app_module, monkeypatch):
+    # RDF/XML cannot write a predicate without a local name
+    monkeypatch.setattr(app_module.snapshot_store.get(SYNCED).__class__, "predicates", lambda self, subjects=None: [URIRef("http://example.org/vocab/123")])
+    for path in ["/artefacts/%s/resources/concepts?format=rdfxml" % SYNCED, "/artefacts/%s/resources/concepts?pagesize=all&format=rdfxml" % SYNCED]:
+        assert client.get(path).status_code == 500
+    assert client.get("/artefacts/%s/resources/concepts?format=ttl" % SYNCED).status_code == 200
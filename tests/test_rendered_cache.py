@@ -0,0 +1,37 @@
+import gzip
+
+from rdflib.namespace import RDF, SKOS
+
+from conftest import SYNCED
+from snapshot_store import INDIVIDUALS
+
+URL_ROOT = "http://warm.example.org/"
+
+
+def requests_total(client, route):
+    lines = client.get("/metrics", headers={ "Accept-Encoding": "identity" }).data.decode("utf-8").splitlines()
+    return sum(float(line.rsplit(" ", 1)[1]) for line in lines if line.startswith("mod_api_requests_total{") and 'route="' + route + '"' in line)
+
+
+def test_warm_up_renders_the_default_urls_without_counting_them(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "RENDERED_CACHE_WARM_PAGES", 1)
+    route = "/artefacts/<artefactID>/resources/concepts"
+    requests = requests_total(client, route)
+    stored = app_module.rendered_cache.stats()["stored"]
+
+    app_module.warm_rendered_cache(SYNCED, URL_ROOT)
+    # Every collection without parameters and the first page of those with members
+    snapshot = app_module.snapshot_store.get(SYNCED)
+    pages = sum(1 for subject_type in [None, SKOS.Concept, RDF.Property, INDIVIDUALS, app_module.SKOSXL.Label] if snapshot.count(subject_type))
+    assert app_module.rendered_cache.stats()["stored"] == stored + 5 + pages
+    assert requests_total(client, route) == requests
+
+    for url in ["/artefacts/%s/resources/concepts" % SYNCED, "/artefacts/%s/resources/concepts?page=1&pagesize=50" % SYNCED]:
+        hits = app_module.rendered_cache.stats()["hits"]
+        response = client.get(url, base_url=URL_ROOT, headers={ "Accept-Encoding": "gzip" })
+        assert response.status_code == 200
+        assert response.headers["Content-Encoding"] == "gzip"
+        # Requests are counted once their body has been sent
+        assert gzip.decompress(response.data)
+        assert app_module.rendered_cache.stats()["hits"] == hits + 1
+    assert requests_total(client, route) == requests + 2
@@ -0,0 +1,68 @@
+import json
+import threading
+
+from requests.structures import CaseInsensitiveDict
+
+from response_cache import MemoryBackend, ResponseCache
+
+
+class Response:
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class SlowClient:
+    """Upstream client whose requests wait until released."""
+
+    def __init__(self):
+        self.requests = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def request(self, method, path, params=None, **kwargs):
+        self.requests += 1
+        self.started.set()
+        self.release.wait()
+        return Response(200, { "Content-Type": "application/json", "X-Request": str(self.requests) }, b'{"id": "a"}')
+
+
+def test_concurrent_misses_share_one_request_but_not_its_response():
+    client = SlowClient()
+    cache = ResponseCache(client, MemoryBackend(16), [("GET", r"a/", 60, 0)], 60)
+    responses = [None] * 4
+
+    def get(i):
+        responses[i] = cache.get("a/", params={ "lang": "en" })
+
+    threads = [threading.Thread(target=get, args=(i,)) for i in range(len(responses))]
+    threads[0].start()
+    assert client.started.wait(10)
+    for thread in threads[1:]:
+        thread.start()
+    while cache.stats()["joined"] < len(threads) - 1:
+        threading.Event().wait(0.01)
+    client.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert client.requests == 1
+    assert len(set(map(id, responses))) == len(responses)
+    for response in responses:
+        assert response.status_code == 200
+        assert response.headers["x-request"] == "1"
+        assert response.json() == { "id": "a" }
+
+    # Changing one response leaves the others as they were
+    responses[1].headers["X-Request"] = "changed"
+    assert [response.headers["X-Request"] for response in responses] == ["1", "changed", "1", "1"]
+
+
+def test_search_results_have_a_policy_of_their_own(app_module):
+    policy = app_module.upstream._policy("GET", "search/")
+    assert policy[2:] == (app_module.RESPONSE_CACHE_POLICIES[1][2], 0)
+    assert app_module.upstream._policy("GET", "bench120/")[3] == app_module.RESPONSE_CACHE_STALE
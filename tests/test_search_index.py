@@ -0,0 +1,184 @@
+import hashlib
+
+import pytest
+from rdflib.namespace import SKOS
+
+from conftest import HYDRA, collection_of, parse
+from search_index import SearchIndex, fts_query
+from snapshot_store import Snapshot, build_snapshot
+
+PREFIXES = """
+@prefix ex: <http://example.org/> .
+@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+@prefix owl: <http://www.w3.org/2002/07/owl#> .
+"""
+
+VOCABULARY = PREFIXES + """
+ex:water a skos:Concept ; skos:prefLabel "Water"@en, "Vesi"@fi ; skos:altLabel "Waters"@en .
+ex:waste a skos:Concept ; skos:prefLabel "Waste water"@en ; skos:hiddenLabel "wastewater" .
+ex:quote a skos:Concept ; skos:prefLabel "Say \\"AND\\" OR NEAR"@en .
+ex:star a skos:Concept, owl:Class ; skos:prefLabel "Star*Gazing (NOT) col:on"@en .
+ex:accent a skos:Concept ; skos:prefLabel "Émigré café"@fr .
+ex:unlabeled a skos:Concept ; skos:notation "W1" .
+"""
+
+DETAILS = { "id": "vocab", "title": "Water Vocabulary", "languages": ["en", "fi"] }
+
+
+def snapshot(tmp_path, turtle, name="vocab"):
+    data_path = str(tmp_path / (name + ".ttl"))
+    with open(data_path, "w", encoding="utf-8") as f:
+        f.write(turtle)
+    path = str(tmp_path / (name + ".snapshot"))
+    build_snapshot(data_path, path, { "artefact": name, "hash": hashlib.sha256(turtle.encode("utf-8")).hexdigest() })
+    return Snapshot(path)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.sqlite3"))
+    assert index.is_empty()
+    assert index.update("vocab", snapshot(tmp_path, VOCABULARY), DETAILS)
+    yield index
+    index.close()
+
+
+def uris(results):
+    return [result["uri"] for result in results]
+
+
+@pytest.mark.parametrize("q, expected", [
+    ("water", '"water"*'),
+    ("  wat  vesi ", '"wat"* "vesi"*'),
+    ('say "and"', '"say"* "and"*'),
+    ('a"b', '"a""b"*'),
+    ("star*", '"star"*'),
+    ('"*', None),
+    ("", None),
+    ("   ", None)
+])
+def test_queries_are_quoted_prefix_terms(q, expected):
+    assert fts_query(q) == expected
+
+
+@pytest.mark.parametrize("q, expected", [
+    ("wat", ["http://example.org/waste", "http://example.org/water"]),
+    ("water waste", ["http://example.org/waste"]),
+    ("wastew", ["http://example.org/waste"]),
+    ('"AND"', ["http://example.org/quote"]),
+    ("and OR near", ["http://example.org/quote"]),
+    ("AND", ["http://example.org/quote"]),
+    ("NOT", ["http://example.org/star"]),
+    ("(not)", ["http://example.org/star"]),
+    ("star* gaz", ["http://example.org/star"]),
+    ("col:on", ["http://example.org/star"]),
+    ("emigre CAFE", ["http://example.org/accent"]),
+    ("-water", ["http://example.org/waste", "http://example.org/water"]),
+    ('say "and', ["http://example.org/quote"]),
+    ("NEAR(water waste)", []),
+    ("^water", ["http://example.org/waste", "http://example.org/water"]),
+    ("W1", []),
+    ("missing", [])
+])
+def test_fts_syntax_in_queries_is_matched_as_text(index, q, expected):
+    count, results = index.search_content(q, None, 0, 10)
+    assert uris(results) == expected
+    assert count == len(expected)
+
+
+def test_counts_are_of_resources_not_labels_or_pages(index):
+    # Water matches four labels of two resources
+    count, results = index.search_content("wa", None, 0, 1)
+    assert count == 2
+    assert uris(results) == ["http://example.org/waste"]
+    count, results = index.search_content("wa", None, 1, 1)
+    assert count == 2
+    assert uris(results) == ["http://example.org/water"]
+    assert index.search_content("wa", None, 0, 1, after="http://example.org/waste") == (2, results)
+    assert index.search_content("wa", None, 2, 1) == (2, [])
+
+
+def test_language_filters_results_and_their_labels(index):
+    count, results = index.search_content("vesi", "fi", 0, 10)
+    assert count == 1
+    assert results[0]["labels"] == [(str(SKOS.prefLabel), "Vesi", "fi")]
+
+    assert index.search_content("vesi", "en", 0, 10) == (0, [])
+    count, results = index.search_content("wa", "en", 0, 10)
+    assert count == 2
+    assert all(lang == "en" for result in results for _, _, lang in result["labels"])
+    # Labels without a language tag only match without a filter
+    assert index.search_content("wastewater", "en", 0, 10)[0] == 0
+    labels = index.search_content("wastewater", None, 0, 10)[1][0]["labels"]
+    assert sorted(labels) == [(str(SKOS.hiddenLabel), "wastewater", ""), (str(SKOS.prefLabel), "Waste water", "en")]
+
+
+def test_results_carry_their_labels_and_types(index):
+    star = index.search_content("star", None, 0, 10)[1][0]
+    assert sorted(star["types"]) == ["http://www.w3.org/2002/07/owl#Class", str(SKOS.Concept)]
+
+    water = index.search_content("water", None, 0, 10)[1][1]
+    assert water["uri"] == "http://example.org/water"
+    assert water["types"] == [str(SKOS.Concept)]
+    assert sorted(water["labels"]) == [(str(SKOS.altLabel), "Waters", "en"), (str(SKOS.prefLabel), "Vesi", "fi"), (str(SKOS.prefLabel), "Water", "en")]
+
+
+def test_metadata_matches_title_identifier_and_languages(index):
+    for q in ["water", "vocab", "fi", "VOCABULARY wat"]:
+        assert index.search_metadata(q, 0, 10) == (1, [DETAILS]), q
+    assert index.search_metadata("sv", 0, 10) == (0, [])
+    assert index.search_metadata('title:"water OR', 0, 10) == (0, [])
+
+
+def test_changed_snapshots_are_reindexed(index, tmp_path):
+    generation = index.generation()
+    assert not index.update("vocab", snapshot(tmp_path, VOCABULARY), DETAILS)
+    assert index.generation() == generation
+
+    changed = PREFIXES + 'ex:water a skos:Concept ; skos:prefLabel "Fresh water"@en .\nex:river a skos:Concept ; skos:prefLabel "River"@en .\n'
+    assert index.update("vocab", snapshot(tmp_path, changed, "changed"), DETAILS)
+    assert index.generation() != generation
+    assert uris(index.search_content("wa", None, 0, 10)[1]) == ["http://example.org/water"]
+    assert index.search_content("fresh", None, 0, 10)[0] == 1
+    assert index.search_content("vesi", None, 0, 10) == (0, [])
+    assert index.search_content("star", None, 0, 10) == (0, [])
+    assert index.search_content("river", None, 0, 10)[1][0]["types"] == [str(SKOS.Concept)]
+
+    # Changed details alone reindex the metadata
+    generation = index.generation()
+    assert index.update("vocab", snapshot(tmp_path, changed, "changed"), dict(DETAILS, title="Rivers"))
+    assert index.generation() != generation
+    assert index.search_metadata("water", 0, 10) == (0, [])
+    assert index.search_metadata("rivers", 0, 10)[0] == 1
+
+    index.remove("vocab")
+    assert index.is_empty()
+    assert index.search_content("river", None, 0, 10) == (0, [])
+    assert index.search_metadata("rivers", 0, 10) == (0, [])
+
+
+def test_vocabularies_are_indexed_separately(index, tmp_path):
+    other = PREFIXES + 'ex:water a skos:Concept ; skos:prefLabel "Water"@en .\n'
+    assert index.update("other", snapshot(tmp_path, other, "other"), dict(DETAILS, id="other", title="Other"))
+    assert index.search_content("water", None, 0, 10)[0] == 2
+
+    index.remove("other")
+    count, results = index.search_content("water", None, 0, 10)
+    assert count == 2
+    assert len(results[1]["labels"]) == 3
+
+
+def test_search_content_route_counts_the_index_matches(client, app_module):
+    count, results = app_module.search_index.search_content("concept", "en", 0, 1000)
+    assert count > 5
+
+    response = client.get("/search/content?q=concept&lang=en&pagesize=5")
+    assert response.status_code == 200
+    graph = parse(response)
+    collection = collection_of(graph)
+    assert int(graph.value(collection, HYDRA.totalItems)) == count
+    members = [str(member) for member in graph.objects(collection, HYDRA.member)]
+    assert sorted(members) == uris(results[:5])
+
+    graph = parse(client.get("/search/content?q=missinglabel"))
+    assert int(graph.value(collection_of(graph), HYDRA.totalItems)) == 0
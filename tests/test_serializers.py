@@ -0,0 +1,161 @@
+import json
+
+import pytest
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.compare import isomorphic
+from rdflib.namespace import RDF, SKOS, XSD
+
+from conftest import ON_DEMAND, SYNCED
+from serializers import Descriptions, serialize
+
+
+FORMATS = {
+    "jsonld": "json-ld",
+    "ttl": "turtle",
+    "rdfxml": "xml"
+}
+
+EXPORT_FORMATS = {
+    "ndjson": "ndjson",
+    "nt": "nt",
+    "jsonld": "json-ld",
+    "ttl": "turtle",
+    "rdfxml": "xml"
+}
+
+ROUTES = [
+    "/",
+    "/artefacts?pagesize=1&page=2",
+    "/artefacts/" + SYNCED,
+    "/artefacts/" + SYNCED + "/distributions",
+    "/artefacts/" + SYNCED + "/distributions?page=2&pagesize=2",
+    "/artefacts/" + SYNCED + "/distributions/2",
+    "/artefacts/" + SYNCED + "/distributions/latest",
+    "/artefacts/" + ON_DEMAND + "/distributions/latest",
+    "/artefacts/" + SYNCED + "/record",
+    "/records",
+    "/records/" + ON_DEMAND,
+    "/artefacts/" + SYNCED + "/resources?pagesize=20&page=2",
+    "/artefacts/" + SYNCED + "/resources?pagesize=5&type=skos:Concept&lang=fi",
+    "/artefacts/" + SYNCED + "/resources?uri=http://bench.example.org/" + SYNCED + "/c10&uri=http://bench.example.org/" + SYNCED + "/missing",
+    "/artefacts/" + SYNCED + "/resources/concepts?pagesize=7&cursor=",
+    "/artefacts/" + SYNCED + "/resources/properties",
+    "/artefacts/" + SYNCED + "/resources/individuals",
+    "/artefacts/" + SYNCED + "/resources/labels?pagesize=3",
+    "/artefacts/" + SYNCED + "/resources/schemes",
+    "/artefacts/" + SYNCED + "/resources/classes",
+    "/artefacts/" + SYNCED + "/resources/collections",
+    "/artefacts/" + ON_DEMAND + "/resources/concepts?pagesize=4&page=3",
+    "/artefacts/" + ON_DEMAND + "/resources?uri=http://bench.example.org/" + ON_DEMAND + "/c3",
+    "/search/content?q=concept&pagesize=5",
+    "/search/metadata?q=benchmark"
+]
+
+EXPORTS = [
+    "/artefacts/" + SYNCED + "/resources/concepts?pagesize=all",
+    "/artefacts/" + SYNCED + "/resources?pagesize=all&lang=fi",
+    "/artefacts/" + ON_DEMAND + "/resources/labels?pagesize=all"
+]
+
+
+def rdflib_serialize_stream(descriptions, rdflib_format, namespaces):
+    """The rdflib serialization the direct writers replace."""
+    graph = Graph()
+    for prefix, namespace in namespaces.items():
+        graph.bind(prefix, namespace, override=True)
+    for s, predicate_objects in descriptions:
+        for p, o in predicate_objects:
+            graph.add((s, p, o))
+    if rdflib_format == "ndjson":
+        rdflib_format = "nt"
+    if rdflib_format == "json-ld":
+        return iter([graph.serialize(format="json-ld", context=dict(namespaces))])
+    return iter([graph.serialize(format=rdflib_format)])
+
+
+def parse(body, format):
+    if format == "ndjson":
+        body = json.dumps([json.loads(line) for line in body.splitlines() if line])
+        format = "json-ld"
+    return Graph().parse(data=body, format=format)
+
+
+def render(client, url):
+    response = client.get(url)
+    assert response.status_code == 200, url
+    return response.data.decode("utf-8")
+
+
+def assert_isomorphic_with_rdflib(client, app_module, monkeypatch, url, format):
+    direct = parse(render(client, url), format)
+    assert len(direct) > 0
+
+    with monkeypatch.context() as m:
+        m.setattr(app_module, "serialize", lambda descriptions, rdflib_format, namespaces: "".join(rdflib_serialize_stream(iter(descriptions), rdflib_format, namespaces)))
+        m.setattr(app_module, "serialize_stream", rdflib_serialize_stream)
+        # Rendered responses of the direct writers would be served again otherwise
+        m.setattr(app_module.rendered_cache, "get", lambda key: None)
+        reference = parse(render(client, url), "nt" if format == "ndjson" else format)
+
+    assert isomorphic(direct, reference), url
+
+
+@pytest.mark.parametrize("format", FORMATS)
+@pytest.mark.parametrize("route", ROUTES)
+def test_routes_are_isomorphic_with_rdflib(client, app_module, monkeypatch, route, format):
+    separator = "&" if "?" in route else "?"
+    assert_isomorphic_with_rdflib(client, app_module, monkeypatch, route + separator + "format=" + format, FORMATS[format])
+
+
+@pytest.mark.parametrize("format", EXPORT_FORMATS)
+@pytest.mark.parametrize("route", EXPORTS)
+def test_exports_are_isomorphic_with_rdflib(client, app_module, monkeypatch, route, format):
+    assert_isomorphic_with_rdflib(client, app_module, monkeypatch, route + "&format=" + format, EXPORT_FORMATS[format])
+
+
+def test_literals_and_terms_are_isomorphic_with_rdflib():
+    descriptions = Descriptions()
+    subject = URIRef("http://example.org/a")
+    note = BNode()
+    descriptions.add((subject, RDF.type, SKOS.Concept))
+    descriptions.add((subject, SKOS.prefLabel, Literal('Quotes " and \\ and \'', lang="en")))
+    descriptions.add((subject, SKOS.prefLabel, Literal("Line\nbreak\r\tand ünïcode ✓", lang="fi-x-test")))
+    descriptions.add((subject, SKOS.altLabel, Literal('ends with a quote"')))
+    descriptions.add((subject, SKOS.notation, Literal("42", datatype=XSD.integer)))
+    descriptions.add((subject, SKOS.notation, Literal("custom", datatype=URIRef("http://example.org/type#x"))))
+    descriptions.add((subject, SKOS.note, note))
+    descriptions.add((subject, URIRef("http://other.example.org/vocab/with-dash"), URIRef("http://example.org/b%20c")))
+    descriptions.add((subject, URIRef("http://example.org/p#0"), Literal("<&>")))
+    descriptions.add((note, RDF.value, Literal("")))
+    descriptions.add((URIRef("http://example.org/ns/"), SKOS.related, subject))
+
+    graph = Graph()
+    for triple in [(s, p, o) for s, predicate_objects in descriptions for p, o in predicate_objects]:
+        graph.add(triple)
+
+    namespaces = { "skos": str(SKOS), "ex": "http://example.org/", "xsd": str(XSD) }
+    for rdflib_format, parse_format in [("json-ld", "json-ld"), ("ttl", "turtle"), ("nt", "nt"), ("ndjson", "ndjson")]:
+        assert isomorphic(parse(serialize(descriptions, rdflib_format, namespaces), parse_format), graph), rdflib_format
+
+    # RDF/XML cannot write the predicate ending in a digit, the others are checked without it
+    descriptions = Descriptions()
+    for s, p, o in graph:
+        if p != URIRef("http://example.org/p#0"):
+            descriptions.add((s, p, o))
+    graph.remove((None, URIRef("http://example.org/p#0"), None))
+    assert isomorphic(parse(serialize(descriptions, "xml", namespaces), "xml"), graph)
+
+
+def test_descriptions_behave_as_a_graph():
+    a, b = URIRef("http://example.org/a"), URIRef("http://example.org/b")
+    triples = [(a, RDF.type, SKOS.Concept), (a, SKOS.prefLabel, Literal("a", lang="en")), (b, RDF.type, SKOS.ConceptScheme), (b, SKOS.hasTopConcept, a)]
+    descriptions, graph = Descriptions(), Graph()
+    for triple in triples + triples[:2]:
+        descriptions.add(triple)
+        graph.add(triple)
+
+    assert len(descriptions) == len(graph) == 4
+    assert list(descriptions.subjects()) == [a, b]
+    for predicate, object in [(RDF.type, None), (RDF.type, SKOS.Concept), (SKOS.hasTopConcept, a), (SKOS.note, None)]:
+        assert set(descriptions.subjects(predicate, object)) == set(graph.subjects(predicate, object))
+    assert [(s, p, o) for s, predicate_objects in descriptions for p, o in predicate_objects] == triples
@@ -0,0 +1,128 @@
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+from conftest import ROOT, SYNCED
+
+
+@pytest.fixture(scope="module")
+def serve(app_module):
+    import serve
+    return serve
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(condition, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(0.1)
+    raise AssertionError("Timed out")
+
+
+@pytest.mark.parametrize("vocabularies, synced", [
+    (SYNCED, [SYNCED]),
+    (" a, b ,,c ", ["a", "b", "c"]),
+    ("", []),
+    ("*", ["listed"])
+])
+def test_vocabularies_to_warm_up(serve, monkeypatch, vocabularies, synced):
+    calls = []
+
+    def sync_artefact(artefact_id):
+        calls.append(artefact_id)
+        if artefact_id == "b":
+            raise RuntimeError("sync failed")
+        return { "changed": False }
+
+    monkeypatch.setattr(serve, "sync_artefact", sync_artefact)
+    monkeypatch.setattr(serve, "list_artefacts", lambda http: ["listed"])
+    # Failing syncs do not stop the warm-up of the others
+    serve.warm_up(vocabularies)
+    assert calls == synced
+
+
+def test_warm_up_serves_the_existing_snapshots_if_listing_fails(serve, monkeypatch):
+    def list_artefacts(http):
+        raise requests.exceptions.ConnectionError("down")
+
+    monkeypatch.setattr(serve, "list_artefacts", list_artefacts)
+    monkeypatch.setattr(serve, "sync_artefact", lambda artefact_id: pytest.fail("nothing to sync"))
+    serve.warm_up("*")
+
+
+def test_probes_during_the_warm_up(serve):
+    responses = []
+
+    def start_response(status, headers):
+        responses.append((status, dict(headers)))
+
+    assert serve.warming_up({ "PATH_INFO": "/health/live" }, start_response) == [b'{"status": "ok"}\n']
+    serve.warming_up({ "PATH_INFO": "/health/ready" }, start_response)
+    serve.warming_up({ "PATH_INFO": "/artefacts" }, start_response)
+    assert [status for status, _ in responses] == ["200 OK", "503 Service Unavailable", "503 Service Unavailable"]
+    assert all(headers["Retry-After"] == "10" and headers["Cache-Control"] == "no-store" for _, headers in responses)
+
+
+def test_workers_are_started_replaced_and_stopped(tmp_path):
+    port = free_port()
+    env = dict(os.environ, **{
+        "SERVE_HOST": "127.0.0.1",
+        "SERVE_PORT": str(port),
+        "SERVE_WORKERS": "2",
+        "SERVE_VOCABULARIES": SYNCED,
+        "SNAPSHOT_DIR": str(tmp_path / "snapshots"),
+        "SEARCH_INDEX_PATH": str(tmp_path / "search_index.sqlite3"),
+        "GRAPH_CACHE_DIR": str(tmp_path / "graphs"),
+        "SYNC_INTERVAL": "0"
+    })
+    log_path = str(tmp_path / "serve.log")
+    with open(log_path, "w") as log:
+        process = subprocess.Popen([sys.executable, os.path.join(ROOT, "serve.py")], cwd=str(tmp_path), env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    def log():
+        with open(log_path) as f:
+            return f.read()
+
+    def workers():
+        return re.findall(r"Started worker (\d+)", log())
+
+    try:
+        url = "http://127.0.0.1:%d" % port
+        wait_for(lambda: len(workers()) == 2)
+        assert SYNCED + ": updated" in log()
+        assert os.path.exists(str(tmp_path / "snapshots"))
+        assert requests.get(url + "/health/ready", timeout=10).status_code == 200
+        response = requests.get(url + "/artefacts/%s/resources/concepts?pagesize=2" % SYNCED, timeout=10)
+        assert response.status_code == 200
+        assert len(response.json()["@graph"]) > 0
+
+        # A worker that exits is replaced
+        os.kill(int(workers()[0]), signal.SIGKILL)
+        wait_for(lambda: len(workers()) == 3)
+        assert "restarting it" in log()
+        assert requests.get(url + "/health/live", timeout=10).status_code == 200
+
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(30) == 0
+        for pid in workers()[1:]:
+            with pytest.raises(ProcessLookupError):
+                os.kill(int(pid), 0)
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
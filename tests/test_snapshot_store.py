@@ -0,0 +1,77 @@
+import pytest
+from rdflib import URIRef
+from rdflib.namespace import SKOS
+
+from conftest import HYDRA, SYNCED, collection_of, parse
+from snapshot_store import build_snapshot, MAGIC, Snapshot, SnapshotFormatError, SnapshotStore
+
+# Blank nodes typed and labelled like the concepts they describe
+BLANK_NODES = """
+@prefix ex: <http://example.org/> .
+@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+
+ex:scheme a skos:ConceptScheme .
+ex:a a skos:Concept ; skos:inScheme ex:scheme ; skos:prefLabel "A"@en, "A"@fi ;
+    skos:related [ a skos:Concept ; skos:inScheme ex:scheme ; skos:prefLabel "Anonymous"@en ] .
+ex:b a skos:Concept ; skos:inScheme ex:scheme ; skos:prefLabel "B"@en ;
+    skos:note [ a skos:Concept ; skos:prefLabel "Note"@sv ] .
+[] a skos:Concept ; skos:prefLabel "Orphan"@en .
+"""
+
+
+def test_snapshots_of_another_format_version_are_rebuilt(app_module, tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    assert store.sync(app_module.upstream_client, SYNCED)
+    assert not store.sync(app_module.upstream_client, SYNCED)
+    current = store.get(SYNCED)
+
+    # A snapshot written by the previous format version
+    with open(store.path(SYNCED), "r+b") as f:
+        f.write(b"MODSNAP1")
+    with pytest.raises(SnapshotFormatError):
+        Snapshot(store.path(SYNCED))
+    assert SnapshotStore(str(tmp_path)).get(SYNCED) is None
+
+    assert store.sync(app_module.upstream_client, SYNCED)
+    rebuilt = store.get(SYNCED)
+    with open(store.path(SYNCED), "rb") as f:
+        assert f.read(len(MAGIC)) == MAGIC
+    assert rebuilt.header["hash"] == current.header["hash"]
+    assert rebuilt.triple_count() == current.triple_count()
+    assert rebuilt.count("individuals") == current.count("individuals")
+
+
+def test_blank_nodes_are_not_counted_or_paged(app_module, monkeypatch, tmp_path):
+    data_path = str(tmp_path / "blank.ttl")
+    with open(data_path, "w") as f:
+        f.write(BLANK_NODES)
+    build_snapshot(data_path, str(tmp_path / "blank.snapshot"), { "artefact": "blank", "hash": "blank" })
+    snapshot = Snapshot(str(tmp_path / "blank.snapshot"))
+
+    a, b = URIRef("http://example.org/a"), URIRef("http://example.org/b")
+    assert snapshot.stats()["types"] == { str(SKOS.ConceptScheme): 1, str(SKOS.Concept): 2 }
+    assert snapshot.stats()["schemes"] == { "http://example.org/scheme": 2 }
+    assert snapshot.stats()["languages"] == { "en": 2, "fi": 1 }
+    assert snapshot.stats()["labels"] == { "en": 2, "fi": 1 }
+    for subject_type, facets, members in [
+        (SKOS.Concept, (), [a, b]),
+        (SKOS.Concept, ((SKOS.inScheme, URIRef("http://example.org/scheme")),), [a, b]),
+        (None, (("lang", "en"),), [a, b]),
+        (SKOS.Concept, (("lang", "en"),), [a, b]),
+        (None, (("lang", "sv"),), []),
+        (SKOS.Concept, (("lang", "fi"),), [a])
+    ]:
+        assert snapshot.count(subject_type, facets) == len(members), (subject_type, facets)
+        assert len(snapshot._selection(subject_type, facets)) == len(members)
+        assert [snapshot.term(s) for s in snapshot.page(subject_type, 0, 10, facets)] == members
+
+    # The blank nodes are still described with the resources referring to them
+    description = snapshot.describe(snapshot.page(SKOS.Concept, 0, 1))
+    assert description.value(description.value(a, SKOS.related), SKOS.prefLabel) is not None
+
+    get = app_module.snapshot_store.get
+    monkeypatch.setattr(app_module.snapshot_store, "get", lambda artefact_id: snapshot if artefact_id == "blank" else get(artefact_id))
+    for url in ["/artefacts/blank/resources/concepts", "/artefacts/blank/resources?type=skos:Concept&lang=en", "/artefacts/blank/resources?lang=sv"]:
+        graph = parse(app_module.app.test_client().get(url))
+        collection = collection_of(graph)
+        assert int(graph.value(collection, HYDRA.totalItems)) == len(list(graph.objects(collection, HYDRA.member))), url
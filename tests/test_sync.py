@@ -0,0 +1,50 @@
+import threading
+
+import sync_scheduler
+from conftest import ON_DEMAND, SYNCED
+from sync_scheduler import SyncScheduler
+
+
+def test_sync_snapshots_lists_the_vocabularies_with_a_warm_response_cache(app_module, monkeypatch):
+    synced = []
+    monkeypatch.setattr(app_module, "sync_artefact", lambda artefactID, pool=None: synced.append(artefactID) or { "changed": False, "indexed": False })
+    # Cached responses have no raise_for_status
+    app_module.upstream.get("vocabularies/", params={ "lang": "en" })
+
+    runner = app_module.app.test_cli_runner()
+    for _ in range(2):
+        result = runner.invoke(args=["sync-snapshots"])
+        assert result.exit_code == 0, result.output
+    assert synced == sorted([SYNCED, ON_DEMAND]) * 2
+
+
+def test_sync_status_reports_a_running_sync_without_taking_its_lock(tmp_path, monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+
+    def sync(artefact_id):
+        started.set()
+        release.wait()
+        return { "changed": True }
+
+    status_path = str(tmp_path / "sync_status.json")
+    syncing = SyncScheduler(lambda: ["a"], sync, lambda artefact_id: None, 60, 1, status_path)
+    # Another worker process that answers /admin/sync
+    other = SyncScheduler(lambda: ["a"], sync, lambda artefact_id: None, 60, 1, status_path)
+    assert not other.status()["running"]
+
+    thread = threading.Thread(target=syncing.run_once)
+    thread.start()
+    try:
+        assert started.wait(10)
+        monkeypatch.setattr(sync_scheduler.fcntl, "flock", None)
+        assert other.status()["running"]
+        monkeypatch.undo()
+        assert not other.run_once()
+    finally:
+        release.set()
+        thread.join()
+
+    status = other.status()
+    assert not status["running"]
+    assert status["artefacts"]["a"]["changed"]
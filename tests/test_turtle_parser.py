@@ -0,0 +1,135 @@
+import io
+
+import pytest
+from rdflib import Graph
+from rdflib.compare import isomorphic
+
+import turtle_parser
+from snapshot_store import decode_term
+from turtle_parser import TurtleParser, TurtleSyntaxError
+
+BASE = "http://example.org/base/"
+
+DOCUMENTS = {
+    "prefixes": """
+        @prefix ex: <http://example.org/ns#> .
+        @prefix : <http://example.org/default/> .
+        PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
+        prefix dc: <http://purl.org/dc/terms/>
+        ex:a a skos:Concept ; skos:prefLabel "A"@en , "Ä"@fi ; dc:subject :b .
+        :b ex:p ex:c.d , ex:e-f , ex:g_h , ex:123 , ex:with\\/slash , ex: .
+        ex:a ex:p ex:x ; ; ex:q ex:y ; .
+    """,
+    "base": """
+        @base <http://example.org/one/> .
+        <a> <p> <b> , <../up> , <#frag> , <?query> , </root> .
+        BASE <http://example.org/two/sub/>
+        <a> <p> <b> .
+        base <three/>
+        <a> <p> <//other.example.org/x> , <http://absolute.example.org/> .
+    """,
+    "relative without base": """
+        <a> <http://example.org/p> <b> , <#c> .
+    """,
+    "strings": '''
+        @prefix ex: <http://example.org/ns#> .
+        ex:s ex:p "plain" , 'single' , "" , '' ,
+            "quote \\" and backslash \\\\ and \\t tab \\n newline \\r return \\b \\f" ,
+            'it\\'s' ,
+            "\\u00e9\\u00E9 \\U0001F600 ✓" ,
+            "# not a comment" ,
+            "tag"@en-GB , "tag"@EN-gb , "tag"@fi-x-test ,
+            "typed"^^ex:type , "typed"^^<http://example.org/other#type> .
+    ''',
+    "long strings": '''
+        @prefix ex: <http://example.org/ns#> .
+        ex:s ex:p """line one
+line two with "quotes" and ""two"" and 'single'
+\\ttabbed \\u00e9 \\""" escaped""" ,
+            \'\'\'single quoted
+long string with "double" and \'\' quotes\'\'\' ,
+            """""" ,
+            """ends with a quote\\"""" ,
+            """with language"""@en ,
+            """''' + "x" * 1000 + '''""" .
+    ''',
+    "numbers and booleans": """
+        @prefix ex: <http://example.org/ns#> .
+        @prefix xsd: <http://www.w3.org/2001/XMLSchema#> .
+        ex:s ex:p 1 , -2 , +3 , 007 , 0 , -0 , 1.5 , -0.50 , .5 , 0.0 , -0.0 , +1.0 ,
+            1e3 , 1E-3 , -1.5e+10 , .5e2 , 2.e5 , true , false ,
+            "42"^^xsd:integer , "042"^^xsd:integer , "1.10"^^xsd:decimal , "true"^^xsd:boolean ,
+            "1"^^xsd:boolean , "2024-01-01"^^xsd:date , "not a number"^^xsd:integer .
+        ex:s ex:q 5.
+        ex:s ex:r 5 .
+    """,
+    "collections": """
+        @prefix ex: <http://example.org/ns#> .
+        ex:s ex:list ( ex:a "b" 3 ( ex:nested ) [ ex:p ex:o ] ) ;
+            ex:empty ( ) .
+        ( ex:x ex:y ) ex:p ex:o .
+        ex:s ex:one ( ex:only ) .
+    """,
+    "blank nodes": """
+        @prefix ex: <http://example.org/ns#> .
+        _:a ex:p _:b .
+        _:b ex:p _:a , _:c.d .
+        ex:s ex:p [ ex:q [ ex:r "deep" ] ; ex:t ex:u ] , [] .
+        [ ex:p ex:o ] .
+        [ ex:p ex:o ] ex:q ex:r .
+        [] ex:p ex:o .
+        ex:s ex:p [ ex:q ex:r ; ] .
+    """,
+    "comments and white space": """
+        # A comment
+        @prefix ex: <http://example.org/ns#> . # after a directive
+        ex:s   ex:p	ex:o ;# between
+           ex:q "with # inside" ; # trailing
+           ex:r <http://example.org/with#hash> .
+        ex:t ex:p ex:o .ex:u ex:p ex:o.
+    """
+}
+
+CHUNK_SIZES = [turtle_parser.CHUNK_SIZE, 7, 1]
+
+
+def parse(data, monkeypatch, chunk_size):
+    monkeypatch.setattr(turtle_parser, "CHUNK_SIZE", chunk_size)
+    parser = TurtleParser(io.StringIO(data), base=BASE)
+    graph = Graph()
+    for triple in parser.triples():
+        graph.add(tuple(map(decode_term, triple)))
+    return graph, parser.prefixes
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+@pytest.mark.parametrize("name", DOCUMENTS)
+def test_parses_the_same_graph_as_rdflib(monkeypatch, name, chunk_size):
+    expected = Graph(bind_namespaces="none").parse(data=DOCUMENTS[name], format="turtle", publicID=BASE)
+    graph, prefixes = parse(DOCUMENTS[name], monkeypatch, chunk_size)
+
+    assert len(graph) == len(expected)
+    assert isomorphic(graph, expected), sorted(graph ^ expected)
+    for prefix, namespace in prefixes.items():
+        assert str(expected.namespace_manager.store.namespace(prefix)) == namespace
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_blank_node_labels_are_scoped_to_the_document(monkeypatch, chunk_size):
+    data = "_:a <http://example.org/p> _:b .\n"
+    first, _ = parse(data, monkeypatch, chunk_size)
+    second, _ = parse(data, monkeypatch, chunk_size)
+    assert not set(first.all_nodes()) & set(second.all_nodes())
+
+
+@pytest.mark.parametrize("data", [
+    "<http://example.org/s> <http://example.org/p> <http://example.org/o>",
+    "<http://example.org/s> <http://example.org/p> .",
+    "ex:s <http://example.org/p> <http://example.org/o> .",
+    "<http://example.org/s> <http://example.org/p> \"unterminated .",
+    "<http://example.org/s> <http://example.org/p> ( <http://example.org/o> .",
+    "@prefix ex <http://example.org/> ."
+])
+def test_rejects_invalid_documents(monkeypatch, data):
+    with pytest.raises(TurtleSyntaxError):
+        parse(data, monkeypatch, 7)
@@ -0,0 +1,136 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from response_cache import MemoryBackend, ResponseCache
+from upstream import UpstreamClient
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """Answers each request with the next (status, delay, headers) of the script of its path, the last one repeated."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            script = server.scripts.get(self.path.split("?")[0], [(200, 0, {})])
+            status, delay, headers = script.pop(0) if len(script) > 1 else script[0]
+        time.sleep(delay)
+
+        body = json.dumps({ "path": self.path, "attempt": len(server.requests) }).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ScriptedHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = []
+    server.scripts = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def upstream_client(server, retries=2, read_timeout=5):
+    return UpstreamClient("http://127.0.0.1:%d/rest/v1/" % server.server_address[1], 4, 4, 5, read_timeout, retries, 0)
+
+
+def test_successful_requests_are_counted(server):
+    client = upstream_client(server)
+    response = client.get("a/", params={ "lang": "en" })
+
+    assert response.status_code == 200
+    assert response.json()["path"] == "/rest/v1/a/?lang=en"
+    metrics = client.metrics()
+    assert metrics["statuses"] == { 200: 1 }
+    assert metrics["latency"]["GET"]["count"] == 1
+    assert metrics["in_flight"] == 0
+    assert metrics["errors"] == 0
+
+
+def test_unavailable_upstream_is_retried(server):
+    server.scripts["/rest/v1/a/"] = [(503, 0, {}), (502, 0, {}), (200, 0, {})]
+    response = upstream_client(server).get("a/")
+
+    assert response.status_code == 200
+    assert response.json()["attempt"] == 3
+    assert len(server.requests) == 3
+
+
+def test_retries_are_limited(server):
+    server.scripts["/rest/v1/a/"] = [(503, 0, {})]
+    response = upstream_client(server, retries=1).get("a/")
+
+    # The last response is returned rather than raised
+    assert response.status_code == 503
+    assert len(server.requests) == 2
+
+
+def test_not_found_is_not_retried(server):
+    server.scripts["/rest/v1/a/"] = [(404, 0, {}), (200, 0, {})]
+    assert upstream_client(server).get("a/").status_code == 404
+    assert len(server.requests) == 1
+
+
+def test_slow_responses_time_out(server):
+    server.scripts["/rest/v1/a/"] = [(200, 1, {})]
+    client = upstream_client(server, retries=0, read_timeout=0.2)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.get("a/")
+    assert client.metrics()["errors"] == 1
+    assert client.metrics()["in_flight"] == 0
+
+
+def test_head_requests_return_the_redirect(server):
+    server.scripts["/rest/v1/a/data"] = [(302, 0, { "Location": "http://downloads.example.org/a.ttl" })]
+    response = upstream_client(server).head("a/data", params={ "format": "text/turtle" })
+
+    assert response.status_code == 302
+    assert response.headers["Location"] == "http://downloads.example.org/a.ttl"
+
+
+def test_map_runs_calls_in_parallel_in_order(server):
+    for name in "abcd":
+        server.scripts["/rest/v1/" + name + "/"] = [(200, 0.3, {})]
+    client = upstream_client(server)
+
+    start = time.perf_counter()
+    responses = client.map(lambda name: client.get(name + "/"), "abcd")
+    assert time.perf_counter() - start < 1
+    assert [response.json()["path"] for response in responses] == ["/rest/v1/" + name + "/" for name in "abcd"]
+    assert client.metrics()["max_in_flight"] == 4
+
+
+def test_joined_calls_each_receive_their_own_response(server):
+    server.scripts["/rest/v1/a/"] = [(200, 0.3, {})]
+    cache = ResponseCache(upstream_client(server), MemoryBackend(16), [("GET", r"[^/]+/", 60, 0)], 60)
+
+    responses = upstream_client(server).map(lambda _: cache.get("a/", params={ "lang": "en" }), range(4))
+    assert len(server.requests) == 1
+    assert cache.stats()["joined"] == 3
+    assert len(set(map(id, responses))) == 4
+    assert len(set(id(response.headers) for response in responses)) == 4
+    assert all(response.json()["attempt"] == 1 for response in responses)
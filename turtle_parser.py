@@ -0,0 +1,303 @@
+from decimal import Decimal
+import re
+import uuid
+from urllib.parse import urljoin
+
+from rdflib import Literal, URIRef
+from rdflib.namespace import RDF, XSD
+
+
+# Streaming parser of Turtle documents that yields triples of terms encoded
+# as in snapshots: "U" followed by an IRI, "B" followed by a blank node label
+# and "L" followed by the language, NUL, the datatype, NUL and the lexical
+# form of a literal. No rdflib terms are built for IRIs and plain literals,
+# which is where the rdflib Turtle parser spends most of its time. Typed and
+# numeric literals are normalised by rdflib as when they are parsed into a
+# Graph.
+
+CHUNK_SIZE = 1024 * 1024
+# Characters read past a token before it is taken, a longer token could start with it
+LOOKAHEAD = 64
+
+_PREFIX_CHAR = r"[\w\-\u00B7\u0300-\u036F\u203F-\u2040]"
+_LOCAL_CHAR = r"(?:[\w\-:%\u00B7\u0300-\u036F\u203F-\u2040]|\\[_~.\-!$&'()*+,;=/?#@%])"
+_UCHAR = r"\\u[0-9A-Fa-f]{4}|\\U[0-9A-Fa-f]{8}"
+
+# White space runs and comments only end where they cannot go on, so a token that fails to
+# match, as one cut off at the end of the buffer does, is not retried after every split of them
+SPACE = re.compile(r"(?:\s+(?!\s)|#[^\n]*(?![^\n]))*")
+# Tokens with the white space and comments before them
+TOKEN = re.compile(SPACE.pattern + "(?:" + "|".join([
+    r"<(?P<iri>(?:[^<>\"{}|^`\\\x00-\x20]|" + _UCHAR + r")*)>",
+    r"(?P<long_string>\"\"\"(?:(?:\"|\"\")?(?:[^\"\\]|\\.))*\"\"\"|'''(?:(?:'|'')?(?:[^'\\]|\\.))*''')",
+    r"(?P<string>\"(?:[^\"\\\n\r]|\\.)*\"(?!\")|'(?:[^'\\\n\r]|\\.)*'(?!'))",
+    r"(?P<at>@[a-zA-Z]+(?:-[a-zA-Z0-9]+)*)",
+    r"(?P<datatype>\^\^)",
+    r"(?P<number>[+-]?(?:[0-9]+\.[0-9]*[eE][+-]?[0-9]+|\.[0-9]+[eE][+-]?[0-9]+|[0-9]+[eE][+-]?[0-9]+|[0-9]*\.[0-9]+|[0-9]+))",
+    r"_:(?P<blank>" + _PREFIX_CHAR + r"(?:(?:" + _PREFIX_CHAR + r"|\.)*" + _PREFIX_CHAR + r")?)",
+    r"(?P<pname>(?P<prefix>(?:[^\W\d_](?:(?:" + _PREFIX_CHAR + r"|\.)*" + _PREFIX_CHAR + r")?)?):(?P<local>" + _LOCAL_CHAR + r"(?:(?:" + _LOCAL_CHAR + r"|\.)*" + _LOCAL_CHAR + r")?)?)",
+    r"(?P<keyword>(?:true|false|a|[Pp][Rr][Ee][Ff][Ii][Xx]|[Bb][Aa][Ss][Ee])(?![\w:-]))",
+    r"(?P<punctuation>[.;,\[\]()])"
+]) + ")")
+
+ESCAPE = re.compile(r"\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))", re.S)
+ESCAPES = { "t": "\t", "b": "\b", "n": "\n", "r": "\r", "f": "\f", '"': '"', "'": "'", "\\": "\\" }
+ABSOLUTE_IRI = re.compile(r"[A-Za-z][A-Za-z0-9+.-]*:")
+
+NUMBER_TYPES = [
+    (re.compile(r"[+-]?[0-9]+"), XSD.integer, lambda value: str(int(value))),
+    (re.compile(r"[+-]?[0-9]*\.[0-9]+"), XSD.decimal, lambda value: str(Decimal(value)) if str(Decimal(value)) != "-0" else "0"),
+    (None, XSD.double, lambda value: str(float(value)))
+]
+
+RDF_FIRST = "U" + str(RDF.first)
+RDF_REST = "U" + str(RDF.rest)
+RDF_NIL = "U" + str(RDF.nil)
+RDF_TYPE = "U" + str(RDF.type)
+
+
+class TurtleSyntaxError(ValueError):
+    pass
+
+
+class TurtleParser:
+    """Parser of a Turtle document read from a text stream a chunk at a time.
+
+    triples yields the triples of the document statement by statement, and
+    the prefixes the document has declared so far are in prefixes.
+    """
+
+    def __init__(self, stream, base=None):
+        self.stream = stream
+        self.base = base
+        self.prefixes = {}
+        self._buffer = ""
+        self._position = 0
+        self._eof = False
+        self._token = None
+        self._triples = []
+        self._blank_prefix = "n" + uuid.uuid4().hex + "b"
+        self._blank_nodes = {}
+        self._blank_count = 0
+        self._literals = {}
+
+    def triples(self):
+        self._next()
+        while self._token is not None:
+            kind, value = self._token
+            if kind == "at" and value in ("@prefix", "@base"):
+                self._next()
+                self._directive(value[1:])
+                self._expect(".")
+            elif kind == "keyword" and value.lower() in ("prefix", "base"):
+                self._next()
+                self._directive(value.lower())
+            else:
+                self._statement()
+                yield from self._triples
+                self._triples.clear()
+
+    def _directive(self, name):
+        if name == "prefix":
+            kind, value = self._token
+            if kind != "pname" or value[1]:
+                self._error("Expected a prefix")
+            self._next()
+            self.prefixes[value[0]] = self._iri_value()
+        else:
+            self.base = self._iri_value()
+
+    def _statement(self):
+        if self._token == ("punctuation", "["):
+            subject = self._blank_node_property_list()
+            if self._token == ("punctuation", "."):
+                self._next()
+                return
+        else:
+            subject = self._subject()
+        self._predicate_object_list(subject)
+        self._expect(".")
+
+    def _subject(self):
+        kind, value = self._token
+        if kind == "punctuation" and value == "(":
+            return self._collection()
+        if kind not in ("iri", "pname", "blank"):
+            self._error("Expected a subject")
+        return self._term()
+
+    def _predicate_object_list(self, subject):
+        while True:
+            kind, value = self._token or (None, None)
+            if kind == "keyword" and value == "a":
+                self._next()
+                predicate = RDF_TYPE
+            elif kind in ("iri", "pname"):
+                predicate = self._term()
+            else:
+                self._error("Expected a predicate")
+
+            self._triples.append((subject, predicate, self._object()))
+            while self._token == ("punctuation", ","):
+                self._next()
+                self._triples.append((subject, predicate, self._object()))
+
+            if self._token != ("punctuation", ";"):
+                return
+            while self._token == ("punctuation", ";"):
+                self._next()
+            if self._token in (("punctuation", "."), ("punctuation", "]")):
+                return
+
+    def _object(self):
+        kind, value = self._token or (None, None)
+        if kind == "punctuation":
+            if value == "[":
+                return self._blank_node_property_list()
+            if value == "(":
+                return self._collection()
+        if kind in ("iri", "pname", "blank"):
+            return self._term()
+        if kind in ("string", "long_string"):
+            return self._literal()
+        if kind == "number":
+            self._next()
+            for pattern, datatype, canonical in NUMBER_TYPES:
+                if pattern is None or pattern.fullmatch(value):
+                    return self._typed_literal(canonical(value), str(datatype))
+        if kind == "keyword" and value in ("true", "false"):
+            self._next()
+            return self._typed_literal(value, str(XSD.boolean))
+        self._error("Expected an object")
+
+    def _term(self):
+        kind, value = self._token
+        if kind == "iri":
+            term = "U" + self._resolve(value)
+        elif kind == "pname":
+            term = "U" + self._expand(value)
+        else:
+            term = self._blank_nodes.get(value)
+            if term is None:
+                term = self._blank_nodes[value] = self._new_blank_node()
+        self._next()
+        return term
+
+    def _literal(self):
+        kind, value = self._token
+        self._next()
+        lexical = _unescape(value[3:-3] if kind == "long_string" else value[1:-1])
+
+        if self._token and self._token[0] == "at":
+            language = self._token[1][1:]
+            self._next()
+            return "L" + language + "\0\0" + lexical
+        if self._token == ("datatype", "^^"):
+            self._next()
+            kind, value = self._token or (None, None)
+            if kind not in ("iri", "pname"):
+                self._error("Expected a datatype")
+            return self._typed_literal(lexical, self._term()[1:])
+        return "L\0\0" + lexical
+
+    def _typed_literal(self, lexical, datatype):
+        # Typed literals are few and repetitive, their rdflib normalisation is cached
+        key = (lexical, datatype)
+        term = self._literals.get(key)
+        if term is None:
+            if len(self._literals) > 100000:
+                self._literals.clear()
+            term = self._literals[key] = "L\0" + datatype + "\0" + str(Literal(lexical, datatype=URIRef(datatype)))
+        return term
+
+    def _blank_node_property_list(self):
+        self._next()
+        subject = self._new_blank_node()
+        if self._token != ("punctuation", "]"):
+            self._predicate_object_list(subject)
+        self._expect("]")
+        return subject
+
+    def _collection(self):
+        self._next()
+        items = []
+        while self._token != ("punctuation", ")"):
+            if self._token is None:
+                self._error("Unterminated collection")
+            items.append(self._object())
+        self._next()
+
+        head = RDF_NIL
+        for item in reversed(items):
+            node = self._new_blank_node()
+            self._triples.append((node, RDF_FIRST, item))
+            self._triples.append((node, RDF_REST, head))
+            head = node
+        return head
+
+    def _new_blank_node(self):
+        self._blank_count += 1
+        return "B" + self._blank_prefix + str(self._blank_count)
+
+    def _iri_value(self):
+        kind, value = self._token or (None, None)
+        if kind != "iri":
+            self._error("Expected an IRI")
+        self._next()
+        return self._resolve(value)
+
+    def _resolve(self, iri):
+        if "\\" in iri:
+            iri = _unescape(iri)
+        if self.base and not ABSOLUTE_IRI.match(iri):
+            return urljoin(self.base, iri)
+        return iri
+
+    def _expand(self, value):
+        prefix, local = value
+        if prefix not in self.prefixes:
+            self._error("Undeclared prefix " + prefix)
+        if "\\" in local:
+            local = re.sub(r"\\(.)", r"\1", local)
+        return self.prefixes[prefix] + local
+
+    def _expect(self, punctuation):
+        if self._token != ("punctuation", punctuation):
+            self._error("Expected " + punctuation)
+        self._next()
+
+    def _next(self):
+        while True:
+            match = TOKEN.match(self._buffer, self._position)
+            if (match is None or len(self._buffer) - match.end() < LOOKAHEAD) and not self._eof:
+                self._read()
+                continue
+            if match is None:
+                if SPACE.match(self._buffer, self._position).end() < len(self._buffer):
+                    self._error("Unexpected input")
+                self._token = None
+                return
+
+            self._position = match.end()
+            kind = match.lastgroup
+            if kind == "pname":
+                self._token = (kind, (match.group("prefix"), match.group("local") or ""))
+            else:
+                self._token = (kind, match.group(kind))
+            return
+
+    def _read(self):
+        chunk = self.stream.read(CHUNK_SIZE)
+        if not chunk:
+            self._eof = True
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+
+    def _error(self, message):
+        raise TurtleSyntaxError(message + " at " + repr(self._buffer[self._position:self._position + 40]))
+
+
+def _unescape(value):
+    if "\\" not in value:
+        return value
+    return ESCAPE.sub(lambda m: chr(int(m.group(1) or m.group(2), 16)) if m.group(3) is None else ESCAPES.get(m.group(3), m.group(3)), value)
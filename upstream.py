@@ -0,0 +1,123 @@
+from concurrent.futures import ThreadPoolExecutor
+import bisect
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class UpstreamClient:
+    """HTTP client for the SKOSMOS REST API shared by all routes.
+
+    Requests go through a keep-alive connection pool with timeouts and retries
+    with exponential backoff. `map` fans calls out to a bounded thread pool so
+    that independent upstream calls of a request run in parallel.
+    """
+
+    def __init__(self, base_url, pool_size, concurrency, connect_timeout, read_timeout, retries, backoff):
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=("GET", "HEAD"),
+            raise_on_status=False,
+            respect_retry_after_header=True
+        )
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="upstream")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._max_in_flight = 0
+        self._errors = 0
+        self._statuses = {}
+        self._latency = {}
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def close(self):
+        """Close the pooled connections, new connections are opened on the next request."""
+        self.session.close()
+
+    def head(self, path, **kwargs):
+        return self.request("HEAD", path, **kwargs)
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        if method == "HEAD":
+            # Distribution download URLs are read from the redirect itself
+            kwargs.setdefault("allow_redirects", False)
+
+        with self._lock:
+            self._in_flight += 1
+            self._max_in_flight = max(self._max_in_flight, self._in_flight)
+
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._in_flight -= 1
+                self._observe(method, elapsed)
+
+        with self._lock:
+            self._statuses[response.status_code] = self._statuses.get(response.status_code, 0) + 1
+
+        return response
+
+    def map(self, fn, items):
+        """Call fn for every item with bounded concurrency and return the results in order."""
+        items = list(items)
+        if len(items) < 2:
+            return [fn(item) for item in items]
+        return list(self._executor.map(fn, items))
+
+    def metrics(self):
+        pools = self._connection_pools()
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "max_in_flight": self._max_in_flight,
+                "errors": self._errors,
+                "statuses": dict(self._statuses),
+                "latency": {method: dict(h, buckets=list(h["buckets"])) for method, h in self._latency.items()},
+                "latency_buckets": LATENCY_BUCKETS,
+                "pool": {
+                    "pools": len(pools),
+                    "maxsize": self.pool_size,
+                    "connections_opened": sum(p.num_connections for p in pools),
+                    "requests": sum(p.num_requests for p in pools),
+                    "free_slots": sum(p.pool.qsize() for p in pools if p.pool is not None)
+                }
+            }
+
+    def _connection_pools(self):
+        pools = self.adapter.poolmanager.pools
+        return [pool for pool in (pools.get(key) for key in pools.keys()) if pool is not None]
+
+    def _observe(self, method, elapsed):
+        histogram = self._latency.setdefault(method, { "count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(LATENCY_BUCKETS) })
+        histogram["count"] += 1
+        histogram["sum"] += elapsed
+        histogram["max"] = max(histogram["max"], elapsed)
+        i = bisect.bisect_left(LATENCY_BUCKETS, elapsed)
+        if i < len(LATENCY_BUCKETS):
+            histogram["buckets"][i] += 1